@@ -1,37 +1,300 @@
-from flask import Flask, render_template, request
+from flask import (
+    Flask,
+    Response,
+    g,
+    render_template,
+    request,
+    jsonify,
+    make_response,
+    stream_with_context,
+    url_for,
+)
 import os
-from image_recognizer import ImageRecognizer
-from video_object_detector import VideoObjectDetector
-from moviepy.editor import VideoFileClip
+import io
+import json
+import base64
+import binascii
+import tempfile
+import time
+import uuid
+import cProfile
+import threading
+from werkzeug.utils import secure_filename
+from model_registry import MODEL_REGISTRY
+from work_directories import (
+    create_work_dir,
+    publish_work_dir,
+    Janitor,
+)
+from job_queue import JobQueue, DONE, FAILED
+from result_cache import ResultCache, content_hash
+from metrics import METRICS
+from video_results import get_output_file_names
 
 
 
 # Creating a Flask application instance
 app = Flask(__name__)
 
+# Paths to the image prediction and video object detection models
+IMAGE_MODELS_PATH = os.path.join(
+    os.path.join(os.getcwd(), "models"), "image-prediction-models"
+)
+VIDEO_MODELS_PATH = os.path.join(
+    os.path.join(os.getcwd(), "models"), "video-object-detection-models"
+)
+
+# Path to the `files` folder containing one work directory per request
+FILES_PATH = os.path.join(os.path.join(os.getcwd(), "static"), "files")
+
+# Extensions of the image files accepted for prediction
+IMAGE_EXTENSIONS = ["jpg", "jpeg", "png"]
+
+# Number of images classified in each forward pass (0 to classify images ...
+# ...one at a time)
+IMAGE_BATCH_SIZE = int(os.environ.get("IMAGEAI_BATCH_SIZE", 16))
+
+# Maximum number of pixels of an uploaded image, larger images being ...
+# ...rejected as decompression bombs before they are decoded
+MAX_IMAGE_PIXELS = int(
+    os.environ.get("IMAGEAI_MAX_IMAGE_PIXELS", 64 * 1000 * 1000)
+)
+
+# Images of concurrent requests are classified together in batches of up ...
+# ...to IMAGEAI_MICRO_BATCH_SIZE images, flushed after at most ...
+# ...IMAGEAI_MICRO_BATCH_WAIT_MS milliseconds (0 to disable)
+MICRO_BATCH_SIZE = int(os.environ.get("IMAGEAI_MICRO_BATCH_SIZE", 32))
+MICRO_BATCH = {
+    "max_batch_size": MICRO_BATCH_SIZE,
+    "max_wait": float(os.environ.get("IMAGEAI_MICRO_BATCH_WAIT_MS", 5))
+    / 1000,
+} if MICRO_BATCH_SIZE else None
+
+# Image format of the summary bar charts ("png" or "svg")
+CHART_FORMAT = os.environ.get("IMAGEAI_CHART_FORMAT", "png")
+
+# Format of the animated preview of the output video ("gif", "webp" or ...
+# ..."mp4") and the options of its frames
+PREVIEW_FORMAT = os.environ.get("IMAGEAI_PREVIEW_FORMAT", "gif")
+PREVIEW_OPTIONS = {
+    "frame_skip": int(os.environ.get("IMAGEAI_PREVIEW_FRAME_SKIP", 2)),
+    "scale": float(os.environ.get("IMAGEAI_PREVIEW_SCALE", 0.5)),
+    "max_duration": float(
+        os.environ.get("IMAGEAI_PREVIEW_MAX_SECONDS", 30)
+    ),
+}
+
+# Frames on which the detector is run ("all", "stride", "fps" or ...
+# ..."adaptive") and the options of the sampling mode
+SAMPLING_MODE = os.environ.get("IMAGEAI_SAMPLING_MODE", "all")
+SAMPLING_OPTIONS = {
+    "stride": int(os.environ.get("IMAGEAI_SAMPLING_STRIDE", 5)),
+    "analysis_fps": float(os.environ.get("IMAGEAI_ANALYSIS_FPS", 5)),
+    "difference_threshold": float(
+        os.environ.get("IMAGEAI_DIFFERENCE_THRESHOLD", 8.0)
+    ),
+}
+
+# Number of worker processes detecting segments of each video in parallel
+DETECTION_WORKERS = int(os.environ.get("IMAGEAI_DETECTION_WORKERS", 1))
+
+# Detection loop of single-worker jobs ("imageai" or "pipelined") and the ...
+# ...options of the pipelined engine
+VIDEO_ENGINE = os.environ.get("IMAGEAI_VIDEO_ENGINE", "imageai")
+PIPELINE_OPTIONS = {
+    "batch_size": int(os.environ.get("IMAGEAI_PIPELINE_BATCH_SIZE", 4)),
+    "queue_size": int(os.environ.get("IMAGEAI_PIPELINE_QUEUE_SIZE", 16)),
+}
+
+# Number of frames between two checkpoints of the objects detected in a ...
+# ...video, from which a job whose worker died resumes (0 to disable)
+CHECKPOINT_FRAMES = int(os.environ.get("IMAGEAI_CHECKPOINT_FRAMES", 500))
+
+# Tracking of the detected objects across frames, counting unique objects ...
+# ...and their dwell times, and the options of the tracker
+TRACKING = os.environ.get("IMAGEAI_TRACKING", "0") == "1"
+TRACKING_OPTIONS = {
+    "iou_threshold": float(os.environ.get("IMAGEAI_TRACKING_IOU", 0.3)),
+    "max_misses": int(os.environ.get("IMAGEAI_TRACKING_MAX_MISSES", 2)),
+    "min_hits": int(os.environ.get("IMAGEAI_TRACKING_MIN_HITS", 2)),
+}
+
+# Inference engine of the models ("torch", "torchscript" or ...
+# ..."onnxruntime"), int8 quantization of the ONNX models ("dynamic", ...
+# ..."static" or none) and numbers of threads of the engine
+INTRA_OP_THREADS = os.environ.get("IMAGEAI_INTRA_OP_THREADS")
+INTER_OP_THREADS = os.environ.get("IMAGEAI_INTER_OP_THREADS")
+BACKEND_OPTIONS = {
+    "backend": os.environ.get("IMAGEAI_INFERENCE_BACKEND", "torch"),
+    "quantization": os.environ.get("IMAGEAI_QUANTIZATION") or None,
+    "intra_op_threads": int(INTRA_OP_THREADS) if INTRA_OP_THREADS else None,
+    "inter_op_threads": int(INTER_OP_THREADS) if INTER_OP_THREADS else None,
+}
+
+# Path to the SQLite database storing the video object detection jobs
+JOBS_DB_PATH = os.path.join(os.getcwd(), "jobs.db")
+
+# Number of worker processes running video object detection jobs
+VIDEO_WORKERS = int(os.environ.get("IMAGEAI_VIDEO_WORKERS", 1))
+
+# Path to the on-disk tier of the result cache
+CACHE_PATH = os.path.join(os.getcwd(), "cache")
+
+# Path to the folder in which the job workers save their metrics
+METRICS_PATH = os.path.join(os.getcwd(), "metrics")
+
+# Path to the folder in which cProfile dumps of the requests made with ...
+# ...`?profile=1` are saved (profiling is disabled if not set)
+PROFILE_PATH = os.environ.get("IMAGEAI_PROFILE_PATH")
+
+METRICS.describe(
+    "imageai_request_seconds", "Duration of the HTTP requests by endpoint."
+)
+METRICS.describe(
+    "imageai_requests_in_progress", "Number of HTTP requests being served."
+)
+METRICS.describe(
+    "imageai_requests_total", "Number of HTTP requests by endpoint and status."
+)
+
+# Cache of image prediction and video object detection results
+result_cache = ResultCache(
+    CACHE_PATH,
+    max_memory_entries=int(os.environ.get("IMAGEAI_CACHE_ENTRIES", 256)),
+)
+
+# Queue of video object detection jobs, created on first use
+job_queue = None
+job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Function to get the queue of video object detection jobs, creating
+    it and its worker processes on first use.
+    """
+    global job_queue
+    with job_queue_lock:
+        if job_queue is None:
+            job_queue = JobQueue(
+                JOBS_DB_PATH, max_workers=VIDEO_WORKERS,
+                metrics_path=METRICS_PATH,
+            )
+    return job_queue
 
-def intialize_files_folder():
-    """Function to initialize the files folder for storing uploaded files and
-    output files.
-    It checks if the folder exists,  and if not, creates it. It also deletes
-    any existing files inside the folder. Returns the path to the folder.
+
+def configure_model_registry():
+    """Function to configure the shared model registry from environment
+    variables.
+    - IMAGEAI_MAX_MODELS: The maximum number of models kept in memory.
+    - IMAGEAI_MODEL_MEMORY_MB: The memory budget for loaded models in MB.
+    - IMAGEAI_WARMUP_MODELS: A comma-separated list of algorithms/models to
+    load at startup, e.g. "ResNet50,TinyYOLOv3".
+    """
+    max_models = os.environ.get("IMAGEAI_MAX_MODELS")
+    memory_budget = os.environ.get("IMAGEAI_MODEL_MEMORY_MB")
+    MODEL_REGISTRY.configure(
+        max_models=int(max_models) if max_models else None,
+        memory_budget=(
+            int(float(memory_budget) * 1024 * 1024) if memory_budget else None
+        ),
+    )
+
+    warmup_models = os.environ.get("IMAGEAI_WARMUP_MODELS", "")
+    warm_up_models([name.strip() for name in warmup_models.split(",")
+                    if name.strip()])
+
+
+def warm_up_models(model_names):
+    """Function to load the given models into the model registry ahead of
+    the first request.
+    Args:
+    - model_names: A list of algorithm names from ImageRecognizer.MODELS
+    and/or model names from VideoObjectDetector.MODELS.
     """
-    # Create the './static/files/' folder if it doesn't exist
-    if not os.path.exists("./static/files/"):
-        os.mkdir("./static/files")
+    if not model_names:
+        return
+    from image_recognizer import ImageRecognizer
+    from video_object_detector import VideoObjectDetector
+
+    for model_name in model_names:
+        if model_name in ImageRecognizer.MODELS:
+            ImageRecognizer.load_model(
+                IMAGE_MODELS_PATH, model_name, BACKEND_OPTIONS
+            )
+        elif model_name in VideoObjectDetector.MODELS:
+            VideoObjectDetector.load_model(
+                VIDEO_MODELS_PATH, model_name, BACKEND_OPTIONS
+            )
+        else:
+            raise ValueError("Unknown model: {}".format(model_name))
 
-    # Path to the `files` folder
-    path = os.path.join(os.path.join(os.getcwd(), "static"), "files")
-    # Get the list of the names of the files inside the folder
-    files = os.listdir(path)
 
-    # Delete any existing files inside the folder
-    if files:
-        for file in files:
-            os.remove(os.path.join(path, file))
+@app.before_request
+def start_request():
+    """Function run before each request to count the requests in progress
+    and start the profiler of the request if `?profile=1` is given and
+    profiling is enabled.
+    """
+    g.request_start = time.perf_counter()
+    METRICS.add("imageai_requests_in_progress", 1)
 
-    # Return the path to the `files` folder
-    return path
+    g.profiler = None
+    if PROFILE_PATH and request.args.get("profile") == "1":
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.after_request
+def finish_request(response):
+    """Function run after each successful request to count the responses
+    and save the profile of the request.
+    """
+    METRICS.inc(
+        "imageai_requests_total",
+        endpoint=request.endpoint or "unknown",
+        status=response.status_code,
+    )
+
+    if g.get("profiler") is not None:
+        g.profiler.disable()
+        os.makedirs(PROFILE_PATH, exist_ok=True)
+        profile_name = "{}-{}-{}.prof".format(
+            time.strftime("%Y%m%d-%H%M%S"),
+            request.endpoint or "unknown",
+            uuid.uuid4().hex[:8],
+        )
+        g.profiler.dump_stats(os.path.join(PROFILE_PATH, profile_name))
+        g.profiler = None
+        response.headers["X-Profile-File"] = profile_name
+    return response
+
+
+@app.teardown_request
+def end_request(error=None):
+    """Function run at the end of each request, even a failed one, to record
+    its duration.
+    """
+    if "request_start" not in g:
+        return
+    METRICS.add("imageai_requests_in_progress", -1)
+    METRICS.observe(
+        "imageai_request_seconds",
+        time.perf_counter() - g.request_start,
+        endpoint=request.endpoint or "unknown",
+    )
+    if g.get("profiler") is not None:
+        g.profiler.disable()
+
+
+def preload_modules():
+    """Function to import the modules of image prediction and video object
+    detection, with ImageAI, torch, pandas and matplotlib, ahead of the
+    first request. Under a pre-forking server such as `gunicorn --preload`,
+    this runs once in the master process and the workers share the
+    imported modules copy-on-write.
+    """
+    import image_recognizer
+    import video_object_detector
 
 
 # Home page
@@ -48,49 +311,120 @@ def home():
 def predict_images():
     """Route for image prediction.
     Accepts both GET and POST requests.
-    If a POST request is received with image files, it saves the uploaded
-    images to the `files` folder. It then initializes the ImageRecognizer
-    with the selected algorithm and predicts the objects on images. Finally,
-    it renders the image-prediction.html template with the predictions and
-    selected algorithm.
+    If a POST request is received with image files, it initializes the
+    ImageRecognizer with the selected algorithm and predicts the objects on
+    the images decoded directly from the request. It then saves the uploaded
+    images to a new work directory in the `files` folder for display.
+    Finally, it renders the image-prediction.html template with the
+    predictions and selected algorithm.
     """
     if request.method == "POST":
         # If a POST request is received with image files
         if request.files["images"]:
-            # Initialize the `files` folder for images
-            images_path = intialize_files_folder()
-
-            # Get the list of uploaded image objects
-            uploaded_images = request.files.getlist("images")
-            for uploaded_image in uploaded_images:
-                # Save each image to the `files` folder
-                uploaded_image.save(
-                    os.path.join(images_path, uploaded_image.filename)
+            # Get the list of uploaded image objects with supported extensions
+            uploaded_images = [
+                uploaded_image
+                for uploaded_image in request.files.getlist("images")
+                if uploaded_image.filename.split(".")[-1].lower()
+                in IMAGE_EXTENSIONS
+            ]
+            image_names = []
+            for i, uploaded_image in enumerate(uploaded_images):
+                # Names made only of non-ASCII characters are empty once ...
+                # ...secured
+                image_name = secure_filename(uploaded_image.filename) or str(i)
+                # Prefix the names of images uploaded with the same name ...
+                # ...with their index, so that they don't overwrite each other
+                while image_name in image_names:
+                    image_name = str(i) + "_" + image_name
+                image_names.append(image_name)
+            # Read each uploaded image into memory once
+            with METRICS.timer("upload_read"):
+                image_bytes = [
+                    uploaded_image.read()
+                    for uploaded_image in uploaded_images
+                ]
+
+            # Get the selected algorithms, several of them being compared ...
+            # ...side by side on the same images
+            selected_algos = request.form.getlist("algorithm")
+            if not selected_algos:
+                return render_template(
+                    "image-prediction.html", error="No algorithm selected"
+                ), 400
+            selected_algo = selected_algos[0]
+            ensemble = request.form.get("ensemble") is not None
+
+            # Import ImageAI and torch on the first prediction only
+            from image_recognizer import ImageRecognizer
+            from ensemble_recognizer import EnsembleRecognizer
+
+            if len(selected_algos) > 1:
+                # Create an instance of EnsembleRecognizer
+                recognizer = EnsembleRecognizer(
+                    IMAGE_MODELS_PATH, selected_algos,
+                    max_pixels=MAX_IMAGE_PIXELS,
+                    backend_options=BACKEND_OPTIONS,
                 )
-
-            # Get the selected algorithm
-            selected_algo = request.form["algorithm"]
-
-            # Path to the image prediction models
-            execution_path = os.path.join(
-                os.path.join(os.getcwd(), "models"), "image-prediction-models"
-            )
-            # Create an instance of ImageRecognizer
-            recognizer = ImageRecognizer(execution_path, selected_algo)
-
-            # Predict the objects on images
-            predictions = recognizer.predict(
-                images_path=images_path,
-                image_extensions=["jpg", "jpeg", "png"],
-                n=5,
-            )
+                timer_labels = {"algorithm": ",".join(selected_algos)}
+                options = {"ensemble": ensemble}
+            else:
+                # Create an instance of ImageRecognizer
+                recognizer = ImageRecognizer(
+                    IMAGE_MODELS_PATH, selected_algo,
+                    max_pixels=MAX_IMAGE_PIXELS,
+                    backend_options=BACKEND_OPTIONS,
+                )
+                timer_labels = {"algorithm": selected_algo}
+                options = {}
+
+            # Predict the objects on images decoded directly from the ...
+            # ...uploaded bytes
+            try:
+                with METRICS.timer("predict", **timer_labels):
+                    predictions = recognizer.predict_streams(
+                        [io.BytesIO(data) for data in image_bytes],
+                        image_names=image_names,
+                        n=5,
+                        batch_size=IMAGE_BATCH_SIZE,
+                        cache=result_cache,
+                        micro_batch=MICRO_BATCH,
+                        **options
+                    )
+            except (ValueError, OSError) as error:
+                # Renders the image-prediction.html template with the ...
+                # ...error if an image is too large or can't be decoded
+                return render_template(
+                    "image-prediction.html", error=str(error)
+                ), 400
+
+            # Save the images to a new work directory only because the ...
+            # ...template displays them
+            with METRICS.timer("upload_save"):
+                work_id, images_path = create_work_dir(FILES_PATH)
+                for image_name, data in zip(image_names, image_bytes):
+                    with open(
+                        os.path.join(images_path, image_name), "wb"
+                    ) as f:
+                        f.write(data)
+            # Make the work directory available to the template
+            publish_work_dir(images_path)
 
             # Renders the image-prediction.html template with the ...
             # ...predictions and selected algorithm
+            if len(selected_algos) > 1:
+                return render_template(
+                    "image-prediction.html",
+                    comparisons=predictions,
+                    algos=selected_algos,
+                    ensemble=ensemble,
+                    files_dir=work_id,
+                )
             return render_template(
                 "image-prediction.html",
                 predictions=predictions,
                 algo=selected_algo,
+                files_dir=work_id,
             )
 
     # Render the image-prediction.html template if the request method is GET
@@ -103,110 +437,125 @@ def detect_objects_in_video():
     """Route for video object detection.
     Accepts both GET and POST requests.
     If a POST request is received with a video file, it saves the video to
-    the files folder. It then initializes the VideoObjectDetector with the
-    selected model and performs object detection on the video. Finally, it
-    renders the video-object-detection.html template with the video file name
-    and GIF image name of the output video, and CSV file name of object
-    detection data by frames.
+    a new work directory in the files folder and adds a job to the job queue
+    to perform object detection on the video with the selected model. It
+    then immediately renders the video-object-detection.html template with
+    the job ID, which the page uses to poll the job status.
+    If a GET request is received with the `job_id` of a finished job, it
+    renders the video-object-detection.html template with the video file
+    name and animated preview name of the output video, CSV file name of
+    object detection data by frames and summary bar charts.
     """
     if request.method == "POST":
         if request.files["video"]:
-            # Initialize the `files` folder for videos
-            videos_path = intialize_files_folder()
+            # Create a new work directory for the video and output files
+            work_id, videos_path = create_work_dir(FILES_PATH)
 
             # Get the uploaded video object
             uploaded_video = request.files["video"]
             # Get the filename of the uploaded video
-            input_video_name = uploaded_video.filename
-            # Save the video to the `files` folder
-            uploaded_video.save(os.path.join(videos_path, input_video_name))
+            input_video_name = secure_filename(uploaded_video.filename)
+            # Save the video to the work directory
+            with METRICS.timer("upload_save"):
+                uploaded_video.save(
+                    os.path.join(videos_path, input_video_name)
+                )
 
             # Get the selected model
             selected_model = request.form["model"]
-            # Path to the video object detection models
-            execution_path = os.path.join(
-                os.path.join(os.getcwd(), "models"),
-                "video-object-detection-models",
-            )
             # Set the frames per second for video processing
             frames_per_second = 20
-
-            # Create an instance of VideoObjectDetector
-            object_detector = VideoObjectDetector(
-                execution_path,
-                selected_model,
-                frames_per_second,
-                videos_path,
-                input_video_name,
-            )
-            # Save the detected object data by frames as a CSV file
-            csv_path = object_detector.save_csv()
-            # Plot summary bar charts
-            object_detector.plot_summaries()
-
-            # Generate a GIF image of the output video
-            output_video_clip = VideoFileClip(
-                os.path.join(
-                    videos_path,
-                    input_video_name.split(".")[0]
-                    + "_detected."
-                    + input_video_name.split(".")[-1],
+            # Set the minimum probability of the detected objects
+            minimum_percentage_probability = 30
+
+            # Get the cached results if the same video was already ...
+            # ...processed with the same parameters
+            with open(os.path.join(videos_path, input_video_name), "rb") as f:
+                cache_key = result_cache.make_key(
+                    content_hash(f),
+                    selected_model,
+                    frames_per_second,
+                    minimum_percentage_probability,
+                    CHART_FORMAT,
+                    PREVIEW_FORMAT,
+                    PREVIEW_OPTIONS,
+                    SAMPLING_MODE,
+                    SAMPLING_OPTIONS,
+                    BACKEND_OPTIONS["backend"],
+                    BACKEND_OPTIONS["quantization"],
+                    TRACKING_OPTIONS if TRACKING else None,
                 )
-            )
-            output_video_clip.write_gif(
-                os.path.join(
-                    videos_path,
-                    input_video_name.split(".")[0] + "_detected.gif",
-                )
-            )
-
-            # Check if the summary bar chart 'Average Number of Unique ...
-            # ...Objects Per Second' exists and assign its path, otherwise ...
-            # ...assign None
-            if os.path.exists(
-                os.path.join(videos_path, "summary_plot_second.png")
+            results = result_cache.get(cache_key)
+            if results is not None and result_cache.copy_files(
+                cache_key, get_output_file_names(results), videos_path
             ):
-                second_plot = "summary_plot_second.png"
-            else:
-                second_plot = None
+                # Make the output files available to the template
+                publish_work_dir(videos_path)
+
+                # Renders the video-object-detection.html template with ...
+                # ...the video details and CSV file name
+                results = dict(results, video_name=input_video_name)
+                return render_template(
+                    "video-object-detection.html",
+                    files_dir=work_id,
+                    **results,
+                )
 
-            # Check if the summary bar chart 'Average Number of Unique ...
-            # ...Objects Per Minute' exists and assign its path, otherwise ...
-            # ...assign None
-            if os.path.exists(
-                os.path.join(videos_path, "summary_plot_minute.png")
-            ):
-                minute_plot = "summary_plot_minute.png"
-            else:
-                minute_plot = None
+            # Add a job performing object detection, saving the CSV data, ...
+            # ...plotting the summary bar charts and generating the ...
+            # ...animated preview of the output video
+            job_id = get_job_queue().submit(
+                "video_object_detector:process_video",
+                {
+                    "execution_path": VIDEO_MODELS_PATH,
+                    "model": selected_model,
+                    "frames_per_second": frames_per_second,
+                    "videos_path": videos_path,
+                    "input_video_name": input_video_name,
+                    "minimum_percentage_probability": (
+                        minimum_percentage_probability
+                    ),
+                    "chart_format": CHART_FORMAT,
+                    "cache_path": CACHE_PATH,
+                    "cache_key": cache_key,
+                    "preview_format": PREVIEW_FORMAT,
+                    "preview_options": PREVIEW_OPTIONS,
+                    "sampling_mode": SAMPLING_MODE,
+                    "sampling_options": SAMPLING_OPTIONS,
+                    "workers": DETECTION_WORKERS,
+                    "engine": VIDEO_ENGINE,
+                    "pipeline_options": PIPELINE_OPTIONS,
+                    "backend_options": BACKEND_OPTIONS,
+                    "checkpoint_interval": CHECKPOINT_FRAMES or None,
+                    "tracking": TRACKING,
+                    "tracking_options": TRACKING_OPTIONS,
+                },
+                work_path=videos_path,
+            )
 
-            # Check if the summary bar chart 'Average Number of Unique ...
-            # ...Objects Per Hour' exists and assign its path, otherwise ...
-            # ...assign None
-            if os.path.exists(
-                os.path.join(videos_path, "summary_plot_hour.png")
-            ):
-                hour_plot = "summary_plot_hour.png"
-            else:
-                hour_plot = None
+            # Renders the video-object-detection.html template with the ...
+            # ...job ID
+            return render_template(
+                "video-object-detection.html", job_id=job_id
+            )
 
+    # If a GET request is received with the ID of a job
+    job_id = request.args.get("job_id")
+    if job_id:
+        job = get_job_queue().get(job_id)
+        if job is not None and job["status"] == DONE:
             # Renders the video-object-detection.html template with the ...
             # ...video details and CSV file name
             return render_template(
                 "video-object-detection.html",
-                video_name=input_video_name,
-                output_video_name=(
-                    input_video_name.split(".")[0]
-                    + "_detected."
-                    + input_video_name.split(".")[-1]
-                ),
-                output_video_gif=(
-                    input_video_name.split(".")[0] + "_detected.gif"
-                ),
-                csv_file_name=os.path.basename(csv_path),
-                second_plot=second_plot,
-                minute_plot=minute_plot,
-                hour_plot=hour_plot,
+                files_dir=job["work_id"],
+                **job["result"],
+            )
+        if job is not None:
+            # Renders the video-object-detection.html template with the ...
+            # ...job ID to keep polling the job status
+            return render_template(
+                "video-object-detection.html", job_id=job_id
             )
 
     # Renders the video-object-detection.html template if the request ...
@@ -214,7 +563,438 @@ def detect_objects_in_video():
     return render_template("video-object-detection.html")
 
 
+# Job status
+@app.route("/jobs/<job_id>")
+def get_job_status(job_id):
+    """Route for the status of a video object detection job.
+    Returns the job's status and progress percentage as JSON.
+    """
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify(
+        {
+            "id": job["id"],
+            "status": job["status"],
+            "progress": job["progress"],
+        }
+    )
+
+
+# Job result
+@app.route("/jobs/<job_id>/result")
+def get_job_result(job_id):
+    """Route for the result of a video object detection job.
+    Returns the URLs of the output files and the summary of the detected
+    objects as JSON once the job is done.
+    """
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == FAILED:
+        return jsonify({"status": FAILED, "error": job["error"]}), 500
+    if job["status"] != DONE:
+        return jsonify(
+            {"status": job["status"], "progress": job["progress"]}
+        ), 202
+
+    # Get the URL of each output file of the job
+    files = {}
+    for key, file_name in job["result"].items():
+        if file_name in get_output_file_names(job["result"]):
+            files[key] = url_for(
+                "static",
+                filename="files/" + job["work_id"] + "/" + file_name,
+            )
+
+    # Get the summary of the detected objects
+    summary_path = os.path.join(
+        FILES_PATH, job["work_id"], job["result"]["summary_file_name"]
+    )
+    with open(summary_path) as f:
+        summary = json.load(f)
+
+    return jsonify(
+        {
+            "status": DONE,
+            "video_name": job["result"]["video_name"],
+            "files": files,
+            "summary": summary,
+        }
+    )
+
+
+def read_api_request(field):
+    """Function to read the parameters and the files of a field of an API
+    request, uploaded as multipart form data or given in a JSON body as a
+    list of base64 strings or {"name": ..., "data": ...} objects.
+    Args:
+    - field: The name of the field of the files, e.g. "images".
+    Returns:
+    - params: A dictionary of the parameters of the request.
+    - files: A list of (file name, bytes) tuples.
+    Raises:
+    - ValueError: If a file is not valid base64.
+    """
+    if not request.is_json:
+        return request.form.to_dict(), [
+            (secure_filename(uploaded_file.filename) or str(i),
+             uploaded_file.read())
+            for i, uploaded_file in enumerate(request.files.getlist(field))
+        ]
+
+    params = request.get_json(silent=True)
+    if not isinstance(params, dict):
+        raise ValueError("The JSON body must be an object")
+    items = params.get(field) or []
+    if not isinstance(items, list):
+        items = [items]
+
+    files = []
+    for i, item in enumerate(items):
+        name, data = (
+            (item.get("name"), item.get("data")) if isinstance(item, dict)
+            else (None, item)
+        )
+        if not isinstance(data, str):
+            raise ValueError("Each file must be a base64 string")
+        # Accept data URLs, e.g. "data:image/png;base64,..."
+        if data.startswith("data:"):
+            data = data.split(",", 1)[-1]
+        try:
+            data = base64.b64decode(data, validate=True)
+        except binascii.Error:
+            raise ValueError("File {} is not valid base64".format(i))
+        files.append((secure_filename(name or "") or str(i), data))
+    return params, files
+
+
+def wants_stream(params):
+    """Function to check whether the results of an API request are streamed
+    as NDJSON, with `stream=1` or an `Accept: application/x-ndjson` header.
+    Args:
+    - params: A dictionary of the parameters of the request.
+    Returns:
+    - stream: True if the results are streamed.
+    """
+    stream = params.get("stream", request.args.get("stream"))
+    if stream is not None:
+        return str(stream).lower() in ["1", "true"]
+    return request.accept_mimetypes.best_match(
+        ["application/json", "application/x-ndjson"]
+    ) == "application/x-ndjson"
+
+
+def api_response(results, key, stream, **fields):
+    """Function to build the response of an API request.
+    Args:
+    - results: An iterator of the results, one per image or frame.
+    - key: The key of the list of results in the JSON response.
+    - stream: If True, each result is sent as a line of NDJSON as soon as
+    it is ready. Otherwise, the results are sent in one JSON object.
+    - fields: Other fields of the JSON response.
+    Returns:
+    - response: The Flask response.
+    """
+    if stream:
+        def generate():
+            try:
+                for result in results:
+                    yield json.dumps(result) + "\n"
+            except (ValueError, OSError) as error:
+                # The status is already sent, so report the error in ...
+                # ...the last line
+                yield json.dumps({"error": str(error)}) + "\n"
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
+    try:
+        fields[key] = list(results)
+    except (ValueError, OSError) as error:
+        return jsonify({"error": str(error)}), 400
+    return jsonify(fields)
+
+
+# Image classification API
+@app.route("/api/v1/classify", methods=["POST"])
+def classify_images_api():
+    """Route for image prediction returning JSON instead of a page.
+    Accepts the images as multipart form data (`images` files) or as base64
+    strings in a JSON body, with the `algorithm` (ResNet50 by default) and
+    the number `n` of predictions per image (5 by default). Several
+    `algorithms`, given as a list or comma-separated, classify the same
+    images in a single pass, with the averaged ranking of the algorithms if
+    `ensemble=1`. The images are classified from memory and nothing is
+    written to the `files` folder.
+    Returns the predictions of each image as JSON, or as NDJSON with one
+    line per image as soon as its batch is classified if `stream=1`.
+    """
+    try:
+        params, images = read_api_request("images")
+        algorithms = params.get("algorithms") or [
+            params.get("algorithm", "ResNet50")
+        ]
+        if isinstance(algorithms, str):
+            algorithms = [
+                algorithm.strip() for algorithm in algorithms.split(",")
+            ]
+        n = int(params.get("n", 5))
+    except (TypeError, ValueError) as error:
+        # n may also be given as null or a list in a JSON body
+        return jsonify({"error": str(error)}), 400
+    ensemble = str(params.get("ensemble", "0")).lower() in ["1", "true"]
+
+    # Import ImageAI and torch on the first prediction only
+    from image_recognizer import ImageRecognizer
+    from ensemble_recognizer import EnsembleRecognizer
+
+    for algorithm in algorithms:
+        if (not isinstance(algorithm, str)
+                or algorithm not in ImageRecognizer.MODELS):
+            return jsonify({"error": "Unknown algorithm: {}".format(
+                algorithm
+            )}), 400
+    if n < 1:
+        return jsonify({"error": "n must be at least 1"}), 400
+    if not images:
+        return jsonify({"error": "No images"}), 400
+
+    if len(algorithms) > 1:
+        recognizer = EnsembleRecognizer(
+            IMAGE_MODELS_PATH, algorithms, max_pixels=MAX_IMAGE_PIXELS,
+            backend_options=BACKEND_OPTIONS,
+        )
+        options = {"ensemble": ensemble}
+        fields = {"algorithms": recognizer.algorithms, "ensemble": ensemble}
+    else:
+        recognizer = ImageRecognizer(
+            IMAGE_MODELS_PATH, algorithms[0], max_pixels=MAX_IMAGE_PIXELS,
+            backend_options=BACKEND_OPTIONS,
+        )
+        options = {}
+        fields = {"algorithm": algorithms[0]}
+
+    def classify():
+        # Classify the images batch by batch, so that the results of a ...
+        # ...batch are streamed before the next one is classified
+        batch_size = IMAGE_BATCH_SIZE or 1
+        for start in range(0, len(images), batch_size):
+            batch = images[start:start + batch_size]
+            with METRICS.timer("predict", algorithm=",".join(algorithms)):
+                predictions = recognizer.predict_streams(
+                    [data for _, data in batch],
+                    image_names=[name for name, _ in batch],
+                    n=n,
+                    batch_size=batch_size,
+                    cache=result_cache,
+                    micro_batch=MICRO_BATCH,
+                    **options
+                )
+            for prediction in predictions:
+                yield prediction
+
+    return api_response(
+        classify(), "predictions", wants_stream(params), n=n, **fields
+    )
+
+
+# Object detection API
+@app.route("/api/v1/detect", methods=["POST"])
+def detect_objects_api():
+    """Route for object detection returning JSON instead of a page.
+    Accepts either a `video` or `images`, as multipart form data or as
+    base64 strings in a JSON body, with the `model` (TinyYOLOv3 by default)
+    and the `minimum_percentage_probability` of the detected objects (30 by
+    default). Detection runs in the request, on the frames chosen by the
+    sampling mode of the app, and neither an output video nor a page is
+    written.
+    Returns the objects detected in each frame of the video or in each
+    image as JSON, or as NDJSON with one line per frame or image as soon as
+    it is detected if `stream=1`.
+    """
+    try:
+        params, videos = read_api_request("video")
+        _, images = read_api_request("images")
+        model = params.get("model", "TinyYOLOv3")
+        minimum_percentage_probability = float(
+            params.get("minimum_percentage_probability", 30)
+        )
+    except (TypeError, ValueError) as error:
+        return jsonify({"error": str(error)}), 400
+
+    # Import ImageAI, torch and OpenCV on the first detection only
+    import cv2
+    from video_object_detector import VideoObjectDetector
+    from video_engine import (
+        FrameSampler,
+        format_objects,
+        get_image_detector,
+        iterate_frame_detections,
+        iterate_image_detections,
+    )
+    from detection_stream import format_frame_time
+
+    if model not in VideoObjectDetector.MODELS:
+        return jsonify({"error": "Unknown model: " + model}), 400
+    if len(videos) + bool(images) != 1:
+        return jsonify({"error": "Send either one video or images"}), 400
+
+    image_detector = get_image_detector(
+        VideoObjectDetector.load_model(
+            VIDEO_MODELS_PATH, model, BACKEND_OPTIONS
+        )
+    )
+
+    if images:
+        def detect_images():
+            for (image_name, _), output_array in zip(
+                images,
+                iterate_image_detections(
+                    image_detector,
+                    [data for _, data in images],
+                    minimum_percentage_probability,
+                ),
+            ):
+                yield {
+                    "image": image_name,
+                    "objects": format_objects(output_array),
+                }
+
+        return api_response(
+            detect_images(), "images", wants_stream(params), model=model
+        )
+
+    # OpenCV reads videos from files only, so the video is written to a ...
+    # ...temporary file outside of the `files` folder
+    video_name, data = videos[0]
+    handle, video_path = tempfile.mkstemp(
+        suffix="." + video_name.split(".")[-1]
+    )
+
+    def remove_video():
+        try:
+            os.remove(video_path)
+        except OSError:
+            pass
+
+    def detect_frames():
+        for frame_index, output_array, output_count in (
+            iterate_frame_detections(
+                image_detector,
+                video_path,
+                FrameSampler(
+                    SAMPLING_MODE, source_fps=frames_per_second,
+                    **SAMPLING_OPTIONS
+                ),
+                minimum_percentage_probability,
+            )
+        ):
+            yield {
+                "frame": frame_index,
+                "time": format_frame_time(frame_index, frames_per_second),
+                "objects": format_objects(output_array),
+                "counts": output_count,
+            }
+
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(data)
+
+        video = cv2.VideoCapture(video_path)
+        frames_per_second = video.get(cv2.CAP_PROP_FPS) or 20
+        video.release()
+
+        response = make_response(api_response(
+            detect_frames(), "frames", wants_stream(params),
+            model=model, video_name=video_name,
+            frames_per_second=frames_per_second,
+        ))
+    except BaseException:
+        remove_video()
+        raise
+    # Remove the video once the response is closed, even if the client ...
+    # ...disconnects before the streamed frames are all sent
+    response.call_on_close(remove_video)
+    return response
+
+
+# Metrics
+@app.route("/metrics")
+def get_metrics():
+    """Route for the metrics of the app in the Prometheus text format.
+    Returns the stage timing histograms of the web app and job workers, the
+    request counters and concurrency, the result cache counters and the
+    models resident in the model registry.
+    """
+    for name, value in result_cache.stats().items():
+        METRICS.set("imageai_cache_" + name, value)
+
+    # Models resident in the model registry of the web app
+    loaded_models = MODEL_REGISTRY.loaded()
+    METRICS.reset("imageai_model_resident")
+    for key in loaded_models:
+        METRICS.set("imageai_model_resident", 1, kind=key[0], model=key[1])
+    METRICS.set("imageai_models_loaded", len(loaded_models))
+    METRICS.set("imageai_model_memory_bytes", MODEL_REGISTRY.memory_usage())
+
+    return Response(
+        METRICS.render_directory(METRICS_PATH),
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
+# Result cache statistics
+@app.route("/cache/stats")
+def get_cache_stats():
+    """Route for the hit and miss counters of the result cache.
+    Returns the counters as JSON.
+    """
+    return jsonify(result_cache.stats())
+
+
+# Job worker processes re-import this script as `__mp_main__`, and must ...
+# ...not start the app's background services
+if __name__ != "__mp_main__":
+    # Import the heavy modules at startup instead of on first use if ...
+    # ...IMAGEAI_PRELOAD is set
+    if os.environ.get("IMAGEAI_PRELOAD", "0") == "1":
+        preload_modules()
+
+    # Configure the model registry and load the warm-up models
+    configure_model_registry()
+
+    # Start the background thread deleting old work directories. Work ...
+    # ...directories are kept for IMAGEAI_RESULTS_MAX_AGE seconds and ...
+    # ...their total size is capped at IMAGEAI_RESULTS_MAX_MB MB.
+    results_max_mb = os.environ.get("IMAGEAI_RESULTS_MAX_MB")
+    janitor = Janitor(
+        FILES_PATH,
+        max_age=int(os.environ.get("IMAGEAI_RESULTS_MAX_AGE", 3600)),
+        max_size=(
+            int(float(results_max_mb) * 1024 * 1024)
+            if results_max_mb else None
+        ),
+    )
+    janitor.start()
+
+    # Start the background thread deleting old entries of the result ...
+    # ...cache. Entries are kept for IMAGEAI_CACHE_MAX_AGE seconds since ...
+    # ...their last use and their total size is capped at ...
+    # ...IMAGEAI_CACHE_MAX_MB MB.
+    cache_max_mb = os.environ.get("IMAGEAI_CACHE_MAX_MB")
+    cache_janitor = Janitor(
+        CACHE_PATH,
+        max_age=int(os.environ.get("IMAGEAI_CACHE_MAX_AGE", 7 * 24 * 3600)),
+        max_size=(
+            int(float(cache_max_mb) * 1024 * 1024) if cache_max_mb else None
+        ),
+    )
+    cache_janitor.start()
+
 
 # Run the Flask app in debug mode if the script is executed directly
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
@@ -0,0 +1,285 @@
+"""Comparison of the inference engines on the files of files_for_testing/.
+
+For each classification algorithm, it classifies the images with each
+engine (PyTorch, TorchScript, ONNX Runtime and the int8 ONNX models) and
+reports the per-image latency (p50), the images/sec in batches and the
+agreement of the top-n labels and probabilities with PyTorch. For each
+exportable detection model, it detects the objects of the first frames of
+traffic.mp4 and reports the frames/sec and the share of frames with the
+same objects as PyTorch. The models must have been exported with
+export_models.py; missing exports are skipped.
+
+It fails if an engine disagrees with PyTorch on a top-1 label, if an fp32
+engine returns different top-n labels, or if a probability differs by
+more than --tolerance (--quantized-tolerance for the int8 models)
+percentage points.
+
+Usage:
+    python benchmarks/bench_backends.py [--backends torch onnxruntime ...]
+        [--intra-op-threads 4] [--inter-op-threads 1] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import cv2
+
+# Make the modules of the app importable
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+from image_recognizer import ImageRecognizer
+from video_object_detector import VideoObjectDetector
+from video_engine import count_objects, get_image_detector
+from inference_backends import get_export_path
+
+
+# Default paths to the models and test files
+IMAGE_MODELS_PATH = os.path.join(
+    ROOT_PATH, "models", "image-prediction-models"
+)
+VIDEO_MODELS_PATH = os.path.join(
+    ROOT_PATH, "models", "video-object-detection-models"
+)
+FILES_PATH = os.path.join(ROOT_PATH, "files_for_testing")
+
+# Engines compared, as "backend" or "backend:quantization"
+BACKENDS = [
+    "torch", "torchscript", "onnxruntime", "onnxruntime:dynamic",
+    "onnxruntime:static",
+]
+
+
+def get_backend_options(backend, intra_op_threads, inter_op_threads):
+    """Function to get the options of an engine given as "backend" or
+    "backend:quantization".
+    Returns:
+    - backend_options: A dictionary of keyword arguments of
+    inference_backends.use_backend().
+    """
+    backend, _, quantization = backend.partition(":")
+    return {
+        "backend": backend,
+        "quantization": quantization or None,
+        "intra_op_threads": intra_op_threads,
+        "inter_op_threads": inter_op_threads,
+    }
+
+
+def is_exported(weights_path, backend_options):
+    """Function to check whether a model was exported for an engine.
+    Returns:
+    - exported: True if the exported model exists.
+    """
+    return os.path.isfile(get_export_path(
+        weights_path, backend_options["backend"],
+        backend_options["quantization"],
+    ))
+
+
+def compare_predictions(reference, predictions):
+    """Function to compare the predictions of an engine with PyTorch's.
+    Returns:
+    - agreement: A dictionary of the share of images with the same top-1
+    label and the same top-n labels, and of the largest difference of the
+    probabilities of the same labels, in percentage points.
+    """
+    top1 = topn = 0
+    max_difference = 0.0
+    for expected, actual in zip(reference, predictions):
+        expected = {
+            pred["label"]: pred["probability"]
+            for pred in expected["predictions"]
+        }
+        actual_labels = [pred["label"] for pred in actual["predictions"]]
+        top1 += actual_labels[0] == next(iter(expected))
+        topn += set(actual_labels) == set(expected)
+        for pred in actual["predictions"]:
+            if pred["label"] in expected:
+                max_difference = max(
+                    max_difference,
+                    abs(pred["probability"] - expected[pred["label"]]),
+                )
+    return {
+        "top1_agreement": round(top1 / len(reference), 3),
+        "topn_agreement": round(topn / len(reference), 3),
+        "max_probability_difference": round(max_difference, 3),
+    }
+
+
+def bench_classification(algorithm, images, backend_options, n, repeats,
+                         reference=None):
+    """Function to benchmark a classification algorithm with an engine.
+    Returns:
+    - predictions: The predictions of the images.
+    - results: A dictionary of the latency, throughput and agreement with
+    the reference predictions.
+    """
+    recognizer = ImageRecognizer(
+        IMAGE_MODELS_PATH, algorithm, backend_options=backend_options
+    )
+    # Warm up the engine
+    predictions = recognizer.predict_streams(images, n=n, batch_size=16)
+
+    latencies = []
+    for _ in range(repeats):
+        for image in images:
+            start = time.perf_counter()
+            recognizer.predict_streams([image], n=n, batch_size=1)
+            latencies.append(1000 * (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        recognizer.predict_streams(images, n=n, batch_size=16)
+    seconds = time.perf_counter() - start
+
+    results = {
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "images_per_second": round(repeats * len(images) / seconds, 2),
+    }
+    if reference is not None:
+        results.update(compare_predictions(reference, predictions))
+    return predictions, results
+
+
+def bench_detection(model, frames, backend_options, reference=None):
+    """Function to benchmark a detection model with an engine.
+    Returns:
+    - counts: The counts of the objects of each frame.
+    - results: A dictionary of the throughput and of the share of frames
+    with the same object counts as the reference.
+    """
+    image_detector = get_image_detector(VideoObjectDetector.load_model(
+        VIDEO_MODELS_PATH, model, backend_options
+    ))
+    # Warm up the engine
+    image_detector.detectObjectsFromImage(
+        input_image=frames[0], output_type="array"
+    )
+
+    counts = []
+    start = time.perf_counter()
+    for frame in frames:
+        _, output_array = image_detector.detectObjectsFromImage(
+            input_image=frame, output_type="array"
+        )
+        counts.append(count_objects(output_array))
+    seconds = time.perf_counter() - start
+
+    results = {"frames_per_second": round(len(frames) / seconds, 2)}
+    if reference is not None:
+        results["frame_agreement"] = round(
+            sum(
+                expected == actual
+                for expected, actual in zip(reference, counts)
+            ) / len(frames),
+            3,
+        )
+    return counts, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--algorithms", nargs="+",
+                        default=list(ImageRecognizer.MODELS))
+    parser.add_argument("--models", nargs="+",
+                        default=VideoObjectDetector.EXPORTABLE_MODELS)
+    parser.add_argument("--backends", nargs="+", default=BACKENDS)
+    parser.add_argument("--intra-op-threads", type=int)
+    parser.add_argument("--inter-op-threads", type=int)
+    parser.add_argument("--n", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--tolerance", type=float, default=1.0)
+    parser.add_argument("--quantized-tolerance", type=float, default=5.0)
+    parser.add_argument("--output", help="path to save the results as JSON")
+    args = parser.parse_args()
+
+    images = []
+    for file_name in sorted(os.listdir(FILES_PATH)):
+        if file_name.split(".")[-1].lower() in ["jpg", "jpeg", "png"]:
+            with open(os.path.join(FILES_PATH, file_name), "rb") as f:
+                images.append(f.read())
+
+    frames = []
+    video = cv2.VideoCapture(os.path.join(FILES_PATH, "traffic.mp4"))
+    while len(frames) < args.frames:
+        ret, frame = video.read()
+        if not ret:
+            break
+        frames.append(frame)
+    video.release()
+
+    results = {"classification": {}, "detection": {}}
+    failures = []
+
+    for algorithm in args.algorithms:
+        weights_path = os.path.join(
+            IMAGE_MODELS_PATH, ImageRecognizer.MODELS[algorithm]
+        )
+        reference = None
+        for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+            backend_options = get_backend_options(
+                backend, args.intra_op_threads, args.inter_op_threads
+            )
+            if not is_exported(weights_path, backend_options):
+                print("Skipping {} {}: not exported".format(
+                    algorithm, backend
+                ))
+                continue
+            print("Classification: {} {}".format(algorithm, backend))
+            predictions, result = bench_classification(
+                algorithm, images, backend_options, args.n, args.repeats,
+                reference,
+            )
+            if reference is None:
+                reference = predictions
+            else:
+                quantized = backend_options["quantization"] is not None
+                if (result["top1_agreement"] < 1
+                        or (not quantized and result["topn_agreement"] < 1)
+                        or result["max_probability_difference"] > (
+                            args.quantized_tolerance if quantized
+                            else args.tolerance
+                        )):
+                    failures.append((algorithm, backend))
+            results["classification"].setdefault(algorithm, {})[backend] = (
+                result
+            )
+            print(json.dumps(result, indent=2))
+
+    for model in args.models:
+        weights_path = os.path.join(
+            VIDEO_MODELS_PATH, VideoObjectDetector.MODELS[model]
+        )
+        reference = None
+        for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+            backend_options = get_backend_options(
+                backend, args.intra_op_threads, args.inter_op_threads
+            )
+            if not is_exported(weights_path, backend_options):
+                print("Skipping {} {}: not exported".format(model, backend))
+                continue
+            print("Detection: {} {}".format(model, backend))
+            counts, result = bench_detection(
+                model, frames, backend_options, reference
+            )
+            if reference is None:
+                reference = counts
+            results["detection"].setdefault(model, {})[backend] = result
+            print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Results saved to {}".format(args.output))
+
+    for algorithm, backend in failures:
+        print("Predictions differ: {} {}".format(algorithm, backend))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
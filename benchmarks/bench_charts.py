@@ -0,0 +1,103 @@
+"""Benchmark of the rendering of the summary bar charts: new pyplot figures
+per chart (previous implementation) against the pooled ChartRenderer, with
+and without its cache.
+
+Usage:
+    python benchmarks/bench_charts.py [--requests 50]
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import warnings
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+# The previous implementation leaks figures on purpose
+warnings.filterwarnings("ignore", message="More than 20 figures")
+
+# Make the modules of the app importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chart_renderer import ChartRenderer, add_value_labels
+
+
+# Data of the five summary bar charts of one synthetic request
+CHARTS = [
+    (["car", "person", "bus", "truck"], [3.2, 1.5, 0.4, 0.9], "Per Frame"),
+    (["car", "person", "bus", "truck"], [61.0, 29.4, 8.1, 17.3], "Per Second"),
+    (["car", "person", "bus", "truck"], [3650.2, 1762.1, 485.0, 1040.0],
+     "Per Minute"),
+    (["car", "person", "bus", "truck"], [1.1, 0.7, 0.2, 0.3], "Per Hour"),
+    (["car", "person", "bus", "truck"], [21901, 10573, 2910, 6240], "Full"),
+]
+
+
+def get_rss_mb():
+    """Function to get the current resident set size of the process in MB.
+    """
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+def render_with_pyplot(labels, values, title, output_path):
+    """Function reproducing the previous implementation, which created a new
+    pyplot figure per chart and never closed it.
+    """
+    fig, ax = plt.subplots()
+    ax.bar(range(len(labels)), values, width=0.5, color="#7289DA")
+    ax.set_xticks(range(len(labels)))
+    ax.set_xticklabels(labels, rotation=0, color="white")
+    ax.set_ylim(0, max(values) * 1.3)
+    ax.axes.get_yaxis().set_visible(False)
+    plt.title(title, fontsize=14, color="white")
+    add_value_labels(ax)
+    fig.savefig(output_path, transparent=True)
+
+
+def run(name, render, requests, output_path):
+    """Function to render the charts of a number of requests and print the
+    time per request and RSS growth.
+    """
+    rss_before = get_rss_mb()
+    start = time.perf_counter()
+    for _ in range(requests):
+        for i, (labels, values, title) in enumerate(CHARTS):
+            render(
+                labels, values, title,
+                os.path.join(output_path, "chart_{}.png".format(i)),
+            )
+    elapsed = time.perf_counter() - start
+    print(
+        "{:<28} {:8.1f} ms/request {:8.1f} MB RSS growth".format(
+            name, 1000 * elapsed / requests, get_rss_mb() - rss_before
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_path:
+        renderer = ChartRenderer()
+        run("ChartRenderer", renderer.render_bar_chart, args.requests,
+            output_path)
+
+        with tempfile.TemporaryDirectory() as cache_path:
+            renderer = ChartRenderer(cache_path=cache_path)
+            run("ChartRenderer with cache", renderer.render_bar_chart,
+                args.requests, output_path)
+            print("Renderer stats: {}".format(renderer.stats()))
+
+        run("pyplot figures", render_with_pyplot, args.requests, output_path)
+        print("Open pyplot figures: {}".format(len(plt.get_fignums())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,469 @@
+"""Benchmark of the image prediction and video object detection pipelines
+on the files of files_for_testing/.
+
+It reports the model load time, the per-image latency (p50/p95/p99), the
+images/sec at several batch sizes and the images/sec of concurrent
+single-image clients, with and without micro-batching, of each
+classification algorithm,
+and the frames/sec, peak RSS and post-processing times (forFull, CSV,
+summary charts, summary and preview) of each detection model on
+traffic.mp4. Each detection model is benchmarked in its own process, so
+that its peak RSS is not that of the models benchmarked before it. With
+--stub, small stand-in models are used instead of the weights files, so
+that the benchmark runs in CI. Results can be saved as JSON and compared
+with a previous run to detect regressions. The same benchmarks run as a
+pytest suite with test_bench_pipelines.py.
+
+Usage:
+    python benchmarks/bench_pipelines.py [--stub] [--output results.json]
+        [--compare baseline.json] [--tolerance 0.2]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+
+# Make the modules of the app importable
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+from model_registry import MODEL_REGISTRY
+from image_recognizer import ImageRecognizer
+from video_object_detector import VideoObjectDetector
+from video_engine import FrameSampler, detect_objects_sampled
+from preview_writer import PreviewWriter
+
+
+# Default paths to the models and test files
+IMAGE_MODELS_PATH = os.path.join(
+    ROOT_PATH, "models", "image-prediction-models"
+)
+VIDEO_MODELS_PATH = os.path.join(
+    ROOT_PATH, "models", "video-object-detection-models"
+)
+FILES_PATH = os.path.join(ROOT_PATH, "files_for_testing")
+
+# Metrics for which a higher value is a regression, the others being ...
+# ...throughputs for which a lower value is a regression
+LOWER_IS_BETTER = ("seconds", "_ms", "rss_mb")
+
+
+class StubImageClassification:
+    """Stand-in for a loaded ImageClassification object, with a small
+    random model exposing the same private attributes as ImageAI.
+    """
+
+    def __init__(self):
+        import torch
+
+        torch.manual_seed(0)
+        self._ImageClassification__model = torch.nn.Sequential(
+            torch.nn.Conv2d(3, 16, 3, stride=4),
+            torch.nn.ReLU(),
+            torch.nn.AdaptiveAvgPool2d(1),
+            torch.nn.Flatten(),
+            torch.nn.Linear(16, 1000),
+        ).eval()
+        self._ImageClassification__classes = [
+            "class_{}".format(i) for i in range(1000)
+        ]
+        self._ImageClassification__device = "cpu"
+
+
+
+class StubObjectDetection:
+    """Stand-in for a loaded ObjectDetection object, returning a fixed
+    pattern of detections derived from the frame content.
+    """
+
+    def detectObjectsFromImage(self, input_image, output_type="array",
+                               minimum_percentage_probability=30):
+        height, width = input_image.shape[:2]
+        # A cheap computation on the frame standing in for the model
+        level = int(cv2.resize(input_image, (32, 32)).mean())
+        output_array = [
+            {
+                "name": name,
+                "percentage_probability": 50.0 + (level + i * 17) % 50,
+                "box_points": [
+                    i * width // 8, height // 4,
+                    (i + 2) * width // 8, height // 2,
+                ],
+            }
+            for i, name in enumerate(["car", "person", "bus"][:level % 4])
+        ]
+        return input_image, output_array
+
+
+
+class StubVideoObjectDetection:
+    """Stand-in for a loaded VideoObjectDetection object, running the stub
+    detector on every frame with the sampled detection loop.
+    """
+
+    def __init__(self):
+        self._VideoObjectDetection__detector = StubObjectDetection()
+
+
+    def detectObjectsFromVideo(self, **kwargs):
+        return detect_objects_sampled(self, sampler=FrameSampler(), **kwargs)
+
+
+
+class TimedVideoObjectDetector(VideoObjectDetector):
+    """VideoObjectDetector recording the time spent in forFull().
+    """
+
+    def forFull(self, output_arrays, count_arrays, average_output_count):
+        start = time.perf_counter()
+        super().forFull(output_arrays, count_arrays, average_output_count)
+        self.for_full_seconds = time.perf_counter() - start
+
+
+
+def get_peak_rss_mb():
+    """Function to get the peak resident set size of the process in MB. It
+    never decreases, so it only measures one model in a process of its own.
+    """
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if platform.system() == "Darwin":
+        peak_rss /= 1024
+    return peak_rss / 1024
+
+
+def timed(function, *args, **kwargs):
+    """Function to call a function and measure its duration.
+    Returns:
+    - result: The result of the function.
+    - seconds: The duration of the call in seconds.
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def load_stub_models(algorithms, models):
+    """Function to load the stub models into the model registry under the
+    keys of the real models, so that the app's classes use them.
+    """
+    for algorithm in algorithms:
+        model_path = os.path.join(
+            IMAGE_MODELS_PATH, ImageRecognizer.MODELS[algorithm]
+        )
+        MODEL_REGISTRY.get(
+            ("ImageRecognizer", algorithm, model_path),
+            StubImageClassification, model_path,
+        )
+    for model in models:
+        model_path = os.path.join(
+            VIDEO_MODELS_PATH, VideoObjectDetector.MODELS[model]
+        )
+        # Models are registered under the name of the class loading them
+        for detector_class in [VideoObjectDetector, TimedVideoObjectDetector]:
+            MODEL_REGISTRY.get(
+                (detector_class.__name__, model, model_path),
+                StubVideoObjectDetection, model_path,
+            )
+
+
+def bench_image_prediction(algorithm, image_paths, batch_sizes, repeats,
+                           clients):
+    """Function to benchmark an image classification algorithm.
+    Returns:
+    - results: A dictionary of the load time, latency percentiles,
+    throughput at each batch size and throughput of `clients` concurrent
+    single-image requests with and without micro-batching.
+    """
+    recognizer, load_seconds = timed(
+        ImageRecognizer, IMAGE_MODELS_PATH, algorithm
+    )
+    images = []
+    for image_path in image_paths:
+        with open(image_path, "rb") as f:
+            images.append(f.read())
+
+    # Warm up the model
+    recognizer.predict_streams(images[:1], n=5, batch_size=1)
+
+    # Latency of single-image requests, decoding included
+    latencies = []
+    for _ in range(repeats):
+        for image in images:
+            _, seconds = timed(
+                recognizer.predict_streams, [image], n=5, batch_size=1
+            )
+            latencies.append(1000 * seconds)
+
+    # Throughput of batched classification on decoded images
+    decoded_images = [recognizer.decode_image(image) for image in images]
+    throughput = {}
+    for batch_size in batch_sizes:
+        batch = (decoded_images * batch_size)[:max(batch_size, len(images))]
+        _, seconds = timed(
+            lambda: [
+                recognizer.classify_batch(batch, n=5, batch_size=batch_size)
+                for _ in range(repeats)
+            ]
+        )
+        throughput[str(batch_size)] = round(
+            repeats * len(batch) / seconds, 2
+        )
+
+    # Throughput of concurrent clients each sending one image per request
+    concurrent_throughput = {}
+    for name, micro_batch in [
+        ("unbatched", None),
+        ("micro_batched", {"max_batch_size": 32, "max_wait": 0.005}),
+    ]:
+        def client():
+            for image in images * repeats:
+                recognizer.predict_streams(
+                    [image], n=5, batch_size=1, micro_batch=micro_batch
+                )
+
+        threads = [threading.Thread(target=client) for _ in range(clients)]
+        _, seconds = timed(
+            lambda: [thread.start() for thread in threads]
+            + [thread.join() for thread in threads]
+        )
+        concurrent_throughput[name] = round(
+            clients * repeats * len(images) / seconds, 2
+        )
+
+    return {
+        "load_seconds": round(load_seconds, 4),
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "latency_p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "latency_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "images_per_second": throughput,
+        "concurrent_images_per_second": concurrent_throughput,
+    }
+
+
+def bench_video_detection(model, video_path, engine, workers):
+    """Function to benchmark a detection model on a video, with its
+    post-processing steps.
+    Returns:
+    - results: A dictionary of the load time, frames/sec, peak RSS and
+    post-processing times.
+    """
+    _, load_seconds = timed(
+        VideoObjectDetector.load_model, VIDEO_MODELS_PATH, model
+    )
+
+    videos_path = tempfile.mkdtemp()
+    try:
+        video_name = os.path.basename(video_path)
+        shutil.copyfile(video_path, os.path.join(videos_path, video_name))
+
+        object_detector, detection_seconds = timed(
+            TimedVideoObjectDetector,
+            VIDEO_MODELS_PATH,
+            model,
+            20,
+            videos_path,
+            video_name,
+            engine=engine,
+            workers=workers,
+        )
+        _, csv_seconds = timed(object_detector.save_csv)
+        _, plot_seconds = timed(object_detector.plot_summaries)
+        _, summary_seconds = timed(object_detector.save_summary)
+
+        # Time the preview on its own by feeding it the frames of the ...
+        # ...output video
+        output_video = cv2.VideoCapture(
+            os.path.join(
+                videos_path, video_name.split(".")[0] + "_detected.mp4"
+            )
+        )
+        start = time.perf_counter()
+        preview = PreviewWriter(
+            os.path.join(videos_path, "preview.gif"), 20
+        )
+        frame_index = 0
+        while True:
+            ret, frame = output_video.read()
+            if not ret:
+                break
+            preview.add_frame(frame_index, frame)
+            frame_index += 1
+        preview.close()
+        preview_seconds = time.perf_counter() - start
+        output_video.release()
+    finally:
+        shutil.rmtree(videos_path, ignore_errors=True)
+
+    return {
+        "load_seconds": round(load_seconds, 4),
+        "frames": object_detector.frames_processed,
+        "detection_seconds": round(detection_seconds, 4),
+        "frames_per_second": round(
+            object_detector.frames_processed / detection_seconds, 2
+        ),
+        "peak_rss_mb": round(get_peak_rss_mb(), 1),
+        "for_full_seconds": round(
+            getattr(object_detector, "for_full_seconds", 0.0), 4
+        ),
+        "save_csv_seconds": round(csv_seconds, 4),
+        "plot_summaries_seconds": round(plot_seconds, 4),
+        "save_summary_seconds": round(summary_seconds, 4),
+        "preview_seconds": round(preview_seconds, 4),
+    }
+
+
+def run_video_detection(model, video_path, engine, workers, stub):
+    """Function run in a child process to benchmark a detection model,
+    loading the stub model of this process first with `stub`.
+    Returns:
+    - results: The results of bench_video_detection().
+    """
+    if stub:
+        load_stub_models([], [model])
+    return bench_video_detection(model, video_path, engine, workers)
+
+
+def bench_video_detection_isolated(model, video_path, engine, workers,
+                                   stub=False):
+    """Function to benchmark a detection model in a new process, so that
+    its peak RSS only includes the memory used for this model.
+    Returns:
+    - results: The results of bench_video_detection().
+    """
+    with ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return executor.submit(
+            run_video_detection, model, video_path, engine, workers, stub
+        ).result()
+
+
+def flatten(results, prefix=""):
+    """Function to flatten nested result dictionaries into "a.b.c" keys.
+    """
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + "."))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(results, baseline, tolerance):
+    """Function to compare benchmark results with a baseline.
+    Returns:
+    - regressions: A list of (metric, baseline value, value) tuples of the
+    metrics worse than the baseline by more than `tolerance`.
+    """
+    current = flatten(results["benchmarks"])
+    regressions = []
+    for metric, baseline_value in flatten(baseline["benchmarks"]).items():
+        value = current.get(metric)
+        if value is None or not baseline_value or metric.endswith("frames"):
+            continue
+        if any(marker in metric for marker in LOWER_IS_BETTER):
+            regressed = value > baseline_value * (1 + tolerance)
+        else:
+            regressed = value < baseline_value * (1 - tolerance)
+        if regressed:
+            regressions.append((metric, baseline_value, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stub", action="store_true",
+                        help="use stand-in models instead of the weights")
+    parser.add_argument("--algorithms", nargs="+",
+                        default=list(ImageRecognizer.MODELS))
+    parser.add_argument("--models", nargs="+",
+                        default=list(VideoObjectDetector.MODELS))
+    parser.add_argument("--batch-sizes", nargs="+", type=int,
+                        default=[1, 4, 16, 32])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=16,
+                        help="concurrent clients of the micro-batching "
+                        "benchmark")
+    parser.add_argument("--video", default="traffic.mp4")
+    parser.add_argument("--engine", default="imageai",
+                        choices=["imageai", "pipelined"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", help="path to save the results as JSON")
+    parser.add_argument("--compare", help="path to baseline results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.stub:
+        load_stub_models(args.algorithms, args.models)
+        # Stub models are held by the registry of this process only
+        args.workers = 1
+
+    image_paths = sorted(
+        os.path.join(FILES_PATH, file_name)
+        for file_name in os.listdir(FILES_PATH)
+        if file_name.split(".")[-1].lower() in ["jpg", "jpeg", "png"]
+    )
+
+    results = {
+        "stub": args.stub,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "benchmarks": {"image_prediction": {}, "video_detection": {}},
+    }
+
+    for algorithm in args.algorithms:
+        print("Image prediction: {}".format(algorithm))
+        results["benchmarks"]["image_prediction"][algorithm] = (
+            bench_image_prediction(
+                algorithm, image_paths, args.batch_sizes, args.repeats,
+                args.clients,
+            )
+        )
+        print(json.dumps(
+            results["benchmarks"]["image_prediction"][algorithm], indent=2
+        ))
+
+    for model in args.models:
+        print("Video object detection: {}".format(model))
+        results["benchmarks"]["video_detection"][model] = (
+            bench_video_detection_isolated(
+                model, os.path.join(FILES_PATH, args.video), args.engine,
+                args.workers, args.stub,
+            )
+        )
+        print(json.dumps(
+            results["benchmarks"]["video_detection"][model], indent=2
+        ))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Results saved to {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for metric, baseline_value, value in regressions:
+            print("Regression: {} {} -> {}".format(
+                metric, baseline_value, value
+            ))
+        if regressions:
+            sys.exit(1)
+        print("No regression beyond {:.0%}".format(args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Startup-time check of the web app.
+
+It imports ImageAI-web-apps.py in a fresh interpreter with
+`python -X importtime`, reports the total import time and the slowest
+modules, and fails if a heavy dependency (ImageAI, torch, OpenCV, pandas
+or matplotlib) is imported at startup or if the import takes longer than
+--max-seconds. The heavy dependencies are imported on the first request
+that needs them, or at startup with IMAGEAI_PRELOAD=1.
+
+Usage:
+    python benchmarks/bench_startup.py [--max-seconds 2.0] [--top 10]
+        [--output results.json]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+
+# Root folder of the app
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top-level modules which must not be imported at startup
+HEAVY_MODULES = ["imageai", "torch", "torchvision", "cv2", "pandas",
+                 "matplotlib", "moviepy"]
+
+
+def measure_imports():
+    """Function to import the app in a fresh interpreter and measure the
+    import time of each module.
+    Returns:
+    - imports: A list of (module name, self seconds, cumulative seconds)
+    tuples, in import order, the names being indented by nesting level.
+    """
+    env = dict(os.environ, IMAGEAI_PRELOAD="0")
+    completed = subprocess.run(
+        [
+            sys.executable, "-X", "importtime", "-c",
+            "import importlib; importlib.import_module('ImageAI-web-apps')",
+        ],
+        cwd=ROOT_PATH, env=env, stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE, universal_newlines=True,
+    )
+    if completed.returncode != 0:
+        sys.exit("Import of the app failed:\n{}".format(completed.stderr))
+
+    imports = []
+    # Lines are "import time: <self us> | <cumulative us> | <name>"
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            # Header line
+            continue
+        # Nested imports are indented under the module importing them
+        imports.append(
+            (fields[2][1:].rstrip(), self_us / 1e6, cumulative_us / 1e6)
+        )
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-seconds", type=float, default=2.0)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="path to save the results as JSON")
+    args = parser.parse_args()
+
+    imports = measure_imports()
+    # Top-level imports are not indented, their cumulative times add up ...
+    # ...to the total import time
+    total_seconds = sum(
+        cumulative for name, _, cumulative in imports
+        if not name.startswith(" ")
+    )
+    heavy_modules = sorted(set(
+        name.strip() for name, _, _ in imports
+        if name.strip().split(".")[0] in HEAVY_MODULES
+    ))
+
+    print("Startup import time: {:.3f} s".format(total_seconds))
+    print("Slowest modules (self time):")
+    for name, self_seconds, _ in sorted(
+        imports, key=lambda item: item[1], reverse=True
+    )[:args.top]:
+        print("  {:8.1f} ms  {}".format(self_seconds * 1000, name.strip()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "total_seconds": round(total_seconds, 4),
+                "modules": len(imports),
+                "heavy_modules": heavy_modules,
+            }, f, indent=2)
+        print("Results saved to {}".format(args.output))
+
+    failed = False
+    if heavy_modules:
+        print("Heavy modules imported at startup: {}".format(
+            ", ".join(heavy_modules)
+        ))
+        failed = True
+    if total_seconds > args.max_seconds:
+        print("Startup took longer than {} s".format(args.max_seconds))
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("Startup OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Benchmark of the timestamp and time bucket generation of
+VideoObjectDetector on a synthetic hour-long detection set at 20 fps.
+
+Usage:
+    python benchmarks/bench_timestamps.py [--minutes 60] [--fps 20]
+"""
+import os
+import sys
+import time
+import argparse
+import random
+from datetime import timedelta, datetime, date
+import pandas as pd
+
+# Make the modules of the app importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from video_object_detector import VideoObjectDetector
+from detection_summary import DetectionSummary
+
+
+# Names of the synthetic detected objects
+OBJECT_NAMES = ["car", "person", "bus", "truck", "bicycle", "traffic light"]
+
+
+def make_output_arrays(n_frames, seed=0):
+    """Function to generate synthetic per-frame detections in the format of
+    ImageAI's output arrays.
+    Args:
+    - n_frames: The number of frames.
+    - seed: The seed of the random generator.
+    Returns:
+    - output_arrays: A list of lists of detected objects, one per frame.
+    """
+    rng = random.Random(seed)
+    return [
+        [
+            {
+                "name": rng.choice(OBJECT_NAMES),
+                "percentage_probability": rng.uniform(30, 100),
+            }
+            for _ in range(rng.randint(0, 4))
+        ]
+        for _ in range(n_frames)
+    ]
+
+
+def legacy_for_full(output_arrays, frames_per_second):
+    """Function reproducing the previous implementation: timestamps built by
+    repeatedly adding timedelta(seconds=1/fps) and formatted per row, then
+    time buckets parsed back from the strings.
+    Args:
+    - output_arrays: A list of lists of detected objects, one per frame.
+    - frames_per_second: Number of frames per second in the video.
+    Returns:
+    - df: The DataFrame of detected objects with time bucket columns.
+    """
+    today = date.today()
+    current_frame = datetime(today.year, today.month, today.day, 0, 0, 0)
+    rows = []
+    for objects_per_frame in output_arrays:
+        if objects_per_frame:
+            for object in objects_per_frame:
+                rows.append(
+                    [
+                        current_frame.strftime("%H:%M:%S.%f"),
+                        object["name"],
+                        object["percentage_probability"] / 100,
+                    ]
+                )
+        else:
+            rows.append([current_frame.strftime("%H:%M:%S.%f"), None, None])
+        current_frame = current_frame + timedelta(
+            seconds=(1 / frames_per_second)
+        )
+    df = pd.DataFrame(rows, columns=["frames", "objects", "probability"])
+
+    df["seconds"] = (
+        df["frames"].str.split(":").str[-1].str.split(".").str[0]
+    ).astype("int32")
+    df["minutes"] = df["frames"].str.split(":").str[1].astype("int32")
+    df["hours"] = df["frames"].str.split(":").str[0].astype("int32")
+    return df
+
+
+def vectorized_for_full(output_arrays, frames_per_second):
+    """Function running the current VideoObjectDetector.forFull on the
+    synthetic detections, without loading a model. This includes building
+    the summary of the detected objects.
+    Args:
+    - output_arrays: A list of lists of detected objects, one per frame.
+    - frames_per_second: Number of frames per second in the video.
+    Returns:
+    - object_detector: The VideoObjectDetector holding the DataFrame.
+    """
+    object_detector = VideoObjectDetector.__new__(VideoObjectDetector)
+    object_detector.frames_per_second = frames_per_second
+    object_detector.streaming = False
+    object_detector.summary = DetectionSummary(frames_per_second)
+    object_detector.tracker = None
+    object_detector.forFull(output_arrays, None, None)
+    return object_detector
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=60)
+    parser.add_argument("--fps", type=int, default=20)
+    args = parser.parse_args()
+
+    n_frames = int(args.minutes * 60 * args.fps)
+    output_arrays = make_output_arrays(n_frames)
+    print("Frames: {}".format(n_frames))
+
+    start = time.perf_counter()
+    legacy_df = legacy_for_full(output_arrays, args.fps)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    object_detector = vectorized_for_full(output_arrays, args.fps)
+    build_time = time.perf_counter() - start
+
+    # The formatted times are only produced at CSV export
+    from detection_stream import format_frame_times
+
+    start = time.perf_counter()
+    frame_times = format_frame_times(
+        object_detector.df["frames"].to_numpy(), args.fps
+    )
+    format_time = time.perf_counter() - start
+
+    # Float accumulation drift of the previous implementation
+    drifted = int((legacy_df["frames"] != frame_times).sum())
+
+    print("Rows: {}".format(len(legacy_df)))
+    print("Previous implementation: {:.3f} s".format(legacy_time))
+    print("Frame index and summary: {:.3f} s".format(build_time))
+    print("Formatting times at CSV export: {:.3f} s".format(format_time))
+    print("Speedup: {:.1f}x".format(legacy_time / (build_time + format_time)))
+    print("Rows with drifted timestamps previously: {}".format(drifted))
+
+
+if __name__ == "__main__":
+    main()
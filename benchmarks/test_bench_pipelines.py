@@ -0,0 +1,82 @@
+"""pytest suite of the image prediction and video object detection
+benchmarks of bench_pipelines.py, run with the stub models so that it
+needs no weights files. With pytest-benchmark installed, the timings are
+reported and can be saved with --benchmark-json; otherwise each benchmark
+runs once.
+
+Usage:
+    python -m pytest benchmarks [--benchmark-json results.json]
+"""
+import os
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("imageai")
+import bench_pipelines
+from bench_pipelines import FILES_PATH, IMAGE_MODELS_PATH
+from image_recognizer import ImageRecognizer
+from video_object_detector import VideoObjectDetector
+
+
+ALGORITHMS = list(ImageRecognizer.MODELS)
+MODELS = list(VideoObjectDetector.MODELS)
+
+# Number of frames of traffic.mp4
+TRAFFIC_FRAMES = 163
+
+
+@pytest.fixture(scope="module", autouse=True)
+def stub_models():
+    bench_pipelines.load_stub_models(ALGORITHMS, [])
+
+
+@pytest.fixture(scope="module")
+def images():
+    images = []
+    for file_name in sorted(os.listdir(FILES_PATH)):
+        if file_name.split(".")[-1].lower() in ["jpg", "jpeg", "png"]:
+            with open(os.path.join(FILES_PATH, file_name), "rb") as f:
+                images.append(f.read())
+    return images
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_model_load(benchmark, algorithm):
+    recognizer = benchmark(ImageRecognizer, IMAGE_MODELS_PATH, algorithm)
+    assert recognizer.algorithm == algorithm
+
+
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_single_image_latency(benchmark, algorithm, images):
+    recognizer = ImageRecognizer(IMAGE_MODELS_PATH, algorithm)
+    predictions = benchmark(
+        recognizer.predict_streams, images[:1], n=5, batch_size=1
+    )
+    assert len(predictions[0]["predictions"]) == 5
+
+
+@pytest.mark.parametrize("batch_size", [1, 4, 16, 32])
+@pytest.mark.parametrize("algorithm", ALGORITHMS)
+def test_batch_throughput(benchmark, algorithm, batch_size, images):
+    recognizer = ImageRecognizer(IMAGE_MODELS_PATH, algorithm)
+    decoded_images = [recognizer.decode_image(image) for image in images]
+    batch = (decoded_images * batch_size)[:batch_size]
+    results = benchmark(
+        recognizer.classify_batch, batch, n=5, batch_size=batch_size
+    )
+    assert len(results) == batch_size
+
+
+@pytest.mark.parametrize("model", MODELS)
+def test_video_detection(benchmark, model):
+    # Each model runs in its own process, which loads its stub model
+    results = benchmark.pedantic(
+        bench_pipelines.bench_video_detection_isolated,
+        args=(model, os.path.join(FILES_PATH, "traffic.mp4"), "imageai", 1,
+              True),
+        rounds=1,
+    )
+    assert results["frames"] == TRAFFIC_FRAMES
+    assert results["peak_rss_mb"] > 0
+    for step in ["for_full", "save_csv", "plot_summaries", "preview"]:
+        assert results[step + "_seconds"] > 0
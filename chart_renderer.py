@@ -0,0 +1,230 @@
+import os
+import json
+import queue
+import shutil
+import hashlib
+import threading
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+
+# Colors of the summary bar charts
+BAR_COLOR = "#7289DA"
+TEXT_COLOR = "white"
+BACKGROUND_COLOR = "#1e2b3a"
+
+
+def add_value_labels(ax, spacing=5):
+    """Function to add labels to the end of each bar in a vertical bar chart.
+    Arguments:
+    - ax (matplotlib.axes.Axes): The matplotlib object containing the axes
+    of the plot to annotate.
+    - spacing (int): The distance between the labels and the bars.
+    """
+    # For each bar: Place a label
+    for rect in ax.patches:
+        # Get X and Y placement of label from rect.
+        y_value = rect.get_height()
+        x_value = rect.get_x() + rect.get_width() / 2
+
+        # Number of points between bar and label. Change to your liking.
+        space = spacing
+        # Vertical alignment for positive values
+        va = "bottom"
+
+        # If value of bar is negative: Place label below bar
+        if y_value < 0:
+            # Invert space to place label below
+            space *= -1
+            # Vertically align label at top
+            va = "top"
+
+        # Use Y value as label and format number with one decimal place
+        label = "{:.1f}".format(y_value)
+
+        # Create annotation
+        ax.annotate(
+            label,
+            (x_value, y_value),    # Place labels at end of the bars
+            xytext=(0, space),    # Vertically shift label by `space`
+            textcoords="offset points",    # Interpret `xytext` as offset
+            ha="center",    # Horizontally center label
+            va=va,    # Vertically align label differently for signs
+            color=TEXT_COLOR,    # Format the annotation text fonts
+            fontsize=14,
+            weight="bold",
+        )
+
+
+
+class ChartRenderer:
+    """Renderer of the summary bar charts.
+    It draws on a small pool of headless Agg figures that are cleared and
+    reused, instead of creating new pyplot figures that stay registered for
+    the lifetime of the process. Rendered charts can be cached on disk,
+    keyed by the hash of the chart data, so identical charts are never
+    rendered twice.
+    """
+
+    def __init__(self, pool_size=2, cache_path=None):
+        """Initialize the ChartRenderer object.
+        Args:
+        - pool_size: The number of reusable figures, i.e. the number of
+        charts that can be rendered concurrently.
+        - cache_path: The folder in which rendered charts are cached (None
+        to disable the cache).
+        """
+        self.cache_path = cache_path
+        self._figures = queue.Queue()
+        for _ in range(pool_size):
+            figure = Figure()
+            FigureCanvasAgg(figure)
+            self._figures.put(figure)
+
+        # Number of charts rendered and served from the cache
+        self.rendered = 0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def get_chart_key(labels, values, title, image_format):
+        """Get the hash of the data of a chart.
+        Args:
+        - labels: The labels of the bars.
+        - values: The heights of the bars.
+        - title: The title of the chart.
+        - image_format: The format of the image ("png" or "svg").
+        Returns:
+        - key: The SHA-256 hash of the chart data.
+        """
+        data = json.dumps(
+            [list(labels), [float(value) for value in values], title,
+             image_format]
+        )
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+    def render_bar_chart(self, labels, values, title, output_path):
+        """Render a summary bar chart to an image file.
+        Args:
+        - labels: The labels of the bars.
+        - values: The heights of the bars.
+        - title: The title of the chart.
+        - output_path: The path to the output image. Its extension (".png"
+        or ".svg") sets the image format.
+        """
+        image_format = os.path.splitext(output_path)[1][1:].lower()
+
+        # Copy the chart from the cache if it was already rendered
+        if self.cache_path is not None:
+            key = self.get_chart_key(labels, values, title, image_format)
+            cached_path = os.path.join(
+                self.cache_path, key, "chart." + image_format
+            )
+            try:
+                shutil.copyfile(cached_path, output_path)
+                with self._lock:
+                    self.cache_hits += 1
+                return
+            except OSError:
+                # The chart is not cached yet
+                pass
+
+        # Wait for a free figure of the pool
+        figure = self._figures.get()
+        try:
+            self._draw_bar_chart(figure, labels, values, title)
+            # Save the bar graph with a transparent background
+            figure.savefig(
+                output_path, format=image_format, transparent=True
+            )
+        finally:
+            # Free the artists of the chart and return the figure to the ...
+            # ...pool
+            figure.clear()
+            self._figures.put(figure)
+
+        with self._lock:
+            self.rendered += 1
+
+        if self.cache_path is not None:
+            # Publish the cached chart atomically
+            temp_path = os.path.join(
+                self.cache_path,
+                "{}.{}.tmp".format(key, threading.get_ident()),
+            )
+            os.makedirs(temp_path, exist_ok=True)
+            shutil.copyfile(
+                output_path, os.path.join(temp_path, "chart." + image_format)
+            )
+            try:
+                os.rename(temp_path, os.path.dirname(cached_path))
+            except OSError:
+                # Another request cached the same chart in the meantime
+                shutil.rmtree(temp_path, ignore_errors=True)
+
+
+    @staticmethod
+    def _draw_bar_chart(figure, labels, values, title):
+        """Draw and format a summary bar chart on a figure.
+        Args:
+        - figure: The matplotlib figure to draw on.
+        - labels: The labels of the bars.
+        - values: The heights of the bars.
+        - title: The title of the chart.
+        """
+        ax = figure.subplots()
+        positions = list(range(len(labels)))
+        ax.bar(positions, values, width=0.5, color=BAR_COLOR)
+
+        # Format x ticks
+        ax.set_xticks(positions)
+        ax.set_xticklabels(
+            labels, rotation=0, fontname="arial", color=TEXT_COLOR
+        )
+        # Reset the range of y axis
+        ax.set_ylim(0, (max(values) if len(values) else 1) * 1.3)
+        # Hide y axis
+        ax.axes.get_yaxis().set_visible(False)
+        # Set the colors of the border lines
+        ax.spines["bottom"].set_color(TEXT_COLOR)
+        ax.spines["left"].set_color(BACKGROUND_COLOR)
+        ax.spines["right"].set_color(BACKGROUND_COLOR)
+        ax.spines["top"].set_color(BACKGROUND_COLOR)
+        # Add graph title
+        ax.set_title(title, fontname="arial", fontsize=14, color=TEXT_COLOR)
+        # Add value labels to the bars
+        add_value_labels(ax)
+
+
+    def stats(self):
+        """Get the counters of the renderer.
+        Returns:
+        - stats: A dictionary of the number of charts rendered and served
+        from the cache.
+        """
+        with self._lock:
+            return {"rendered": self.rendered, "cache_hits": self.cache_hits}
+
+
+
+# Renderers shared by all requests of the process, one per cache folder
+_chart_renderers = {}
+_chart_renderers_lock = threading.Lock()
+
+
+def get_chart_renderer(cache_path=None):
+    """Function to get the chart renderer of the process for a cache folder,
+    creating it on first use.
+    Args:
+    - cache_path: The folder in which rendered charts are cached (None to
+    disable the cache).
+    Returns:
+    - chart_renderer: The shared ChartRenderer.
+    """
+    with _chart_renderers_lock:
+        if cache_path not in _chart_renderers:
+            _chart_renderers[cache_path] = ChartRenderer(cache_path=cache_path)
+        return _chart_renderers[cache_path]
@@ -0,0 +1,135 @@
+import os
+import json
+
+
+
+# Names of the checkpoint files written in the work directory of a video
+STATE_FILE_NAME = "checkpoint.json"
+ROWS_FILE_NAME = "checkpoint_rows.jsonl"
+
+
+class DetectionCheckpoint:
+    """Periodic checkpoint of the objects detected in the frames of a video,
+    so that a detection interrupted by a crash or a restart resumes after
+    the last saved frame instead of starting over.
+    The objects of each frame are appended as one JSON line to a rows file.
+    A small state file, replaced atomically after the rows are synced to
+    disk, records the number of frames saved and the size of the rows file,
+    so that lines written after the last checkpoint are dropped on resume.
+    """
+
+    def __init__(self, path, settings, interval=500, get_state=None):
+        """Initialize the DetectionCheckpoint object.
+        Args:
+        - path: The folder in which the checkpoint files are written.
+        - settings: A JSON-serializable dictionary of the settings of the
+        detection (model, sampling...). A checkpoint saved with other
+        settings is discarded.
+        - interval: The number of frames between two checkpoints.
+        - get_state: An optional function returning a JSON-serializable
+        state saved with each checkpoint, e.g. that of the object tracker
+        after the last saved frame.
+        """
+        self.state_path = os.path.join(path, STATE_FILE_NAME)
+        self.rows_path = os.path.join(path, ROWS_FILE_NAME)
+        # Compare the settings as they are read back from the state file
+        self.settings = json.loads(json.dumps(settings))
+        self.interval = max(1, int(interval))
+        self.get_state = get_state
+        # State saved with the loaded checkpoint
+        self.state = None
+        # Number of frames saved to disk and lines of the frames since
+        self.frames_saved = 0
+        self.rows = []
+
+
+    def load(self):
+        """Load the frames saved by an interrupted detection with the same
+        settings. Any other checkpoint is removed.
+        Returns:
+        - output_arrays: The lists of the objects detected in each saved
+        frame, in frame order (an empty list if there is no checkpoint).
+        """
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if (state is None or state.get("settings") != self.settings
+                or not os.path.isfile(self.rows_path)
+                or os.path.getsize(self.rows_path) < state["size"]):
+            self.remove()
+            return []
+
+        with open(self.rows_path, "rb+") as f:
+            # Drop the lines written after the last checkpoint
+            f.truncate(state["size"])
+            f.seek(0)
+            output_arrays = [json.loads(line) for line in f]
+        if len(output_arrays) != state["frames"]:
+            self.remove()
+            return []
+        self.frames_saved = len(output_arrays)
+        self.state = state.get("state")
+        return output_arrays
+
+
+    def add_frame(self, frame_index, output_array):
+        """Add the objects detected in a frame, saving a checkpoint every
+        `interval` frames. Frames must be added in order; frames restored
+        from the checkpoint are skipped.
+        Args:
+        - frame_index: The index of the frame, starting at 0.
+        - output_array: List of the objects detected in the frame.
+        """
+        if frame_index < self.frames_saved + len(self.rows):
+            return
+        # ImageAI may return NumPy scalars, which JSON can't serialize
+        self.rows.append(
+            json.dumps(output_array, default=lambda value: value.item())
+        )
+        if len(self.rows) >= self.interval:
+            self.save()
+
+
+    def save(self):
+        """Append the frames added since the last checkpoint to the rows
+        file and record them in the state file.
+        """
+        if not self.rows:
+            return
+
+        with open(self.rows_path, "a") as f:
+            f.write("".join(row + "\n" for row in self.rows))
+            f.flush()
+            os.fsync(f.fileno())
+        self.frames_saved += len(self.rows)
+        self.rows = []
+
+        # Replace the state file atomically, so that it is never read ...
+        # ...half-written
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(
+                {
+                    "settings": self.settings,
+                    "frames": self.frames_saved,
+                    "size": os.path.getsize(self.rows_path),
+                    "state": (
+                        self.get_state() if self.get_state is not None
+                        else None
+                    ),
+                },
+                f,
+            )
+        os.replace(temp_path, self.state_path)
+
+
+    def remove(self):
+        """Delete the checkpoint files, e.g. once the detection is complete.
+        """
+        for path in [self.state_path, self.rows_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        self.frames_saved = 0
+        self.rows = []
@@ -0,0 +1,170 @@
+import csv
+import numpy as np
+import pandas as pd
+
+
+
+# Columns of the detected object data
+COLUMNS = ["frames", "objects", "probability"]
+
+
+def format_frame_time(frame_index, frames_per_second):
+    """Function to format the time of a frame as "HH:MM:SS.ffffff".
+    Args:
+    - frame_index: The index of the frame, starting at 0.
+    - frames_per_second: Number of frames per second in the video.
+    Returns:
+    - frame_time: The formatted time of the frame.
+    """
+    # Integer microseconds don't drift like repeatedly added floats
+    microseconds = int(frame_index * 1000000 // frames_per_second)
+    seconds, microseconds = divmod(microseconds, 1000000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{:02d}:{:02d}:{:02d}.{:06d}".format(
+        hours % 24, minutes, seconds, microseconds
+    )
+
+
+def format_frame_times(frame_indexes, frames_per_second):
+    """Function to format the times of many frames as "HH:MM:SS.ffffff" at
+    once, with NumPy integer arithmetic.
+    Args:
+    - frame_indexes: A NumPy array of frame indexes, starting at 0.
+    - frames_per_second: Number of frames per second in the video.
+    Returns:
+    - frame_times: A pandas Series of the formatted times of the frames.
+    """
+    # Format each distinct frame once, as rows of the same frame share it
+    frame_indexes, inverse = np.unique(
+        np.asarray(frame_indexes, dtype=np.int64), return_inverse=True
+    )
+    microseconds = np.floor_divide(
+        frame_indexes * 1000000, frames_per_second
+    ).astype(np.int64)
+    seconds, microseconds = np.divmod(microseconds, 1000000)
+    minutes, seconds = np.divmod(seconds, 60)
+    hours, minutes = np.divmod(minutes, 60)
+
+    def pad(values, width):
+        return pd.Series(values).astype(str).str.zfill(width)
+
+    frame_times = (
+        pad(hours % 24, 2) + ":" + pad(minutes, 2) + ":" + pad(seconds, 2)
+        + "." + pad(microseconds, 6)
+    )
+    return pd.Series(frame_times.to_numpy()[inverse.ravel()])
+
+
+
+class DetectionWriter:
+    """Writer appending detected object rows to a CSV or Parquet file in
+    chunks, so that memory use stays bounded however long the video is.
+    """
+
+    def __init__(self, path, output_format="csv", chunk_size=10000,
+                 track_ids=False):
+        """Initialize the DetectionWriter object.
+        Args:
+        - path: The path to the output file.
+        - output_format: The format of the output file ("csv" or "parquet").
+        Writing Parquet files requires pyarrow.
+        - chunk_size: The number of rows buffered before they are written.
+        - track_ids: If True, the `track_id` of each object, assigned by
+        the object tracker, is written in a "track_id" column.
+        """
+        self.path = path
+        self.output_format = output_format
+        self.chunk_size = chunk_size
+        self.track_ids = track_ids
+        self.columns = COLUMNS + (["track_id"] if track_ids else [])
+        self.rows = []
+        self.rows_written = 0
+
+        if output_format == "csv":
+            self.file = open(path, "w", newline="")
+            self.csv_writer = csv.writer(self.file)
+            self.csv_writer.writerow(self.columns)
+        elif output_format == "parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError(
+                    "pyarrow is required to write Parquet files"
+                )
+            self.schema = pa.schema(
+                [
+                    ("frames", pa.string()),
+                    ("objects", pa.string()),
+                    ("probability", pa.float64()),
+                ]
+                + ([("track_id", pa.int64())] if track_ids else [])
+            )
+            self.parquet_writer = pq.ParquetWriter(path, self.schema)
+        else:
+            raise ValueError(
+                "Unknown output format: {}".format(output_format)
+            )
+
+
+    def write_frame(self, frame_time, objects_per_frame):
+        """Append the rows of one frame.
+        Args:
+        - frame_time: The formatted time of the frame.
+        - objects_per_frame: List of the objects detected in the frame, as
+        returned by ImageAI.
+        """
+        # If any objects are detected in the frame
+        if objects_per_frame:
+            for object in objects_per_frame:
+                self.rows.append(
+                    [
+                        frame_time,
+                        object["name"],
+                        object["percentage_probability"] / 100,
+                    ]
+                    + ([object.get("track_id")] if self.track_ids else [])
+                )
+        # If no object is detected in the frame
+        else:
+            self.rows.append(
+                [frame_time, None, None] + ([None] if self.track_ids else [])
+            )
+
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+
+    def flush(self):
+        """Write the buffered rows to the output file.
+        """
+        if not self.rows:
+            return
+
+        if self.output_format == "csv":
+            self.csv_writer.writerows(self.rows)
+            self.file.flush()
+        else:
+            import pyarrow as pa
+
+            self.parquet_writer.write_table(
+                pa.Table.from_pylist(
+                    [dict(zip(self.columns, row)) for row in self.rows],
+                    schema=self.schema,
+                )
+            )
+
+        self.rows_written += len(self.rows)
+        self.rows = []
+
+
+    def close(self):
+        """Write the remaining rows and close the output file.
+        """
+        self.flush()
+        if self.output_format == "csv":
+            self.file.close()
+        else:
+            self.parquet_writer.close()
+
@@ -0,0 +1,181 @@
+# Intervals of the summary, from the finest to the coarsest
+INTERVALS = ["frame", "second", "minute", "hour"]
+
+
+
+class DetectionSummary:
+    """Single-pass, multi-resolution summary of the detected objects.
+    Detections are counted per frame. When a frame is complete, its counts
+    are rolled up into the current second, completed seconds are rolled up
+    into the current minute, and completed minutes into the current hour.
+    For each interval, only the counts of the current bucket are kept, along
+    with running totals from which the average number of unique objects per
+    interval is derived. The cost is therefore linear in the number of
+    detections, and memory depends on the number of object names only.
+    """
+
+    def __init__(self, frames_per_second):
+        """Initialize the DetectionSummary object.
+        Args:
+        - frames_per_second: Number of frames per second in the video.
+        """
+        self.frames_per_second = frames_per_second
+
+        # Index and counts per object of the current bucket of each ...
+        # ...interval
+        self.current_buckets = {interval: None for interval in INTERVALS}
+        self.current_counts = {interval: {} for interval in INTERVALS}
+        # Total detections and number of buckets in which each object ...
+        # ...appears, per interval
+        self.total_counts = {interval: {} for interval in INTERVALS}
+        self.bucket_counts = {interval: {} for interval in INTERVALS}
+        # Index of the last frame added
+        self.last_frame_index = -1
+
+
+    def get_bucket(self, interval, frame_index):
+        """Get the index of the bucket of an interval containing a frame.
+        Args:
+        - interval: The interval (frame, second, minute, hour).
+        - frame_index: The index of the frame, starting at 0.
+        Returns:
+        - bucket: The index of the bucket.
+        """
+        if interval == "frame":
+            return frame_index
+        second = int(frame_index // self.frames_per_second)
+        if interval == "second":
+            return second
+        if interval == "minute":
+            return second // 60
+        return second // 3600
+
+
+    def add_frame(self, frame_index, objects_per_frame):
+        """Add the objects detected in one frame. Frames must be added in
+        increasing order.
+        Args:
+        - frame_index: The index of the frame, starting at 0.
+        - objects_per_frame: List of the objects detected in the frame, as
+        returned by ImageAI.
+        """
+        # Roll up the buckets completed by this frame, from the finest ...
+        # ...to the coarsest interval
+        for level, interval in enumerate(INTERVALS):
+            bucket = self.get_bucket(interval, frame_index)
+            if bucket == self.current_buckets[interval]:
+                break
+            if self.current_buckets[interval] is not None:
+                self._close_bucket(level)
+            self.current_buckets[interval] = bucket
+
+        counts = self.current_counts["frame"]
+        for object in objects_per_frame or []:
+            counts[object["name"]] = counts.get(object["name"], 0) + 1
+
+        self.last_frame_index = frame_index
+
+
+    def _close_bucket(self, level):
+        """Add the counts of the current bucket of an interval to its totals
+        and to the current bucket of the next coarser interval.
+        Args:
+        - level: The position of the interval in INTERVALS.
+        """
+        interval = INTERVALS[level]
+        counts = self.current_counts[interval]
+        total_counts = self.total_counts[interval]
+        bucket_counts = self.bucket_counts[interval]
+        for name, count in counts.items():
+            total_counts[name] = total_counts.get(name, 0) + count
+            bucket_counts[name] = bucket_counts.get(name, 0) + 1
+
+        if level + 1 < len(INTERVALS):
+            coarser_counts = self.current_counts[INTERVALS[level + 1]]
+            for name, count in counts.items():
+                coarser_counts[name] = coarser_counts.get(name, 0) + count
+
+        self.current_counts[interval] = {}
+
+
+    def _get_totals(self, level):
+        """Get the totals of an interval including the buckets still in
+        progress, without modifying the summary.
+        Args:
+        - level: The position of the interval in INTERVALS.
+        Returns:
+        - total_counts: The total detections of each object.
+        - bucket_counts: The number of buckets in which each object appears.
+        """
+        total_counts = dict(self.total_counts[INTERVALS[level]])
+        bucket_counts = dict(self.bucket_counts[INTERVALS[level]])
+
+        # The current bucket of this interval also contains the counts of ...
+        # ...the current buckets of the finer intervals, not yet rolled up
+        current_counts = {}
+        for finer_level in range(level + 1):
+            for name, count in self.current_counts[
+                INTERVALS[finer_level]
+            ].items():
+                current_counts[name] = current_counts.get(name, 0) + count
+
+        for name, count in current_counts.items():
+            total_counts[name] = total_counts.get(name, 0) + count
+            bucket_counts[name] = bucket_counts.get(name, 0) + 1
+
+        return total_counts, bucket_counts
+
+
+    def averages(self, interval):
+        """Get the average number of unique objects per interval, or the
+        total number of unique objects for the full video.
+        Args:
+        - interval: The interval (frame, second, minute, hour, full).
+        Returns:
+        - counts: A dictionary mapping each object to its average (or total)
+        count.
+        """
+        if interval == "full":
+            # The totals of the coarsest interval cover the full video
+            total_counts, _ = self._get_totals(len(INTERVALS) - 1)
+            return total_counts
+
+        total_counts, bucket_counts = self._get_totals(
+            INTERVALS.index(interval)
+        )
+        return {
+            name: total_counts[name] / bucket_counts[name]
+            for name in total_counts
+        }
+
+
+    def last_bucket(self, interval):
+        """Get the index of the last bucket of an interval, i.e. the length
+        of the video in that unit.
+        Args:
+        - interval: The interval (frame, second, minute, hour).
+        Returns:
+        - bucket: The index of the bucket containing the last frame.
+        """
+        return self.get_bucket(interval, max(0, self.last_frame_index))
+
+
+    def to_dict(self):
+        """Get the compact summary of the detected objects, used both to plot
+        the summary bar charts and by the JSON API.
+        Returns:
+        - summary: A dictionary with the frames per second, the index of the
+        last bucket of each interval, and the average (or total for "full")
+        count of each object per interval.
+        """
+        return {
+            "frames_per_second": self.frames_per_second,
+            "last_buckets": {
+                interval: self.last_bucket(interval)
+                for interval in INTERVALS
+            },
+            "counts": {
+                interval: self.averages(interval)
+                for interval in INTERVALS + ["full"]
+            },
+        }
@@ -0,0 +1,172 @@
+from concurrent.futures import ThreadPoolExecutor
+from image_recognizer import ImageRecognizer
+from metrics import METRICS
+
+
+
+class EnsembleRecognizer:
+    """Classification of the same images with several algorithms in a single
+    pass: each image is decoded once, the decoded pixels are shared by the
+    models, which run concurrently, and their probabilities can be averaged
+    into an ensemble ranking.
+    """
+
+    # Number of predictions of each model averaged into the ensemble ...
+    # ...ranking, labels missing from the predictions of a model counting ...
+    # ...as a probability of 0
+    ENSEMBLE_CANDIDATES = 20
+
+    # execution_path: where the models are saved
+    def __init__(self, execution_path, algorithms,
+                 max_pixels=ImageRecognizer.MAX_PIXELS, backend_options=None):
+        """Initialize the EnsembleRecognizer object.
+        Args:
+        - execution_path: The path where the models are saved.
+        - algorithms: The list of the selected algorithms.
+        - max_pixels: The maximum number of pixels of an image (None for no
+        limit).
+        - backend_options: A dictionary of keyword arguments of
+        inference_backends.use_backend() shared by the models (None to run
+        them with PyTorch).
+        """
+        if not algorithms:
+            raise ValueError("At least one algorithm must be selected")
+        self.algorithms = list(dict.fromkeys(algorithms))
+        self.max_pixels = max_pixels
+        self.recognizers = [
+            ImageRecognizer(
+                execution_path, algorithm, max_pixels=max_pixels,
+                backend_options=backend_options,
+            )
+            for algorithm in self.algorithms
+        ]
+        # Images are decoded once, to the largest size any model needs, ...
+        # ...and each model resizes them to its own input size
+        self.decode_size = max(
+            recognizer.decode_size for recognizer in self.recognizers
+        )
+
+
+    def predict_streams(self, images, image_names=None, n=5, batch_size=None,
+                        cache=None, micro_batch=None, ensemble=True):
+        """Perform image prediction with all algorithms on images that are
+        already in memory.
+        Args:
+        - images: A list of images given as open binary file-like objects,
+        bytes, NumPy arrays (H x W x 3, RGB) or PIL images.
+        - image_names: A list of the names of the images. If None, the images
+        are named by their position in the list.
+        - n: The number of predictions to return for each image input and
+        algorithm.
+        - batch_size: The number of images classified in each forward pass.
+        If None, each image is classified on its own.
+        - cache: An optional ResultCache, shared with ImageRecognizer.
+        - micro_batch: An optional dictionary of keyword arguments of
+        ImageRecognizer.classify_coalesced().
+        - ensemble: If True, the predictions also include the ranking of the
+        labels by their probability averaged over the algorithms.
+        Returns:
+        - predictions_data: A list of dictionaries, one per image, containing
+        the image name, the predictions of each algorithm under "models"
+        and, with `ensemble`, the averaged predictions under "ensemble".
+        """
+        if image_names is None:
+            image_names = [str(i) for i in range(len(images))]
+
+        # Read file-like objects into memory so that they can be both ...
+        # ...hashed and decoded
+        images = [
+            image.read() if hasattr(image, "read") else image
+            for image in images
+        ]
+        # The ensemble averages more predictions than are displayed
+        top = max(n, self.ENSEMBLE_CANDIDATES) if ensemble else n
+
+        # Look up the cache of each model before decoding anything, so ...
+        # ...that only the images missing for some model are decoded
+        hashes = None
+        cached = [None] * len(self.recognizers)
+        missing = range(len(images))
+        if cache is not None:
+            hashes = [ImageRecognizer.hash_image(image) for image in images]
+            cached = [
+                recognizer.get_cached_results(hashes, top, cache)
+                for recognizer in self.recognizers
+            ]
+            missing = sorted(set(
+                i
+                for results, _ in cached
+                for i, result in enumerate(results)
+                if result is None
+            ))
+
+        # Decode each of these images once for all models
+        decoded_images = list(images)
+        with METRICS.timer("decode_images"):
+            for i in missing:
+                decoded_images[i] = ImageRecognizer.decode_image(
+                    images[i], self.decode_size, self.max_pixels
+                )
+
+        # Classify the images with each model on its own thread
+        with ThreadPoolExecutor(max_workers=len(self.recognizers)) as pool:
+            model_results = list(pool.map(
+                lambda recognizer, cached_results: (
+                    recognizer.classify_images(
+                        decoded_images, hashes, n=top,
+                        batch_size=batch_size, cache=cache,
+                        micro_batch=micro_batch, cached=cached_results,
+                    )
+                ),
+                self.recognizers,
+                cached,
+            ))
+
+        predictions_data = []
+        for i, image_name in enumerate(image_names):
+            results = [classified[i] for classified in model_results]
+            predictions_per_image = {
+                "image": image_name,
+                "models": [
+                    {
+                        "algorithm": algorithm,
+                        "predictions": ImageRecognizer.format_predictions(
+                            image_name, predictions[:n], probabilities[:n]
+                        )["predictions"],
+                    }
+                    for algorithm, (predictions, probabilities)
+                    in zip(self.algorithms, results)
+                ],
+            }
+            if ensemble:
+                predictions_per_image["ensemble"] = (
+                    ImageRecognizer.format_predictions(
+                        image_name, *self.average_predictions(results, n)
+                    )["predictions"]
+                )
+            predictions_data.append(predictions_per_image)
+
+        return predictions_data
+
+
+    @staticmethod
+    def average_predictions(results, n=5):
+        """Rank labels by their probability averaged over several models.
+        Args:
+        - results: A list of (predictions, probabilities) tuples, one per
+        model, for the same image.
+        - n: The number of predictions to return.
+        Returns:
+        - predictions: A list of the top-n labels.
+        - probabilities: A list of their averaged probabilities.
+        """
+        totals = {}
+        for predictions, probabilities in results:
+            for label, probability in zip(predictions, probabilities):
+                totals[label] = totals.get(label, 0.0) + probability
+
+        ranking = sorted(totals.items(), key=lambda item: -item[1])[:n]
+        return (
+            [label for label, _ in ranking],
+            [total / len(results) for _, total in ranking],
+        )
@@ -0,0 +1,271 @@
+"""Offline export of the classification and detection models for the
+inference engines of inference_backends.py.
+
+For each model whose weights are in models/, it writes next to the weights
+file, e.g. for yolov3.pt:
+- yolov3.torchscript.pt: the model traced with TorchScript.
+- yolov3.onnx: the model exported to ONNX.
+- yolov3.int8-dynamic.onnx: the ONNX model with int8 weights, whose
+activations are quantized at run time.
+- yolov3.int8-static.onnx: the ONNX model with int8 weights and
+activations, calibrated on the images of files_for_testing/ (frames of
+traffic.mp4 for the detection models).
+Exporting to ONNX requires the onnx and onnxruntime packages. RetinaNet is
+not exported and always runs with PyTorch.
+
+Usage:
+    python export_models.py [--algorithms ResNet50 ...] [--models YOLOv3 ...]
+        [--formats torchscript onnx dynamic static]
+"""
+import os
+import inspect
+import argparse
+import contextlib
+import cv2
+import torch
+from image_recognizer import ImageRecognizer
+from video_object_detector import VideoObjectDetector
+from video_engine import get_image_detector
+from inference_backends import get_export_path
+
+
+# Default paths to the models and calibration files
+IMAGE_MODELS_PATH = os.path.join(
+    os.path.join(os.getcwd(), "models"), "image-prediction-models"
+)
+VIDEO_MODELS_PATH = os.path.join(
+    os.path.join(os.getcwd(), "models"), "video-object-detection-models"
+)
+FILES_PATH = os.path.join(os.getcwd(), "files_for_testing")
+
+# Formats of the exported models
+FORMATS = ["torchscript", "onnx", "dynamic", "static"]
+
+# Size of the input images of the YOLOv3 models, fixed by ImageAI
+YOLO_INPUT_SIZE = 416
+
+
+def get_classification_inputs(recognizer, files_path):
+    """Function to preprocess the images of a folder for an algorithm, as
+    example and calibration inputs.
+    Args:
+    - recognizer: The ImageRecognizer of the algorithm.
+    - files_path: The folder containing the images.
+    Returns:
+    - inputs: A list of input tensors of shape (1, 3, size, size).
+    """
+    return [
+        recognizer.preprocess(recognizer.decode_image(
+            os.path.join(files_path, file_name), recognizer.decode_size
+        )).unsqueeze(0)
+        for file_name in sorted(os.listdir(files_path))
+        if file_name.split(".")[-1].lower() in ["jpg", "jpeg", "png"]
+    ]
+
+
+def get_detection_inputs(video_path, frames=16, step=10):
+    """Function to preprocess frames of a video the same way ImageAI does
+    for the YOLOv3 models, as example and calibration inputs.
+    Args:
+    - video_path: The path to the video.
+    - frames: The number of frames.
+    - step: The number of frames between two selected frames.
+    Returns:
+    - inputs: A list of input tensors of shape (1, 3, 416, 416).
+    """
+    from imageai.yolov3.utils import prepare_image
+
+    inputs = []
+    video = cv2.VideoCapture(video_path)
+    frame_index = 0
+    while len(inputs) < frames:
+        ret, frame = video.read()
+        if not ret:
+            break
+        if frame_index % step == 0:
+            inputs.append(
+                prepare_image(frame, (YOLO_INPUT_SIZE, YOLO_INPUT_SIZE))
+            )
+        frame_index += 1
+    video.release()
+    return inputs
+
+
+@contextlib.contextmanager
+def traceable_detection_layers():
+    """Context manager making the detection layers of ImageAI's YOLOv3
+    models traceable. They transform the detached `x.data` of their input,
+    so a traced model would return the constant output of the example
+    input. Inside the context, they transform `x` instead.
+    """
+    from imageai.yolov3.yolov3 import DetectionLayer
+    from imageai.yolov3.utils import transform_prediction
+
+    def forward(self, x):
+        self.layer_height, self.layer_width = x.shape[2], x.shape[3]
+        self.stride = self.height // self.layer_height
+        return transform_prediction(
+            x, self.width, self.anchors, self.num_classes, self.device
+        )
+
+    imageai_forward = DetectionLayer.forward
+    DetectionLayer.forward = forward
+    try:
+        yield
+    finally:
+        DetectionLayer.forward = imageai_forward
+
+
+def export_model(model, inputs, weights_path, formats, dynamic_batch):
+    """Function to export a PyTorch model to the given formats.
+    Args:
+    - model: The PyTorch model.
+    - inputs: A list of input tensors, the first one used as example input
+    and all of them to calibrate the static quantization.
+    - weights_path: The path to the weights file of the model, next to
+    which the exported models are written.
+    - formats: A list of formats ("torchscript", "onnx", "dynamic" and/or
+    "static").
+    - dynamic_batch: If True, the ONNX model accepts batches of any size.
+    Otherwise, it only accepts batches of the size of the example input.
+    Returns:
+    - export_paths: The list of the paths of the exported models.
+    """
+    model.eval()
+    export_paths = []
+
+    if "torchscript" in formats:
+        export_path = get_export_path(weights_path, "torchscript")
+        with torch.no_grad():
+            torch.jit.trace(model, inputs[0]).save(export_path)
+        export_paths.append(export_path)
+
+    # The quantized models are derived from the fp32 ONNX model, which is ...
+    # ...removed afterwards unless it was requested or already there
+    onnx_path = get_export_path(weights_path, "onnxruntime")
+    keep_onnx = "onnx" in formats or os.path.exists(onnx_path)
+    if set(formats) & {"onnx", "dynamic", "static"}:
+        # The models are traced by the TorchScript-based exporter, the ...
+        # ...default one of the older versions of PyTorch
+        export_options = (
+            {"dynamo": False}
+            if "dynamo" in inspect.signature(torch.onnx.export).parameters
+            else {}
+        )
+        torch.onnx.export(
+            model,
+            inputs[0],
+            onnx_path,
+            input_names=["input"],
+            output_names=["output"],
+            dynamic_axes=(
+                {"input": {0: "batch"}, "output": {0: "batch"}}
+                if dynamic_batch else None
+            ),
+            opset_version=13,
+            **export_options
+        )
+        export_paths.append(onnx_path)
+
+    if "dynamic" in formats:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        export_path = get_export_path(weights_path, "onnxruntime", "dynamic")
+        quantize_dynamic(onnx_path, export_path, weight_type=QuantType.QInt8)
+        export_paths.append(export_path)
+
+    if "static" in formats:
+        from onnxruntime.quantization import (
+            CalibrationDataReader,
+            QuantFormat,
+            QuantType,
+            quantize_static,
+        )
+
+        class InputReader(CalibrationDataReader):
+            # Feed the calibration inputs to the quantizer one by one
+            def __init__(self):
+                self.inputs = iter(inputs)
+
+            def get_next(self):
+                tensor = next(self.inputs, None)
+                return (
+                    None if tensor is None else {"input": tensor.numpy()}
+                )
+
+        export_path = get_export_path(weights_path, "onnxruntime", "static")
+        quantize_static(
+            onnx_path,
+            export_path,
+            InputReader(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+        export_paths.append(export_path)
+
+    if not keep_onnx and onnx_path in export_paths:
+        os.remove(onnx_path)
+        export_paths.remove(onnx_path)
+    return export_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--algorithms", nargs="+",
+                        default=list(ImageRecognizer.MODELS))
+    parser.add_argument("--models", nargs="+",
+                        default=VideoObjectDetector.EXPORTABLE_MODELS)
+    parser.add_argument("--formats", nargs="+", default=FORMATS,
+                        choices=FORMATS)
+    parser.add_argument("--files", default=FILES_PATH,
+                        help="folder of the calibration images and video")
+    args = parser.parse_args()
+
+    for algorithm in args.algorithms:
+        weights_path = os.path.join(
+            IMAGE_MODELS_PATH, ImageRecognizer.MODELS[algorithm]
+        )
+        if not os.path.isfile(weights_path):
+            print("Skipping {}: {} not found".format(algorithm, weights_path))
+            continue
+        recognizer = ImageRecognizer(IMAGE_MODELS_PATH, algorithm)
+        for export_path in export_model(
+            recognizer.prediction._ImageClassification__model,
+            get_classification_inputs(recognizer, args.files),
+            weights_path,
+            args.formats,
+            dynamic_batch=True,
+        ):
+            print("{}: {}".format(algorithm, export_path))
+
+    for model in args.models:
+        weights_path = os.path.join(
+            VIDEO_MODELS_PATH, VideoObjectDetector.MODELS[model]
+        )
+        if model not in VideoObjectDetector.EXPORTABLE_MODELS:
+            print("Skipping {}: only run with PyTorch".format(model))
+            continue
+        if not os.path.isfile(weights_path):
+            print("Skipping {}: {} not found".format(model, weights_path))
+            continue
+        detector = VideoObjectDetector.load_model(VIDEO_MODELS_PATH, model)
+        # The pipelined engine passes micro-batches of frames to the ...
+        # ...detection models
+        with traceable_detection_layers():
+            export_paths = export_model(
+                get_image_detector(detector)._ObjectDetection__model,
+                get_detection_inputs(
+                    os.path.join(args.files, "traffic.mp4")
+                ),
+                weights_path,
+                args.formats,
+                dynamic_batch=True,
+            )
+        for export_path in export_paths:
+            print("{}: {}".format(model, export_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,16 @@
 from imageai.Classification import ImageClassification
 import os
+import io
 import glob
+import numpy as np
+import torch
+from torchvision import transforms
+from PIL import Image
+from model_registry import MODEL_REGISTRY
+from result_cache import content_hash
+from metrics import METRICS
+from micro_batcher import get_micro_batcher
+from inference_backends import get_export_path, use_backend
 
 
 
@@ -13,76 +23,511 @@ class ImageRecognizer:
         "DenseNet121": "densenet121-a639ec97.pth",
     }
 
+    # Dictionary mapping algorithms to the size images are resized and ...
+    # ...cropped to, matching ImageAI's preprocessing
+    INPUT_SIZES = {
+        "ResNet50": 224,
+        "MobileNetV2": 224,
+        "InceptionV3": 224,
+        "DenseNet121": 224,
+    }
+
+    # ImageNet mean and standard deviation used to normalize images
+    MEAN = [0.485, 0.456, 0.406]
+    STD = [0.229, 0.224, 0.225]
+
+    # Maximum number of pixels of an image, larger images being rejected ...
+    # ...as decompression bombs before they are decoded
+    MAX_PIXELS = 64 * 1000 * 1000
+
     # execution_path: where the models are saved
-    def __init__(self, execution_path, algorithm):
+    def __init__(self, execution_path, algorithm, max_pixels=MAX_PIXELS,
+                 backend_options=None):
         """Initialize the ImageRecognizer object.
         Args:
         - execution_path: The path where the models are saved.
         - algorithm: The selected algorithm for image recognition.
+        - max_pixels: The maximum number of pixels of an image (None for no
+        limit).
+        - backend_options: A dictionary of keyword arguments of
+        inference_backends.use_backend(), e.g. {"backend": "onnxruntime",
+        "quantization": "dynamic", "intra_op_threads": 4} (None to run the
+        model with PyTorch).
         """
-        self.prediction = ImageClassification()
-
-        # Set the model type based on the selected algorithm
-        if algorithm == "ResNet50":
-            self.prediction.setModelTypeAsResNet50()
-        if algorithm == "MobileNetV2":
-            self.prediction.setModelTypeAsMobileNetV2()
-        if algorithm == "InceptionV3":
-            self.prediction.setModelTypeAsInceptionV3()
-        if algorithm == "DenseNet121":
-            self.prediction.setModelTypeAsDenseNet121()
-
-        # Set the model path based on the execution path and selected algorithm
-        self.prediction.setModelPath(
-            os.path.join(execution_path, self.MODELS[algorithm])
+        self.algorithm = algorithm
+        self.max_pixels = max_pixels
+        self.backend_options = backend_options or {}
+
+        # Get the loaded model shared by all requests
+        self.prediction = self.load_model(
+            execution_path, algorithm, self.backend_options
+        )
+
+        # Resize, crop and normalize images the same way ImageAI does ...
+        # ...before classification
+        size = self.INPUT_SIZES[algorithm]
+        # Images are decoded straight to this size of their shortest side
+        self.decode_size = int(size * 256 / 224)
+        self.transform = transforms.Compose(
+            [
+                transforms.Resize(self.decode_size),
+                transforms.CenterCrop(size),
+                transforms.ToTensor(),
+                transforms.Normalize(self.MEAN, self.STD),
+            ]
         )
 
-        # Load the model
-        self.prediction.loadModel()
 
+    @classmethod
+    def load_model(cls, execution_path, algorithm, backend_options=None):
+        """Return the loaded model for the selected algorithm from the model
+        registry, loading it the first time it is requested.
+        Args:
+        - execution_path: The path where the models are saved.
+        - algorithm: The selected algorithm for image recognition.
+        - backend_options: A dictionary of keyword arguments of
+        inference_backends.use_backend() (None to run the model with
+        PyTorch).
+        Returns:
+        - prediction: The loaded ImageClassification object.
+        """
+        backend_options = backend_options or {}
+        weights_path = os.path.join(execution_path, cls.MODELS[algorithm])
+        # Each exported model is stored and sized under its own path
+        model_path = get_export_path(
+            weights_path,
+            backend_options.get("backend", "torch"),
+            backend_options.get("quantization"),
+        )
+
+        def loader():
+            prediction = ImageClassification()
 
-    def predict(self, images_path, image_extensions=["jpg"], n=5):
+            # Set the model type based on the selected algorithm
+            if algorithm == "ResNet50":
+                prediction.setModelTypeAsResNet50()
+            if algorithm == "MobileNetV2":
+                prediction.setModelTypeAsMobileNetV2()
+            if algorithm == "InceptionV3":
+                prediction.setModelTypeAsInceptionV3()
+            if algorithm == "DenseNet121":
+                prediction.setModelTypeAsDenseNet121()
+
+            # Set the model path based on the execution path and selected ...
+            # ...algorithm
+            prediction.setModelPath(weights_path)
+
+            # Load the model
+            prediction.loadModel()
+
+            # Run the model with the selected inference engine
+            use_backend(
+                prediction, "_ImageClassification__model", weights_path,
+                **backend_options
+            )
+            return prediction
+
+        return MODEL_REGISTRY.get(
+            (cls.__name__, algorithm, model_path), loader, model_path
+        )
+
+
+    def predict(self, images_path, image_extensions=["jpg"], n=5,
+                batch_size=None):
         """Perform image prediction on the given images.
         Args:
         - images_path: The path to the folder containing the uploaded images.
         - image_extensions: A list of image file extensions to consider.
         - n: The number of predictions to return for each image input.
+        - batch_size: The number of images classified in each forward pass.
+        If None, each image is classified on its own.
         Returns:
         - predictions_data: A list of dictionaries containing the predictions
         for each image.
         """
+        # Get the paths of the images in the folder with the given extensions
+        image_paths = []
+        for image_extension in image_extensions:
+            image_paths.extend(
+                glob.glob(os.path.join(images_path, "*." + image_extension))
+            )
+
+        # Decode all images close to the input size of the model and ...
+        # ...classify them in batches
+        images = [
+            self.decode_image(image, self.decode_size, self.max_pixels)
+            for image in image_paths
+        ]
+        results = self.classify_batch(images, n=n, batch_size=batch_size or 1)
+
         predictions_data = []
+        for image, (predictions, probabilities) in zip(image_paths, results):
+            # Add the predictions for the image to the overall ...
+            # ...predictions_data list
+            predictions_data.append(
+                self.format_predictions(
+                    os.path.basename(image), predictions, probabilities
+                )
+            )
 
-        # Iterate over each image extension
-        for image_extension in image_extensions:
-            # Iterate over each image file in the folder with the given ...
-            # ...extension
-            for image in glob.glob(
-                os.path.join(images_path, "*." + image_extension)
-            ):
-                image_name = os.path.basename(image)
-                predictions_per_image = {
-                    "image": image_name, "predictions": []
-                }
+        # Return the predictions for all uploaded images
+        return predictions_data
+
+
+    def predict_streams(self, images, image_names=None, n=5, batch_size=None,
+                        cache=None, micro_batch=None):
+        """Perform image prediction on images that are already in memory,
+        without writing them to disk.
+        Args:
+        - images: A list of images given as open binary file-like objects,
+        bytes, NumPy arrays (H x W x 3, RGB) or PIL images.
+        - image_names: A list of the names of the images. If None, the images
+        are named by their position in the list.
+        - n: The number of predictions to return for each image input.
+        - batch_size: The number of images classified in each forward pass.
+        If None, each image is classified on its own.
+        - cache: An optional ResultCache. Images whose content was already
+        classified with the same algorithm and n are not classified again.
+        - micro_batch: An optional dictionary of keyword arguments of
+        classify_coalesced(), e.g. {"max_batch_size": 32, "max_wait":
+        0.005}, to classify the images in batches shared with concurrent
+        requests instead of `batch_size` batches of their own.
+        Returns:
+        - predictions_data: A list of dictionaries containing the predictions
+        for each image.
+        """
+        if image_names is None:
+            image_names = [str(i) for i in range(len(images))]
+
+        # Read file-like objects into memory so that they can be both ...
+        # ...hashed and decoded
+        images = [
+            image.read() if hasattr(image, "read") else image
+            for image in images
+        ]
+
+        hashes = (
+            [self.hash_image(image) for image in images]
+            if cache is not None else None
+        )
+        results = self.classify_images(
+            images, hashes, n=n, batch_size=batch_size, cache=cache,
+            micro_batch=micro_batch,
+        )
 
-                # Perform image classification and get the predictions and ...
-                # ...probabilities
-                predictions, probabilities = self.prediction.classifyImage(
-                    image, result_count=n
+        # Return the predictions for all images
+        return [
+            self.format_predictions(image_name, predictions, probabilities)
+            for image_name, (predictions, probabilities)
+            in zip(image_names, results)
+        ]
+
+
+    def get_cached_results(self, hashes, n, cache):
+        """Get the results of the images that were already classified from
+        the cache.
+        Args:
+        - hashes: A list of the content hashes of the images.
+        - n: The number of predictions of each image.
+        - cache: A ResultCache.
+        Returns:
+        - results: A list of (predictions, probabilities) tuples, one per
+        image, None for the images that are not in the cache.
+        - keys: The cache keys of the images.
+        """
+        keys = [
+            cache.make_key(
+                image_hash, self.algorithm, n,
+                self.backend_options.get("backend", "torch"),
+                self.backend_options.get("quantization"),
+            )
+            for image_hash in hashes
+        ]
+        results = []
+        for key in keys:
+            cached = cache.get(key)
+            results.append(
+                (cached["predictions"], cached["probabilities"])
+                if cached is not None else None
+            )
+        return results, keys
+
+
+    def classify_images(self, images, hashes=None, n=5, batch_size=None,
+                        cache=None, micro_batch=None, cached=None):
+        """Classify in-memory images, encoded or already decoded, getting the
+        results of the images that were already classified from the cache.
+        Args:
+        - images: A list of images given as bytes, NumPy arrays (H x W x 3,
+        RGB) or PIL images.
+        - hashes: A list of the content hashes of the images, the keys of
+        their results in the cache. Only used with a cache.
+        - n: The number of predictions to return for each image.
+        - batch_size: The number of images classified in each forward pass.
+        If None, each image is classified on its own.
+        - cache: An optional ResultCache.
+        - micro_batch: An optional dictionary of keyword arguments of
+        classify_coalesced().
+        - cached: The results and keys returned by get_cached_results(), if
+        the cache was already looked up.
+        Returns:
+        - results: A list of (predictions, probabilities) tuples, one per
+        image.
+        """
+        # Get the cached results of the images that were already classified
+        results = [None] * len(images)
+        if cache is not None:
+            if cached is None:
+                cached = self.get_cached_results(hashes, n, cache)
+            results, keys = list(cached[0]), cached[1]
+
+        # Decode the other images, unless they already are, and classify ...
+        # ...them in batches
+        missing = [i for i, result in enumerate(results) if result is None]
+        with METRICS.timer("decode_images"):
+            decoded_images = [
+                self.decode_image(images[i], self.decode_size,
+                                  self.max_pixels)
+                for i in missing
+            ]
+        if micro_batch:
+            classified = self.classify_coalesced(
+                decoded_images, n=n, **micro_batch
+            )
+        else:
+            classified = self.classify_batch(
+                decoded_images, n=n, batch_size=batch_size or 1
+            )
+        for i, result in zip(missing, classified):
+            results[i] = result
+            if cache is not None:
+                cache.put(
+                    keys[i],
+                    {"predictions": result[0], "probabilities": result[1]},
                 )
 
-                # Get prediction data for the image
-                for pred, prob in zip(predictions, probabilities):
-                    predictions_per_image["predictions"].append(
-                        {
-                            "label": pred,
-                            "probability": round(prob, 2),
-                        }
-                    )
+        return results
 
-                # Add the predictions for the image to the overall ...
-                # ...predictions_data list
-                predictions_data.append(predictions_per_image)
 
-        # Return the predictions for all uploaded images
-        return predictions_data
+    @staticmethod
+    def hash_image(image):
+        """Compute the SHA-256 hash of the content of an in-memory image.
+        Args:
+        - image: Bytes, a NumPy array or a PIL image.
+        Returns:
+        - hex_digest: The SHA-256 hash as a hexadecimal string.
+        """
+        if isinstance(image, Image.Image):
+            header = "{}{}".format(image.mode, image.size)
+            return content_hash(header.encode("utf-8") + image.tobytes())
+        if isinstance(image, np.ndarray):
+            header = "{}{}".format(image.dtype, image.shape)
+            return content_hash(
+                header.encode("utf-8")
+                + np.ascontiguousarray(image).tobytes()
+            )
+        return content_hash(bytes(image))
+
+
+    @staticmethod
+    def decode_image(image, size=None, max_pixels=None):
+        """Decode an image into a PIL image in RGB mode. Encoded images are
+        checked against `max_pixels` from their header, before any pixel is
+        decoded. JPEG images are then decoded at a reduced scale (1/2, 1/4
+        or 1/8) and all images are downscaled so that their shortest side
+        is `size`, so that large photos are never held at full resolution.
+        Args:
+        - image: A file path, an open binary file-like object, bytes, a
+        NumPy array (H x W x 3, RGB) or a PIL image.
+        - size: The size of the shortest side of the decoded image (None to
+        keep the original size). Smaller images are not upscaled.
+        - max_pixels: The maximum number of pixels of an encoded image (None
+        for no limit).
+        Returns:
+        - image: The decoded PIL image in RGB mode.
+        Raises:
+        - ValueError: If the image has more than `max_pixels` pixels.
+        """
+        if isinstance(image, Image.Image):
+            # Images decoded once and shared by several models are not copied
+            return image if image.mode == "RGB" else image.convert("RGB")
+        if isinstance(image, np.ndarray):
+            return Image.fromarray(image).convert("RGB")
+        if isinstance(image, (bytes, bytearray)):
+            image = io.BytesIO(image)
+
+        # Only the header is read when the image is opened
+        try:
+            image = Image.open(image)
+        except Image.DecompressionBombError as error:
+            raise ValueError(str(error))
+        width, height = image.size
+        if max_pixels and width * height > max_pixels:
+            raise ValueError(
+                "The image has {} x {} pixels, more than the limit of {} "
+                "pixels".format(width, height, max_pixels)
+            )
+
+        if size:
+            # Let the JPEG decoder scale the image down while decoding, ...
+            # ...keeping both sides at least `size`
+            image.draft("RGB", (size, size))
+        image = image.convert("RGB")
+
+        width, height = image.size
+        if size and min(width, height) > size:
+            # Downscale the image so that its shortest side is `size`, ...
+            # ...reducing it by an integer factor first
+            scale = size / min(width, height)
+            image = image.resize(
+                (max(size, round(width * scale)),
+                 max(size, round(height * scale))),
+                Image.BILINEAR,
+                reducing_gap=2.0,
+            )
+        return image
+
+
+    @staticmethod
+    def format_predictions(image_name, predictions, probabilities):
+        """Build the prediction data of one image.
+        Args:
+        - image_name: The name of the image.
+        - predictions: A list of the predicted labels.
+        - probabilities: A list of the probabilities of the predicted labels.
+        Returns:
+        - predictions_per_image: A dictionary containing the image name and its
+        predictions.
+        """
+        predictions_per_image = {"image": image_name, "predictions": []}
+
+        # Get prediction data for the image
+        for pred, prob in zip(predictions, probabilities):
+            predictions_per_image["predictions"].append(
+                {
+                    "label": pred,
+                    "probability": round(prob, 2),
+                }
+            )
+
+        return predictions_per_image
+
+
+    def preprocess(self, image):
+        """Preprocess an image for classification.
+        Args:
+        - image: A PIL image in RGB mode.
+        Returns:
+        - tensor: The preprocessed image tensor of shape (3, size, size).
+        """
+        return self.transform(image)
+
+
+    @METRICS.timer("classify")
+    def classify_batch(self, images, n=5, batch_size=16):
+        """Classify images in batches with one forward pass per batch.
+        Args:
+        - images: A list of PIL images in RGB mode.
+        - n: The number of predictions to return for each image.
+        - batch_size: The number of images classified in each forward pass.
+        Returns:
+        - results: A list of (predictions, probabilities) tuples, one per
+        image, in the same format as ImageAI's classifyImage.
+        """
+        results = []
+        for start in range(0, len(images), batch_size):
+            results.extend(self.classify_tensors(
+                [self.preprocess(image)
+                 for image in images[start:start + batch_size]],
+                n=n,
+            ))
+
+        return results
+
+
+    def classify_tensors(self, tensors, n=5):
+        """Classify preprocessed images in one forward pass.
+        Args:
+        - tensors: A list of preprocessed image tensors.
+        - n: The number of predictions to return for each image.
+        Returns:
+        - results: A list of (predictions, probabilities) tuples, one per
+        image, in the same format as ImageAI's classifyImage.
+        """
+        # ImageAI does not expose its model, classes and device publicly
+        model = self.prediction._ImageClassification__model
+        classes = self.prediction._ImageClassification__classes
+        device = self.prediction._ImageClassification__device
+
+        # Stack the preprocessed images into one tensor
+        batch = torch.stack(tensors).to(device)
+
+        with torch.no_grad():
+            output = model(batch)
+        probabilities = torch.softmax(output, dim=1)
+        top_probabilities, top_class_ids = torch.topk(
+            probabilities, min(n, probabilities.shape[1])
+        )
+
+        # Get the top-n labels and probabilities (in percent) of each image
+        return [
+            (
+                [classes[class_id] for class_id in class_ids],
+                [round(prob * 100, 4) for prob in probs],
+            )
+            for probs, class_ids in zip(top_probabilities.tolist(),
+                                        top_class_ids.tolist())
+        ]
+
+
+    def classify_coalesced(self, images, n=5, max_batch_size=32,
+                           max_wait=0.005):
+        """Classify images in batches shared with the concurrent requests
+        using the same algorithm. The images are preprocessed on the calling
+        thread, then queued on the micro-batcher of the algorithm, which
+        runs one forward pass per batch of up to `max_batch_size` images or
+        after `max_wait` seconds.
+        Args:
+        - images: A list of PIL images in RGB mode.
+        - n: The number of predictions to return for each image.
+        - max_batch_size: The maximum number of images of a batch.
+        - max_wait: The maximum time, in seconds, an image waits for images
+        of other requests.
+        Returns:
+        - results: A list of (predictions, probabilities) tuples, one per
+        image, in the same format as ImageAI's classifyImage.
+        """
+        # Only images run with the same model and engine share a batch
+        name = ":".join(
+            [self.algorithm, self.backend_options.get("backend", "torch")]
+            + [self.backend_options.get("quantization") or "fp32"]
+        )
+        batcher = get_micro_batcher(
+            name, self.classify_items,
+            max_batch_size=max_batch_size, max_wait=max_wait,
+        )
+        return batcher.submit(
+            [(self, self.preprocess(image), n) for image in images]
+        )
+
+
+    @staticmethod
+    @METRICS.timer("classify")
+    def classify_items(items):
+        """Classify the images of a micro-batch, which may come from
+        requests asking for different numbers of predictions.
+        Args:
+        - items: A list of (ImageRecognizer, tensor, n) tuples with the same
+        algorithm.
+        Returns:
+        - results: A list of (predictions, probabilities) tuples, one per
+        item.
+        """
+        results = items[0][0].classify_tensors(
+            [tensor for _, tensor, _ in items],
+            n=max(n for _, _, n in items),
+        )
+        return [
+            (predictions[:n], probabilities[:n])
+            for (_, _, n), (predictions, probabilities) in zip(items, results)
+        ]
@@ -0,0 +1,149 @@
+import os
+import torch
+
+
+
+# Engines running the models at inference time
+BACKENDS = ["torch", "torchscript", "onnxruntime"]
+
+# Int8 quantization modes of the models exported to ONNX
+QUANTIZATION_MODES = ["dynamic", "static"]
+
+
+def get_export_path(weights_path, backend="torch", quantization=None):
+    """Function to get the path of the model exported from a weights file
+    for an inference engine.
+    Args:
+    - weights_path: The path to the PyTorch weights file.
+    - backend: The inference engine ("torch", "torchscript" or
+    "onnxruntime").
+    - quantization: The int8 quantization mode of the ONNX model
+    ("dynamic" or "static"), or None for the fp32 model.
+    Returns:
+    - export_path: The path to the exported model, e.g.
+    "yolov3.int8-dynamic.onnx", or the weights file for "torch".
+    """
+    if backend not in BACKENDS:
+        raise ValueError("Unknown inference backend: {}".format(backend))
+    if quantization is not None and backend != "onnxruntime":
+        raise ValueError("Quantized models are only run with onnxruntime")
+    if quantization is not None and quantization not in QUANTIZATION_MODES:
+        raise ValueError("Unknown quantization mode: {}".format(quantization))
+
+    if backend == "torch":
+        return weights_path
+    base_path = os.path.splitext(weights_path)[0]
+    if backend == "torchscript":
+        return base_path + ".torchscript.pt"
+    if quantization is not None:
+        return base_path + ".int8-" + quantization + ".onnx"
+    return base_path + ".onnx"
+
+
+def configure_threads(intra_op_threads=None, inter_op_threads=None):
+    """Function to set the number of threads PyTorch uses within and across
+    operators. The number of inter-op threads can only be set before the
+    first parallel work of the process, so later changes are ignored.
+    Args:
+    - intra_op_threads: The number of threads within an operator (None to
+    keep the default).
+    - inter_op_threads: The number of threads running independent operators
+    in parallel (None to keep the default).
+    """
+    if intra_op_threads:
+        torch.set_num_threads(intra_op_threads)
+    if (inter_op_threads
+            and inter_op_threads != torch.get_num_interop_threads()):
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            pass
+
+
+
+class OnnxRuntimeModel(torch.nn.Module):
+    """Module running a model exported to ONNX with ONNX Runtime on CPU, in
+    place of the PyTorch model of an ImageAI object. It takes and returns
+    tensors, so ImageAI's preprocessing and postprocessing are unchanged.
+    """
+
+    def __init__(self, path, intra_op_threads=None, inter_op_threads=None):
+        """Initialize the OnnxRuntimeModel object.
+        Args:
+        - path: The path to the ONNX model.
+        - intra_op_threads: The number of threads within an operator (None
+        to let ONNX Runtime choose).
+        - inter_op_threads: The number of threads running independent
+        operators in parallel (None to run the operators sequentially).
+        """
+        super().__init__()
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+            options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        self.session = onnxruntime.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+
+    def forward(self, x):
+        # The exported models take and return batches of any size
+        outputs = [
+            torch.from_numpy(output)
+            for output in self.session.run(
+                None, {self.input_name: x.detach().cpu().numpy()}
+            )
+        ]
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+
+
+def use_backend(
+    imageai_object,
+    attribute,
+    weights_path,
+    backend="torch",
+    quantization=None,
+    intra_op_threads=None,
+    inter_op_threads=None,
+):
+    """Function to run the model of a loaded ImageAI object with an
+    inference engine, by swapping its PyTorch model for the model exported
+    by export_models.py.
+    Args:
+    - imageai_object: The loaded ImageClassification or ObjectDetection
+    object.
+    - attribute: The name of the private attribute holding its model, e.g.
+    "_ImageClassification__model".
+    - weights_path: The path to the PyTorch weights file of the model.
+    - backend: The inference engine ("torch", "torchscript" or
+    "onnxruntime").
+    - quantization: The int8 quantization mode of the ONNX model
+    ("dynamic" or "static"), or None for the fp32 model.
+    - intra_op_threads: The number of threads within an operator.
+    - inter_op_threads: The number of threads running independent operators
+    in parallel.
+    """
+    export_path = get_export_path(weights_path, backend, quantization)
+    configure_threads(intra_op_threads, inter_op_threads)
+    if backend == "torch":
+        return
+    if not os.path.isfile(export_path):
+        raise FileNotFoundError(
+            "{} not found, export the model with export_models.py "
+            "first".format(export_path)
+        )
+
+    if backend == "torchscript":
+        model = torch.jit.load(export_path, map_location="cpu")
+    else:
+        model = OnnxRuntimeModel(
+            export_path, intra_op_threads, inter_op_threads
+        )
+    model.eval()
+    setattr(imageai_object, attribute, model)
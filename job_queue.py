@@ -0,0 +1,398 @@
+import os
+import sys
+import glob
+import json
+import time
+import uuid
+import sqlite3
+import importlib
+import traceback
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from work_directories import publish_work_dir, remove_work_dir
+from metrics import METRICS
+
+
+
+# Statuses of a job
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Number of seconds between two updates of a running job, so that jobs ...
+# ...whose worker died can be told from jobs still running
+HEARTBEAT_INTERVAL = 10
+
+
+def connect(db_path):
+    """Function to open a connection to the SQLite job store, creating the
+    jobs table if it doesn't exist.
+    Args:
+    - db_path: The path to the SQLite database file.
+    Returns:
+    - connection: The SQLite connection.
+    """
+    connection = sqlite3.connect(db_path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    # Let the web app read job statuses while workers write progress
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            function TEXT NOT NULL,
+            kwargs TEXT NOT NULL,
+            work_path TEXT,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )"""
+    )
+    return connection
+
+
+def update_job(db_path, job_id, **fields):
+    """Function to update the columns of a job.
+    Args:
+    - db_path: The path to the SQLite database file.
+    - job_id: The ID of the job.
+    - fields: The columns to update and their new values.
+    """
+    fields["updated_at"] = time.time()
+    columns = ", ".join(column + " = ?" for column in fields)
+    with connect(db_path) as connection:
+        connection.execute(
+            "UPDATE jobs SET " + columns + " WHERE id = ?",
+            list(fields.values()) + [job_id],
+        )
+    connection.close()
+
+
+def run_job(db_path, job_id, metrics_path=None):
+    """Function run in a worker process to execute a queued job. The job's
+    function is called with its keyword arguments and a `progress_callback`
+    that records the progress percentage in the job store.
+    Args:
+    - db_path: The path to the SQLite database file.
+    - job_id: The ID of the job.
+    - metrics_path: The folder in which the worker saves a snapshot of its
+    metrics after each job (None to not save them).
+    """
+    # Claim the job so that it is never run twice
+    with connect(db_path) as connection:
+        claimed = connection.execute(
+            "UPDATE jobs SET status = ?, updated_at = ? "
+            "WHERE id = ? AND status = ?",
+            (RUNNING, time.time(), job_id, QUEUED),
+        ).rowcount
+        job = connection.execute(
+            "SELECT * FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    connection.close()
+    if not claimed:
+        return
+
+    # Keep the janitor from deleting the work directory of a job that ...
+    # ...waited long in the queue
+    if job["work_path"] and os.path.exists(job["work_path"]):
+        os.utime(job["work_path"])
+
+    last_progress = [0]
+
+    def progress_callback(done, total):
+        # Only write to the job store when the whole percentage changes
+        if total:
+            progress = min(100.0, 100.0 * done / total)
+            if int(progress) > int(last_progress[0]):
+                last_progress[0] = progress
+                update_job(db_path, job_id, progress=round(progress, 1))
+
+    # Update the job regularly while it runs, whatever its progress
+    stop_heartbeat = threading.Event()
+
+    def heartbeat():
+        while not stop_heartbeat.wait(HEARTBEAT_INTERVAL):
+            update_job(db_path, job_id)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+
+    status = FAILED
+    try:
+        # Import the job's function from its "module:function" name, ...
+        # ...failing the job if it can't be found
+        module_name, function_name = job["function"].split(":")
+        function = getattr(
+            importlib.import_module(module_name), function_name
+        )
+        result = function(
+            **json.loads(job["kwargs"]), progress_callback=progress_callback
+        )
+        # Make the output files available once the job is complete
+        if job["work_path"]:
+            publish_work_dir(job["work_path"])
+        update_job(
+            db_path, job_id, status=DONE, progress=100.0,
+            result=json.dumps(result),
+        )
+        status = DONE
+    except Exception:
+        # Do not leave half-written outputs behind
+        if job["work_path"]:
+            remove_work_dir(job["work_path"])
+        update_job(
+            db_path, job_id, status=FAILED, error=traceback.format_exc()
+        )
+    finally:
+        stop_heartbeat.set()
+        # Share the metrics of the worker with the web app
+        if metrics_path is not None:
+            METRICS.inc("imageai_jobs_total", status=status)
+            METRICS.save(os.path.join(
+                metrics_path, "worker-{}.json".format(os.getpid())
+            ))
+
+
+
+class JobQueue:
+    """Queue of long-running jobs executed by a pool of worker processes.
+    Jobs are stored in a local SQLite database, so that their status and
+    progress can be polled from any thread or process of the web app.
+    Jobs whose worker process died, or which were left running by a
+    previous run of the app, are queued again, so that jobs saving
+    checkpoints resume where they stopped.
+    """
+
+    def __init__(self, db_path, max_workers=1, metrics_path=None,
+                 stale_after=120, max_restarts=3):
+        """Initialize the JobQueue object.
+        Args:
+        - db_path: The path to the SQLite database file.
+        - max_workers: The number of worker processes running jobs.
+        - metrics_path: The folder in which the workers save snapshots of
+        their metrics (None to not save them).
+        - stale_after: The number of seconds after which a running job that
+        wasn't updated is considered interrupted and queued again.
+        - max_restarts: The number of times a job whose worker process died
+        is queued again before it fails.
+        """
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.metrics_path = metrics_path
+        self.stale_after = stale_after
+        self.max_restarts = max_restarts
+        # Number of times each job was queued again after its worker died
+        self.restarts = {}
+        # Set by shutdown(), after which no job is handed to the workers
+        self.closed = False
+        connect(db_path).close()
+
+        # Forget the metrics of the workers of a previous run of the app
+        if metrics_path is not None:
+            os.makedirs(metrics_path, exist_ok=True)
+            for snapshot_path in glob.glob(
+                os.path.join(metrics_path, "worker-*.json")
+            ):
+                os.remove(snapshot_path)
+
+        self.executor = self.create_executor()
+        self.executor_lock = threading.Lock()
+
+        # Run the jobs left in the queue by a previous run of the app, ...
+        # ...including those it was running
+        self.requeue_stale_jobs()
+        with connect(db_path) as connection:
+            job_ids = [
+                row["id"] for row in connection.execute(
+                    "SELECT id FROM jobs WHERE status = ? "
+                    "ORDER BY created_at",
+                    (QUEUED,),
+                )
+            ]
+        connection.close()
+        for job_id in job_ids:
+            self.run(job_id)
+
+
+    def create_executor(self):
+        """Create the pool of worker processes.
+        Returns:
+        - executor: The ProcessPoolExecutor of the workers.
+        """
+        # Worker processes are spawned rather than forked so that they ...
+        # ...don't inherit the threads and locks of the web server
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+
+    def run(self, job_id):
+        """Hand a queued job to the worker processes, replacing the pool if
+        one of its workers died.
+        Args:
+        - job_id: The ID of the job.
+        """
+        with self.executor_lock:
+            try:
+                future = self.executor.submit(
+                    run_job, self.db_path, job_id, self.metrics_path
+                )
+            except BrokenProcessPool:
+                self.executor = self.create_executor()
+                future = self.executor.submit(
+                    run_job, self.db_path, job_id, self.metrics_path
+                )
+        future.add_done_callback(
+            lambda future: self.on_job_exit(job_id, future)
+        )
+
+
+    def on_job_exit(self, job_id, future):
+        """Queue a job again if its worker process died while running it or
+        before starting it. Called by the pool when the job's future is done.
+        Args:
+        - job_id: The ID of the job.
+        - future: The future of the job.
+        """
+        if future.cancelled() or not isinstance(
+            future.exception(), BrokenProcessPool
+        ):
+            return
+        # The pool also breaks when the app exits: leave the job queued ...
+        # ...for the next run of the app
+        if self.closed or sys.is_finalizing():
+            return
+
+        with connect(self.db_path) as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? "
+                "WHERE id = ? AND status = ?",
+                (QUEUED, time.time(), job_id, RUNNING),
+            )
+            job = connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        connection.close()
+        if job is None or job["status"] != QUEUED:
+            return
+
+        # Give up on jobs which keep killing their worker, e.g. by ...
+        # ...running out of memory, counting the jobs which were still ...
+        # ...queued in the broken pool as well
+        self.restarts[job_id] = self.restarts.get(job_id, 0) + 1
+        if self.restarts[job_id] > self.max_restarts:
+            if job["work_path"]:
+                remove_work_dir(job["work_path"])
+            update_job(
+                self.db_path, job_id, status=FAILED,
+                error="The worker process died {} times".format(
+                    self.restarts[job_id]
+                ),
+            )
+            return
+        try:
+            self.run(job_id)
+        except RuntimeError:
+            # The pool was shut down meanwhile
+            pass
+
+
+    def requeue_stale_jobs(self):
+        """Queue again the running jobs which weren't updated for
+        `stale_after` seconds, because their worker died with a previous run
+        of the app.
+        Returns:
+        - job_ids: The IDs of the jobs queued again.
+        """
+        stale_time = time.time() - self.stale_after
+        job_ids = []
+        with connect(self.db_path) as connection:
+            for row in connection.execute(
+                "SELECT id FROM jobs WHERE status = ? AND updated_at < ?",
+                (RUNNING, stale_time),
+            ).fetchall():
+                # Only one process of the app queues each job again
+                if connection.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? "
+                    "WHERE id = ? AND status = ? AND updated_at < ?",
+                    (QUEUED, time.time(), row["id"], RUNNING, stale_time),
+                ).rowcount:
+                    job_ids.append(row["id"])
+        connection.close()
+        return job_ids
+
+
+    def submit(self, function, kwargs, work_path=None):
+        """Add a job to the queue.
+        Args:
+        - function: The job's function given as "module:function". It is
+        called with `kwargs` and a `progress_callback` keyword argument and
+        must return a JSON-serializable result.
+        - kwargs: A JSON-serializable dictionary of keyword arguments.
+        - work_path: The path to the job's work directory, published when
+        the job succeeds and removed when it fails.
+        Returns:
+        - job_id: The ID of the new job.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with connect(self.db_path) as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, status, function, kwargs, work_path, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, function, json.dumps(kwargs), work_path,
+                 now, now),
+            )
+        connection.close()
+
+        self.run(job_id)
+        return job_id
+
+
+    def get(self, job_id):
+        """Get the status of a job.
+        Args:
+        - job_id: The ID of the job.
+        Returns:
+        - job: A dictionary with the job's id, status, progress, result and
+        error, or None if the job doesn't exist.
+        """
+        with connect(self.db_path) as connection:
+            job = connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        connection.close()
+        if job is None:
+            return None
+
+        # Queue the job again if its worker died with a previous run of ...
+        # ...the app
+        if (job["status"] == RUNNING
+                and job["updated_at"] < time.time() - self.stale_after):
+            for stale_job_id in self.requeue_stale_jobs():
+                self.run(stale_job_id)
+            return self.get(job_id)
+
+        return {
+            "id": job["id"],
+            "status": job["status"],
+            "progress": job["progress"],
+            "result": json.loads(job["result"]) if job["result"] else None,
+            "error": job["error"],
+            "work_id": (
+                os.path.basename(job["work_path"]).split(".")[0]
+                if job["work_path"] else None
+            ),
+        }
+
+
+    def shutdown(self):
+        """Stop the worker processes once the running jobs are finished.
+        """
+        self.closed = True
+        self.executor.shutdown(wait=True)
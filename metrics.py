@@ -0,0 +1,342 @@
+import os
+import json
+import time
+import glob
+import threading
+import functools
+
+
+
+# Upper bounds, in seconds, of the buckets of the timing histograms
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0, 300.0, 1800.0,
+)
+
+
+def format_labels(labels):
+    """Function to format the labels of a metric in the Prometheus text
+    format.
+    Args:
+    - labels: A tuple of (name, value) pairs.
+    Returns:
+    - text: The formatted labels, e.g. '{stage="detection"}', or an empty
+    string if there are no labels.
+    """
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for name, value in labels
+    ) + "}"
+
+
+def get_key(labels):
+    """Function to get the key of the series of a metric from its labels.
+    Args:
+    - labels: A dictionary of the labels.
+    Returns:
+    - key: A sorted tuple of (name, value) pairs, with string values.
+    """
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+
+class Timer:
+    """Context manager and decorator recording the duration of a stage in a
+    histogram of a MetricsRegistry.
+    """
+
+    def __init__(self, registry, name, labels):
+        """Initialize the Timer object.
+        Args:
+        - registry: The MetricsRegistry recording the durations.
+        - name: The name of the histogram.
+        - labels: A dictionary of the labels of the histogram.
+        """
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = time.perf_counter() - self.start
+        self.registry.observe(self.name, self.seconds, **self.labels)
+        return False
+
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Timer(self.registry, self.name, self.labels):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+
+
+class MetricsRegistry:
+    """Process-wide registry of counters, gauges and histograms, rendered in
+    the Prometheus text format. Registries of other processes, such as the
+    job workers, can be saved to JSON files and merged into the rendering.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Initialize the MetricsRegistry object.
+        Args:
+        - buckets: The upper bounds of the buckets of the histograms.
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # Metrics by name, then by sorted tuple of labels
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        # Help text of each metric
+        self.help = {}
+
+
+    def describe(self, name, help_text):
+        """Set the help text of a metric.
+        Args:
+        - name: The name of the metric.
+        - help_text: The description of the metric.
+        """
+        self.help[name] = help_text
+
+
+    def inc(self, name, value=1, **labels):
+        """Increment a counter.
+        Args:
+        - name: The name of the counter.
+        - value: The increment.
+        - labels: The labels of the counter.
+        """
+        key = get_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+
+    def set(self, name, value, **labels):
+        """Set the value of a gauge.
+        Args:
+        - name: The name of the gauge.
+        - value: The value.
+        - labels: The labels of the gauge.
+        """
+        key = get_key(labels)
+        with self._lock:
+            self.gauges.setdefault(name, {})[key] = value
+
+
+    def add(self, name, value, **labels):
+        """Add to the value of a gauge, e.g. +1 / -1 for in-progress work.
+        Args:
+        - name: The name of the gauge.
+        - value: The value to add.
+        - labels: The labels of the gauge.
+        """
+        key = get_key(labels)
+        with self._lock:
+            series = self.gauges.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+
+    def reset(self, name):
+        """Remove all the series of a gauge, e.g. before setting the gauges
+        of the currently resident models.
+        Args:
+        - name: The name of the gauge.
+        """
+        with self._lock:
+            self.gauges.pop(name, None)
+
+
+    def observe(self, name, value, **labels):
+        """Record a value in a histogram.
+        Args:
+        - name: The name of the histogram.
+        - value: The observed value.
+        - labels: The labels of the histogram.
+        """
+        key = get_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = {
+                    "buckets": [0] * len(self.buckets), "sum": 0.0,
+                    "count": 0,
+                }
+            histogram = series[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+
+    def timer(self, stage, name="imageai_stage_seconds", **labels):
+        """Get a timer of a stage, used as a context manager or decorator.
+        Args:
+        - stage: The name of the stage, recorded as the `stage` label.
+        - name: The name of the histogram.
+        - labels: Other labels of the histogram.
+        Returns:
+        - timer: The Timer.
+        """
+        return Timer(self, name, dict(labels, stage=stage))
+
+
+    def to_dict(self):
+        """Get a JSON-serializable snapshot of the counters and histograms.
+        Returns:
+        - snapshot: A dictionary of the metrics.
+        """
+        with self._lock:
+            return {
+                "counters": {
+                    name: [[list(key), value] for key, value in series.items()]
+                    for name, series in self.counters.items()
+                },
+                "histograms": {
+                    name: [
+                        [list(key), dict(histogram,
+                                         buckets=list(histogram["buckets"]))]
+                        for key, histogram in series.items()
+                    ]
+                    for name, series in self.histograms.items()
+                },
+            }
+
+
+    def save(self, path):
+        """Save a snapshot of the counters and histograms to a JSON file,
+        atomically.
+        Args:
+        - path: The path to the JSON file.
+        """
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temp_path, path)
+
+
+    def render(self, snapshot_paths=()):
+        """Render the metrics in the Prometheus text format.
+        Args:
+        - snapshot_paths: Paths to JSON snapshots of the registries of other
+        processes, whose counters and histograms are added to this one's.
+        Returns:
+        - text: The metrics in the Prometheus text format.
+        """
+        with self._lock:
+            counters = {
+                name: dict(series) for name, series in self.counters.items()
+            }
+            gauges = {
+                name: dict(series) for name, series in self.gauges.items()
+            }
+            histograms = {
+                name: {
+                    key: dict(histogram, buckets=list(histogram["buckets"]))
+                    for key, histogram in series.items()
+                }
+                for name, series in self.histograms.items()
+            }
+
+        # Merge the snapshots of the other processes
+        for snapshot_path in snapshot_paths:
+            try:
+                with open(snapshot_path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, series in snapshot["counters"].items():
+                merged = counters.setdefault(name, {})
+                for key, value in series:
+                    key = tuple(tuple(label) for label in key)
+                    merged[key] = merged.get(key, 0) + value
+            for name, series in snapshot["histograms"].items():
+                merged = histograms.setdefault(name, {})
+                for key, histogram in series:
+                    key = tuple(tuple(label) for label in key)
+                    if key not in merged:
+                        merged[key] = {
+                            "buckets": [0] * len(self.buckets), "sum": 0.0,
+                            "count": 0,
+                        }
+                    for i, count in enumerate(histogram["buckets"]):
+                        merged[key]["buckets"][i] += count
+                    merged[key]["sum"] += histogram["sum"]
+                    merged[key]["count"] += histogram["count"]
+
+        lines = []
+        for metric_type, metrics in [("counter", counters),
+                                     ("gauge", gauges)]:
+            for name in sorted(metrics):
+                if name in self.help:
+                    lines.append("# HELP {} {}".format(name, self.help[name]))
+                lines.append("# TYPE {} {}".format(name, metric_type))
+                for key, value in sorted(metrics[name].items()):
+                    lines.append(
+                        "{}{} {}".format(name, format_labels(key), value)
+                    )
+
+        for name in sorted(histograms):
+            if name in self.help:
+                lines.append("# HELP {} {}".format(name, self.help[name]))
+            lines.append("# TYPE {} histogram".format(name))
+            for key, histogram in sorted(histograms[name].items()):
+                # Buckets are cumulative in the Prometheus format
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    cumulative += count
+                    lines.append("{}_bucket{} {}".format(
+                        name, format_labels(key + (("le", bound),)),
+                        cumulative,
+                    ))
+                lines.append("{}_bucket{} {}".format(
+                    name, format_labels(key + (("le", "+Inf"),)),
+                    histogram["count"],
+                ))
+                lines.append("{}_sum{} {}".format(
+                    name, format_labels(key), histogram["sum"]
+                ))
+                lines.append("{}_count{} {}".format(
+                    name, format_labels(key), histogram["count"]
+                ))
+
+        return "\n".join(lines) + "\n"
+
+
+    def render_directory(self, snapshots_path):
+        """Render the metrics in the Prometheus text format, merged with the
+        snapshots saved in a folder by other processes.
+        Args:
+        - snapshots_path: The folder containing the JSON snapshots.
+        Returns:
+        - text: The metrics in the Prometheus text format.
+        """
+        return self.render(
+            sorted(glob.glob(os.path.join(snapshots_path, "*.json")))
+        )
+
+
+
+# Registry shared by the app, the models and the job workers of the process
+METRICS = MetricsRegistry()
+METRICS.describe(
+    "imageai_stage_seconds",
+    "Duration of the stages of image prediction and video object detection.",
+)
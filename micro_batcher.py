@@ -0,0 +1,151 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from metrics import METRICS
+
+
+
+METRICS.describe(
+    "imageai_micro_batches_total",
+    "Number of batches flushed by the micro-batchers.",
+)
+METRICS.describe(
+    "imageai_micro_batch_items_total",
+    "Number of items classified in the batches of the micro-batchers.",
+)
+
+
+class MicroBatcher(threading.Thread):
+    """Background thread coalescing the items submitted by concurrent
+    requests into batches. A batch is flushed when it has `max_batch_size`
+    items or when its first item has waited `max_wait` seconds, and the
+    results of the batch are fanned back out to the waiting requests.
+    """
+
+    def __init__(self, name, function, max_batch_size=32, max_wait=0.005):
+        """Initialize the MicroBatcher object.
+        Args:
+        - name: The name of the batcher, recorded as the `batcher` label of
+        its metrics.
+        - function: The function called with a list of items, returning the
+        list of their results in the same order.
+        - max_batch_size: The maximum number of items of a batch.
+        - max_wait: The maximum time, in seconds, an item waits for other
+        items before its batch is flushed.
+        """
+        super().__init__(daemon=True)
+        self.batcher_name = name
+        self.function = function
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait
+        # Queue of (item, future, submission time) tuples
+        self.requests = queue.Queue()
+
+
+    def submit(self, items):
+        """Submit items and wait for their results. Called by the request
+        threads.
+        Args:
+        - items: A list of items.
+        Returns:
+        - results: The list of the results of the items.
+        """
+        submitted_at = time.perf_counter()
+        futures = []
+        for item in items:
+            future = Future()
+            self.requests.put((item, future, submitted_at))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+
+    def next_batch(self):
+        """Wait for the next batch of items.
+        Returns:
+        - batch: A list of (item, future, submission time) tuples.
+        """
+        batch = [self.requests.get()]
+        # The batch is flushed once its oldest item has waited max_wait
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    batch.append(self.requests.get(timeout=timeout))
+                else:
+                    # Still take the items that are already queued
+                    batch.append(self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            METRICS.inc("imageai_micro_batches_total",
+                        batcher=self.batcher_name)
+            METRICS.inc("imageai_micro_batch_items_total", len(batch),
+                        batcher=self.batcher_name)
+            try:
+                results = self.function([item for item, _, _ in batch])
+            except BaseException as error:
+                for _, future, _ in batch:
+                    future.set_exception(error)
+                continue
+            # Missing results would leave their requests waiting forever
+            if len(results) != len(batch):
+                error = RuntimeError(
+                    "The micro-batcher {} got {} results for {} items".format(
+                        self.batcher_name, len(results), len(batch)
+                    )
+                )
+                for _, future, _ in batch:
+                    future.set_exception(error)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+
+
+# Micro-batchers shared by all requests of the process, by name
+_micro_batchers = {}
+_micro_batchers_lock = threading.Lock()
+
+
+def get_micro_batcher(name, function, max_batch_size=32, max_wait=0.005):
+    """Function to get the micro-batcher of the process with a given name,
+    creating and starting it on first use. The function and settings of the
+    batcher are those of its first use.
+    Args:
+    - name: The name of the batcher, e.g. the classification algorithm.
+    - function: The function called with a list of items, returning the
+    list of their results in the same order.
+    - max_batch_size: The maximum number of items of a batch.
+    - max_wait: The maximum time, in seconds, an item waits for other items
+    before its batch is flushed.
+    Returns:
+    - micro_batcher: The shared MicroBatcher.
+    Raises:
+    - ValueError: If the batcher was created with other settings.
+    """
+    with _micro_batchers_lock:
+        if name not in _micro_batchers:
+            _micro_batchers[name] = MicroBatcher(
+                name, function, max_batch_size=max_batch_size,
+                max_wait=max_wait,
+            )
+            _micro_batchers[name].start()
+        micro_batcher = _micro_batchers[name]
+        if (micro_batcher.max_batch_size, micro_batcher.max_wait) != (
+            max(1, int(max_batch_size)), max_wait
+        ):
+            raise ValueError(
+                "The micro-batcher {} runs batches of up to {} items "
+                "waiting {} s, not {} items waiting {} s".format(
+                    name, micro_batcher.max_batch_size,
+                    micro_batcher.max_wait, max_batch_size, max_wait,
+                )
+            )
+        return micro_batcher
@@ -0,0 +1,164 @@
+import os
+import threading
+from collections import OrderedDict
+from metrics import METRICS
+
+
+
+class ModelRegistry:
+    """Process-wide registry of loaded ImageAI models.
+    Models are loaded lazily the first time they are requested and are then
+    shared by every request in the process. When the number of resident
+    models or their estimated memory footprint exceeds the configured limits,
+    the least recently used models are evicted.
+    """
+
+    def __init__(self, max_models=None, memory_budget=None):
+        """Initialize the ModelRegistry object.
+        Args:
+        - max_models: The maximum number of models kept in memory at once
+        (None for no limit).
+        - memory_budget: The maximum estimated memory, in bytes, used by the
+        resident models (None for no limit).
+        """
+        self.max_models = max_models
+        self.memory_budget = memory_budget
+
+        # Loaded models in least to most recently used order
+        self._models = OrderedDict()
+        # Lock protecting `_models` and `_load_locks`
+        self._lock = threading.Lock()
+        # One lock per key so that a model is only ever loaded once, ...
+        # ...without blocking requests for other models
+        self._load_locks = {}
+
+
+    def configure(self, max_models=None, memory_budget=None):
+        """Change the eviction limits of the registry.
+        Args:
+        - max_models: The maximum number of models kept in memory at once
+        (None for no limit).
+        - memory_budget: The maximum estimated memory, in bytes, used by the
+        resident models (None for no limit).
+        """
+        with self._lock:
+            self.max_models = max_models
+            self.memory_budget = memory_budget
+            self._evict()
+
+
+    def get(self, key, loader, model_path):
+        """Return the model stored under `key`, loading it on first use.
+        Args:
+        - key: A hashable key identifying the model, e.g.
+        ("ImageRecognizer", "ResNet50", model_path).
+        - loader: A function called with no arguments that returns the loaded
+        model.
+        - model_path: The path to the model weights, used to estimate the
+        memory footprint of the model.
+        Returns:
+        - model: The loaded model.
+        """
+        with self._lock:
+            if key in self._models:
+                # Mark the model as most recently used
+                self._models.move_to_end(key)
+                return self._models[key][0]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Another request may have loaded the model while we were ...
+            # ...waiting for the lock
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key][0]
+
+            try:
+                with METRICS.timer("model_load", model=key[1]):
+                    model = loader()
+
+                # The size of the weights file is a good estimate of the ...
+                # ...memory used by the fp32 parameters once loaded
+                if os.path.exists(model_path):
+                    size = os.path.getsize(model_path)
+                else:
+                    size = 0
+
+                with self._lock:
+                    self._models[key] = (model, size)
+                    self._evict(keep=key)
+            finally:
+                # Don't keep the lock of a model that failed to load
+                with self._lock:
+                    self._load_locks.pop(key, None)
+
+        return model
+
+
+    def _evict(self, keep=None):
+        """Evict least recently used models until the registry is within its
+        limits. Must be called with `_lock` held.
+        Args:
+        - keep: A key that must not be evicted (the model just loaded).
+        """
+        while len(self._models) > 1:
+            over_count = (
+                self.max_models is not None
+                and len(self._models) > self.max_models
+            )
+            over_budget = (
+                self.memory_budget is not None
+                and self._memory_usage() > self.memory_budget
+            )
+            if not (over_count or over_budget):
+                break
+
+            # Evict the least recently used model. Requests still holding ...
+            # ...a reference keep it alive until they finish.
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                break
+            del self._models[oldest]
+
+
+    def evict(self, key):
+        """Remove the model stored under `key` from the registry.
+        Args:
+        - key: The key of the model to evict.
+        """
+        with self._lock:
+            self._models.pop(key, None)
+
+
+    def clear(self):
+        """Remove every model from the registry.
+        """
+        with self._lock:
+            self._models.clear()
+
+
+    def _memory_usage(self):
+        """Return the estimated memory, in bytes, used by resident models.
+        Must be called with `_lock` held.
+        """
+        return sum(size for _, size in self._models.values())
+
+
+    def memory_usage(self):
+        """Return the estimated memory, in bytes, used by resident models.
+        """
+        with self._lock:
+            return self._memory_usage()
+
+
+    def loaded(self):
+        """Return the keys of the resident models, least recently used first.
+        """
+        with self._lock:
+            return list(self._models)
+
+
+
+# Registry shared by ImageRecognizer and VideoObjectDetector
+MODEL_REGISTRY = ModelRegistry()
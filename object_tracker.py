@@ -0,0 +1,301 @@
+import numpy as np
+
+
+
+def box_iou(boxes, other_boxes):
+    """Function to compute the intersection over union of two sets of
+    boxes.
+    Args:
+    - boxes: A NumPy array of N boxes (x1, y1, x2, y2).
+    - other_boxes: A NumPy array of M boxes (x1, y1, x2, y2).
+    Returns:
+    - iou: A N x M NumPy array of the IoU of each pair of boxes.
+    """
+    x1 = np.maximum(boxes[:, None, 0], other_boxes[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], other_boxes[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], other_boxes[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], other_boxes[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    other_areas = (
+        (other_boxes[:, 2] - other_boxes[:, 0])
+        * (other_boxes[:, 3] - other_boxes[:, 1])
+    )
+    union = areas[:, None] + other_areas[None, :] - intersection
+    return np.where(
+        union > 0, intersection / np.where(union > 0, union, 1), 0.0
+    )
+
+
+
+class ObjectTracker:
+    """SORT-style tracker following the detected objects across the frames
+    of a video, in pure NumPy.
+    On each inferred frame, the detections are matched to the boxes of the
+    tracks predicted with a constant velocity, greedily by decreasing IoU
+    among objects of the same name, and unmatched detections start new
+    tracks. On the skipped frames of a sampled video, the boxes of the
+    tracks are propagated with their velocity instead of being carried
+    forward. Each track keeps its first and last frames, from which the
+    number of unique objects and their dwell times are derived.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_misses=2, min_hits=2,
+                 smoothing=0.5):
+        """Initialize the ObjectTracker object.
+        Args:
+        - iou_threshold: The minimum IoU between a detection and the
+        predicted box of a track for them to be matched.
+        - max_misses: The number of consecutive inferred frames in which a
+        track may be missed by the detector before it ends.
+        - min_hits: The number of detections of a track for it to count as
+        an object, so that spurious detections are not counted.
+        - smoothing: The weight of the last measured velocity of a track
+        in its smoothed velocity, from 0 to 1.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.smoothing = smoothing
+
+        # All tracks by ID, and the IDs of the tracks still followed, in ...
+        # ...the order of the detections of the last inferred frame
+        self.tracks = {}
+        self.active_ids = []
+        self.next_id = 1
+        # Index of the last frame tracked and of the last inferred frame
+        self.last_frame_index = -1
+        self.last_update_index = -1
+
+
+    def track(self, frame_index, output_array, inferred=True):
+        """Track the objects of a frame. Frames must be tracked in order.
+        Args:
+        - frame_index: The index of the frame, starting at 0.
+        - output_array: List of the objects detected in the frame, as
+        returned by ImageAI.
+        - inferred: True if the detector was run on the frame, False if
+        the detections were carried forward from the last inferred frame.
+        Returns:
+        - output_array: List of the objects of the frame with their
+        `track_id`, the boxes of skipped frames being propagated.
+        """
+        if frame_index <= self.last_frame_index:
+            # Frames restored from a checkpoint were already tracked
+            return output_array
+        self.last_frame_index = frame_index
+
+        if inferred:
+            return self.update(frame_index, output_array)
+        return self.propagate(frame_index)
+
+
+    def predict_box(self, track, frame_index):
+        """Predict the box of a track in a frame from its velocity.
+        Args:
+        - track: The dictionary of the track.
+        - frame_index: The index of the frame.
+        Returns:
+        - box: The predicted box (x1, y1, x2, y2) as a NumPy array.
+        """
+        return np.array(track["box"]) + np.array(track["velocity"]) * (
+            frame_index - track["updated_frame"]
+        )
+
+
+    def update(self, frame_index, output_array):
+        """Match the objects detected in an inferred frame to the tracks.
+        Args:
+        - frame_index: The index of the frame.
+        - output_array: List of the objects detected in the frame.
+        Returns:
+        - output_array: List of the objects with their `track_id`.
+        """
+        boxes = np.array(
+            [object["box_points"] for object in output_array],
+            dtype=np.float64,
+        ).reshape(-1, 4)
+        active = [self.tracks[track_id] for track_id in self.active_ids]
+        predicted = np.array(
+            [self.predict_box(track, frame_index) for track in active],
+            dtype=np.float64,
+        ).reshape(-1, 4)
+
+        # Only objects of the same name are matched
+        iou = box_iou(boxes, predicted)
+        for i, object in enumerate(output_array):
+            for j, track in enumerate(active):
+                if object["name"] != track["name"]:
+                    iou[i, j] = 0.0
+
+        # Match the pairs of detections and tracks by decreasing IoU
+        matches = {}
+        matched_tracks = set()
+        for pair in np.argsort(-iou, axis=None, kind="stable"):
+            i, j = divmod(int(pair), len(active))
+            if iou[i, j] < self.iou_threshold:
+                break
+            if i not in matches and j not in matched_tracks:
+                matches[i] = j
+                matched_tracks.add(j)
+
+        tracked_array = []
+        active_ids = []
+        for i, object in enumerate(output_array):
+            if i in matches:
+                track = active[matches[i]]
+                velocity = (boxes[i] - np.array(track["box"])) / max(
+                    1, frame_index - track["updated_frame"]
+                )
+                if track["hits"] > 1:
+                    velocity = (
+                        self.smoothing * velocity
+                        + (1 - self.smoothing) * np.array(track["velocity"])
+                    )
+                track["velocity"] = velocity.tolist()
+                track["hits"] += 1
+                track["misses"] = 0
+            else:
+                # Start a new track
+                track = {
+                    "track_id": self.next_id,
+                    "name": object["name"],
+                    "velocity": [0.0] * 4,
+                    "first_frame": frame_index,
+                    "hits": 1,
+                    "misses": 0,
+                }
+                self.tracks[self.next_id] = track
+                self.next_id += 1
+            track.update(
+                box=boxes[i].tolist(),
+                probability=float(object["percentage_probability"]),
+                updated_frame=frame_index,
+                last_frame=frame_index,
+            )
+            active_ids.append(track["track_id"])
+            tracked_array.append(dict(object, track_id=track["track_id"]))
+
+        # Keep following the tracks missed by the detector for a while
+        for j, track in enumerate(active):
+            if j not in matched_tracks:
+                track["misses"] += 1
+                if track["misses"] <= self.max_misses:
+                    active_ids.append(track["track_id"])
+
+        self.active_ids = active_ids
+        self.last_update_index = frame_index
+        return tracked_array
+
+
+    def propagate(self, frame_index):
+        """Propagate the boxes of the objects of the last inferred frame to
+        a skipped frame.
+        Args:
+        - frame_index: The index of the frame.
+        Returns:
+        - output_array: List of the objects with their predicted boxes and
+        `track_id`.
+        """
+        output_array = []
+        for track_id in self.active_ids:
+            track = self.tracks[track_id]
+            if track["updated_frame"] != self.last_update_index:
+                continue
+            track["last_frame"] = frame_index
+            output_array.append(
+                {
+                    "name": track["name"],
+                    "percentage_probability": track["probability"],
+                    "box_points": [
+                        int(round(value))
+                        for value in self.predict_box(track, frame_index)
+                    ],
+                    "track_id": track_id,
+                }
+            )
+        return output_array
+
+
+    def get_tracks(self, frames_per_second):
+        """Get the tracks counted as objects, with at least `min_hits`
+        detections.
+        Args:
+        - frames_per_second: Number of frames per second in the video.
+        Returns:
+        - tracks: A list of dictionaries of the ID, object name, first and
+        last frames, dwell time in seconds and number of detections of each
+        track, ordered by ID.
+        """
+        return [
+            {
+                "track_id": track["track_id"],
+                "objects": track["name"],
+                "first_frame": track["first_frame"],
+                "last_frame": track["last_frame"],
+                "dwell_seconds": (
+                    (track["last_frame"] - track["first_frame"] + 1)
+                    / frames_per_second
+                ),
+                "detections": track["hits"],
+            }
+            for track in self.tracks.values()
+            if track["hits"] >= self.min_hits
+        ]
+
+
+    def unique_counts(self):
+        """Get the number of unique objects of each name, i.e. of tracks.
+        Returns:
+        - counts: A dictionary mapping each object to its number of tracks.
+        """
+        counts = {}
+        for track in self.tracks.values():
+            if track["hits"] >= self.min_hits:
+                counts[track["name"]] = counts.get(track["name"], 0) + 1
+        return counts
+
+
+    def average_dwell_seconds(self, frames_per_second):
+        """Get the average time the objects of each name stay in the video.
+        Args:
+        - frames_per_second: Number of frames per second in the video.
+        Returns:
+        - dwell_seconds: A dictionary mapping each object to the average
+        dwell time of its tracks, in seconds.
+        """
+        totals = {}
+        counts = self.unique_counts()
+        for track in self.get_tracks(frames_per_second):
+            totals[track["objects"]] = (
+                totals.get(track["objects"], 0.0) + track["dwell_seconds"]
+            )
+        return {name: totals[name] / counts[name] for name in totals}
+
+
+    def to_dict(self):
+        """Get the state of the tracker, saved with the checkpoints of the
+        detection.
+        Returns:
+        - state: A JSON-serializable dictionary of the state.
+        """
+        return {
+            "tracks": list(self.tracks.values()),
+            "active_ids": self.active_ids,
+            "next_id": self.next_id,
+            "last_frame_index": self.last_frame_index,
+            "last_update_index": self.last_update_index,
+        }
+
+
+    def load_state(self, state):
+        """Restore the state of the tracker saved with a checkpoint.
+        Args:
+        - state: The dictionary returned by to_dict().
+        """
+        self.tracks = {track["track_id"]: track for track in state["tracks"]}
+        self.active_ids = state["active_ids"]
+        self.next_id = state["next_id"]
+        self.last_frame_index = state["last_frame_index"]
+        self.last_update_index = state["last_update_index"]
@@ -0,0 +1,145 @@
+import os
+import queue
+import threading
+import numpy as np
+from PIL import Image
+
+
+
+class PreviewWriter(threading.Thread):
+    """Background thread writing an animated preview (GIF, WebP or MP4) of
+    the output video from the annotated frames produced during detection.
+    Frames are skipped and downscaled as they arrive, so the preview is
+    ready as soon as detection ends, without decoding the output video
+    again.
+    """
+
+    # Supported preview formats
+    FORMATS = ["gif", "webp", "mp4"]
+
+    def __init__(
+        self,
+        output_path,
+        frames_per_second,
+        frame_skip=2,
+        scale=0.5,
+        max_duration=30,
+        queue_size=32,
+    ):
+        """Initialize the PreviewWriter object.
+        Args:
+        - output_path: The path to the preview file. Its extension (".gif",
+        ".webp" or ".mp4") sets the preview format.
+        - frames_per_second: Number of frames per second in the video.
+        - frame_skip: Only one frame out of `frame_skip` is kept.
+        - scale: The factor by which the frames are downscaled.
+        - max_duration: The maximum duration of the preview in seconds
+        (None for the full video).
+        - queue_size: The maximum number of frames waiting to be processed.
+        """
+        super().__init__(daemon=True)
+        self.output_path = output_path
+        self.preview_format = os.path.splitext(output_path)[1][1:].lower()
+        if self.preview_format not in self.FORMATS:
+            raise ValueError(
+                "Unknown preview format: {}".format(self.preview_format)
+            )
+        self.frames_per_second = frames_per_second
+        self.frame_skip = max(1, int(frame_skip))
+        self.scale = scale
+        if max_duration is None:
+            self.max_frames = None
+        else:
+            self.max_frames = int(max_duration * frames_per_second)
+
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.start()
+
+
+    def add_frame(self, frame_index, frame):
+        """Add an annotated frame of the output video.
+        Args:
+        - frame_index: The index of the frame, starting at 0.
+        - frame: The annotated frame as a BGR NumPy array, as returned by
+        ImageAI.
+        """
+        if frame is None or frame_index % self.frame_skip != 0:
+            return
+        if self.max_frames is not None and frame_index >= self.max_frames:
+            return
+        # The detector may reuse its frame buffer
+        self.frames.put(frame.copy())
+
+
+    def run(self):
+        """Downscale the frames as they arrive and write the preview file.
+        """
+        images = []
+        video_writer = None
+        # Set once the last frame was received, so that frames are not ...
+        # ...waited for after it
+        finished = False
+        try:
+            while True:
+                frame = self.frames.get()
+                if frame is None:
+                    finished = True
+                    break
+
+                # Convert the frame from BGR to RGB and downscale it
+                image = Image.fromarray(frame[:, :, ::-1])
+                if self.scale != 1:
+                    image = image.resize(
+                        (
+                            max(1, int(image.width * self.scale)),
+                            max(1, int(image.height * self.scale)),
+                        ),
+                        Image.BILINEAR,
+                    )
+
+                if self.preview_format == "mp4":
+                    if video_writer is None:
+                        import imageio
+
+                        video_writer = imageio.get_writer(
+                            self.output_path,
+                            fps=self.frames_per_second / self.frame_skip,
+                            macro_block_size=1,
+                        )
+                    video_writer.append_data(np.asarray(image))
+                elif self.preview_format == "gif":
+                    # Quantize each frame while detection is still running
+                    images.append(image.quantize(colors=256))
+                else:
+                    images.append(image)
+
+            if images:
+                # Duration of each frame of the preview in milliseconds
+                duration = int(
+                    1000 * self.frame_skip / self.frames_per_second
+                )
+                images[0].save(
+                    self.output_path,
+                    save_all=True,
+                    append_images=images[1:],
+                    duration=duration,
+                    loop=0,
+                )
+        except Exception as error:
+            self.error = error
+            # Keep consuming frames so that the detection is not blocked
+            while not finished and self.frames.get() is not None:
+                pass
+        finally:
+            if video_writer is not None:
+                video_writer.close()
+
+
+    def close(self):
+        """Wait for the preview file to be written.
+        """
+        self.frames.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,174 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+
+def content_hash(data):
+    """Function to compute the SHA-256 hash of some content.
+    Args:
+    - data: The content as bytes, or a binary file-like object read in
+    chunks from its current position.
+    Returns:
+    - hex_digest: The SHA-256 hash as a hexadecimal string.
+    """
+    sha256 = hashlib.sha256()
+    if isinstance(data, (bytes, bytearray)):
+        sha256.update(data)
+    else:
+        for chunk in iter(lambda: data.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+
+class ResultCache:
+    """Two-tier cache of prediction and detection results.
+    Results are keyed by the hash of the input content and the parameters
+    that affect the output. Recently used results are kept in an in-memory
+    LRU tier, and every result is also stored on disk, along with its output
+    files, so that it survives restarts and is shared between processes.
+    """
+
+    def __init__(self, cache_path, max_memory_entries=256):
+        """Initialize the ResultCache object.
+        Args:
+        - cache_path: The path to the folder storing the on-disk tier.
+        - max_memory_entries: The maximum number of results kept in memory.
+        """
+        self.cache_path = cache_path
+        self.max_memory_entries = max_memory_entries
+        os.makedirs(cache_path, exist_ok=True)
+
+        # In-memory results in least to most recently used order
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Hit and miss counters
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+
+    @staticmethod
+    def make_key(*parts):
+        """Build a cache key from the content hash and parameters.
+        Args:
+        - parts: The content hash followed by the parameters affecting the
+        result, e.g. (sha256, "ResNet50", 5).
+        Returns:
+        - key: The cache key.
+        """
+        return hashlib.sha256(
+            json.dumps(parts, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+
+    def get(self, key):
+        """Get a cached result.
+        Args:
+        - key: The cache key.
+        Returns:
+        - result: The cached result, or None on a miss.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+        result_path = os.path.join(self.cache_path, key, "result.json")
+        try:
+            with open(result_path) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Mark the entry as recently used on disk, then promote it to the ...
+        # ...in-memory tier
+        os.utime(os.path.dirname(result_path))
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, result)
+        return result
+
+
+    def put(self, key, result, files_path=None, file_names=()):
+        """Store a result in both tiers.
+        Args:
+        - key: The cache key.
+        - result: The JSON-serializable result.
+        - files_path: The folder containing the output files of the result.
+        - file_names: The names of the output files to store with the result.
+        """
+        entry_path = os.path.join(self.cache_path, key)
+        temp_path = entry_path + ".{}.tmp".format(threading.get_ident())
+        os.makedirs(temp_path, exist_ok=True)
+        try:
+            for file_name in file_names:
+                shutil.copyfile(
+                    os.path.join(files_path, file_name),
+                    os.path.join(temp_path, file_name),
+                )
+            with open(os.path.join(temp_path, "result.json"), "w") as f:
+                json.dump(result, f)
+            # Publish the entry atomically. Another process may have ...
+            # ...stored the same result in the meantime.
+            os.rename(temp_path, entry_path)
+        except OSError:
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+        with self._lock:
+            self._remember(key, result)
+
+
+    def copy_files(self, key, file_names, destination_path):
+        """Copy the output files of a cached result to a folder.
+        Args:
+        - key: The cache key.
+        - file_names: The names of the output files to copy.
+        - destination_path: The folder to copy the files to.
+        Returns:
+        - copied: True if all files were copied, False if any is missing.
+        """
+        try:
+            for file_name in file_names:
+                shutil.copyfile(
+                    os.path.join(self.cache_path, key, file_name),
+                    os.path.join(destination_path, file_name),
+                )
+        except OSError:
+            return False
+        return True
+
+
+    def _remember(self, key, result):
+        """Add a result to the in-memory tier, evicting the least recently
+        used results if it is full. Must be called with `_lock` held.
+        Args:
+        - key: The cache key.
+        - result: The result.
+        """
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+
+    def stats(self):
+        """Get the hit and miss counters of the cache.
+        Returns:
+        - stats: A dictionary of the counters and in-memory tier size.
+        """
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
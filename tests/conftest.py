@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Make the modules of the app importable
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
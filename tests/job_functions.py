@@ -0,0 +1,16 @@
+import os
+
+
+
+def add(a, b, progress_callback=None):
+    progress_callback(1, 2)
+    return {"sum": a + b}
+
+
+def fail(progress_callback=None):
+    raise ValueError("Job failed")
+
+
+def kill_worker(progress_callback=None):
+    # Exit the worker process without cleaning up, as a crash would
+    os._exit(1)
@@ -0,0 +1,55 @@
+import threading
+
+from chart_renderer import ChartRenderer, get_chart_renderer
+
+PNG_SIGNATURE = b"\x89PNG"
+
+
+
+def test_charts_are_rendered_on_pooled_figures(tmp_path):
+    renderer = ChartRenderer(pool_size=1)
+    for i, image_format in enumerate(["png", "svg"]):
+        output_path = tmp_path / "chart{}.{}".format(i, image_format)
+        renderer.render_bar_chart(
+            ["car", "bus"], [2.5, 1.0], "Objects", str(output_path)
+        )
+    assert (tmp_path / "chart0.png").read_bytes().startswith(PNG_SIGNATURE)
+    assert b"<svg" in (tmp_path / "chart1.svg").read_bytes()
+    assert renderer.stats() == {"rendered": 2, "cache_hits": 0}
+    # The figure is cleared and back in the pool
+    figure = renderer._figures.get_nowait()
+    assert not figure.axes
+
+
+def test_identical_charts_are_served_from_the_cache(tmp_path):
+    renderer = ChartRenderer(cache_path=str(tmp_path / "cache"))
+    renderer.render_bar_chart(["car"], [1], "Objects", str(tmp_path / "a.png"))
+    renderer.render_bar_chart(["car"], [1], "Objects", str(tmp_path / "b.png"))
+    renderer.render_bar_chart(["car"], [2], "Objects", str(tmp_path / "c.png"))
+    assert renderer.stats() == {"rendered": 2, "cache_hits": 1}
+    assert (
+        (tmp_path / "a.png").read_bytes() == (tmp_path / "b.png").read_bytes()
+    )
+
+
+def test_concurrent_renders(tmp_path):
+    renderer = ChartRenderer(pool_size=2)
+    threads = [
+        threading.Thread(target=renderer.render_bar_chart, args=(
+            ["car"], [i], "Objects", str(tmp_path / "{}.png".format(i))
+        ))
+        for i in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert renderer.stats()["rendered"] == 6
+    assert len(list(tmp_path.iterdir())) == 6
+
+
+def test_chart_renderer_is_shared_per_cache_folder(tmp_path):
+    assert get_chart_renderer(str(tmp_path)) is get_chart_renderer(
+        str(tmp_path)
+    )
+    assert get_chart_renderer() is not get_chart_renderer(str(tmp_path))
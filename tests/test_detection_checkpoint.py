@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+
+from detection_checkpoint import (
+    ROWS_FILE_NAME,
+    STATE_FILE_NAME,
+    DetectionCheckpoint,
+)
+
+SETTINGS = {"model": "TinyYOLOv3", "sampling": ["stride", 5]}
+
+
+
+def make_array(frame_index):
+    return [{"name": "car", "box_points": [frame_index, 0, 10, 10]}]
+
+
+def test_detection_resumes_after_the_last_checkpoint(tmp_path):
+    checkpoint = DetectionCheckpoint(
+        str(tmp_path), SETTINGS, interval=4, get_state=lambda: {"tracks": 2}
+    )
+    assert checkpoint.load() == []
+    for frame_index in range(10):
+        checkpoint.add_frame(frame_index, make_array(frame_index))
+
+    # The last 2 frames were not checkpointed when the detection died
+    resumed = DetectionCheckpoint(str(tmp_path), SETTINGS, interval=4)
+    assert resumed.load() == [make_array(i) for i in range(8)]
+    assert resumed.state == {"tracks": 2}
+
+    # The restored frames are skipped
+    for frame_index in range(12):
+        resumed.add_frame(frame_index, make_array(frame_index))
+    resumed.save()
+    assert DetectionCheckpoint(str(tmp_path), SETTINGS).load() == [
+        make_array(i) for i in range(12)
+    ]
+
+
+def test_lines_written_after_the_last_checkpoint_are_dropped(tmp_path):
+    checkpoint = DetectionCheckpoint(str(tmp_path), SETTINGS, interval=2)
+    for frame_index in range(2):
+        checkpoint.add_frame(frame_index, make_array(frame_index))
+    # A crash while the next rows were being appended
+    with open(os.path.join(str(tmp_path), ROWS_FILE_NAME), "a") as f:
+        f.write('[{"name": "car"')
+
+    assert DetectionCheckpoint(str(tmp_path), SETTINGS).load() == [
+        make_array(0), make_array(1),
+    ]
+
+
+def test_checkpoints_with_other_settings_are_discarded(tmp_path):
+    checkpoint = DetectionCheckpoint(str(tmp_path), SETTINGS, interval=1)
+    checkpoint.add_frame(0, make_array(0))
+
+    other = DetectionCheckpoint(str(tmp_path), dict(SETTINGS, model="YOLOv3"))
+    assert other.load() == []
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_numpy_values_and_remove(tmp_path):
+    checkpoint = DetectionCheckpoint(str(tmp_path), SETTINGS, interval=1)
+    checkpoint.add_frame(0, [{"percentage_probability": np.float32(0.5)}])
+    assert sorted(os.listdir(str(tmp_path))) == sorted([
+        ROWS_FILE_NAME, STATE_FILE_NAME,
+    ])
+    assert DetectionCheckpoint(str(tmp_path), SETTINGS).load() == [
+        [{"percentage_probability": 0.5}],
+    ]
+    checkpoint.remove()
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,86 @@
+import csv
+
+import numpy as np
+import pytest
+
+from detection_stream import (
+    DetectionWriter,
+    format_frame_time,
+    format_frame_times,
+)
+
+
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_csv_rows_are_written_in_chunks(tmp_path):
+    path = str(tmp_path / "data.csv")
+    writer = DetectionWriter(path, chunk_size=2)
+    writer.write_frame("00:00:00.000000", [
+        {"name": "car", "percentage_probability": 90.0},
+    ])
+    assert writer.rows_written == 0
+    # A frame without objects gets an empty row
+    writer.write_frame("00:00:00.050000", [])
+    assert writer.rows_written == 2
+    assert len(read_rows(path)) == 3
+    writer.write_frame("00:00:00.100000", [
+        {"name": "bus", "percentage_probability": 50.0},
+    ])
+    writer.close()
+
+    assert writer.rows_written == 3
+    assert read_rows(path) == [
+        ["frames", "objects", "probability"],
+        ["00:00:00.000000", "car", "0.9"],
+        ["00:00:00.050000", "", ""],
+        ["00:00:00.100000", "bus", "0.5"],
+    ]
+
+
+def test_track_ids(tmp_path):
+    path = str(tmp_path / "data.csv")
+    writer = DetectionWriter(path, track_ids=True)
+    writer.write_frame("00:00:00.000000", [
+        {"name": "car", "percentage_probability": 90.0, "track_id": 3},
+    ])
+    writer.close()
+    assert read_rows(path)[1] == ["00:00:00.000000", "car", "0.9", "3"]
+
+
+def test_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "data.parquet")
+    writer = DetectionWriter(path, output_format="parquet")
+    writer.write_frame("00:00:00.000000", [
+        {"name": "car", "percentage_probability": 90.0},
+    ])
+    writer.write_frame("00:00:00.050000", [])
+    writer.close()
+    assert pq.read_table(path).to_pylist() == [
+        {"frames": "00:00:00.000000", "objects": "car", "probability": 0.9},
+        {"frames": "00:00:00.050000", "objects": None, "probability": None},
+    ]
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        DetectionWriter(str(tmp_path / "data.json"), output_format="json")
+
+
+def test_frame_times_use_integer_microseconds():
+    assert format_frame_time(0, 20) == "00:00:00.000000"
+    assert format_frame_time(1, 30) == "00:00:00.033333"
+    # Adding 1 / 30 s an hour long would drift
+    assert format_frame_time(30 * 3600, 30) == "01:00:00.000000"
+    assert format_frame_time(3, 29.97) == "00:00:00.100100"
+
+
+def test_frame_times_of_many_frames():
+    frame_indexes = np.array([0, 1, 1, 30 * 3661 + 7])
+    assert list(format_frame_times(frame_indexes, 30)) == [
+        format_frame_time(frame_index, 30) for frame_index in frame_indexes
+    ]
@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from detection_summary import INTERVALS, DetectionSummary
+
+
+
+def make_frames(frame_count, seed=0):
+    # Objects detected in each frame, with frames without objects
+    generator = random.Random(seed)
+    return [
+        [
+            {"name": generator.choice(["car", "bus", "person"])}
+            for _ in range(generator.choice([0, 0, 1, 2, 3]))
+        ]
+        for _ in range(frame_count)
+    ]
+
+
+def expected_averages(summary, frames, interval):
+    # Group the detections by bucket, then average over the buckets in ...
+    # ...which each object appears
+    buckets = {}
+    for frame_index, objects in enumerate(frames):
+        counts = buckets.setdefault(
+            summary.get_bucket(interval, frame_index), {}
+        )
+        for object in objects:
+            counts[object["name"]] = counts.get(object["name"], 0) + 1
+    total_counts = {}
+    bucket_counts = {}
+    for counts in buckets.values():
+        for name, count in counts.items():
+            total_counts[name] = total_counts.get(name, 0) + count
+            bucket_counts[name] = bucket_counts.get(name, 0) + 1
+    return {
+        name: total_counts[name] / bucket_counts[name]
+        for name in total_counts
+    }
+
+
+@pytest.mark.parametrize("frame_count", [1, 59, 500, 3 * 3600 + 17])
+def test_rolled_up_averages_match_a_group_by(frame_count):
+    frames_per_second = 1.5
+    frames = make_frames(frame_count)
+    summary = DetectionSummary(frames_per_second)
+    for frame_index, objects in enumerate(frames):
+        summary.add_frame(frame_index, objects)
+
+    for interval in INTERVALS:
+        averages = summary.averages(interval)
+        expected = expected_averages(summary, frames, interval)
+        assert averages == pytest.approx(expected)
+
+    total_counts = {}
+    for objects in frames:
+        for object in objects:
+            total_counts[object["name"]] = (
+                total_counts.get(object["name"], 0) + 1
+            )
+    assert summary.averages("full") == total_counts
+
+
+def test_buckets_are_absolute():
+    summary = DetectionSummary(10)
+    # Second 5 of minutes 0 and 1 are different buckets
+    assert summary.get_bucket("second", 50) == 5
+    assert summary.get_bucket("second", 650) == 65
+    assert summary.get_bucket("minute", 650) == 1
+    assert summary.get_bucket("hour", 36000) == 1
+
+
+def test_to_dict():
+    summary = DetectionSummary(2)
+    for frame_index in range(250):
+        summary.add_frame(frame_index, [{"name": "car"}])
+    result = summary.to_dict()
+    assert result["frames_per_second"] == 2
+    assert result["last_buckets"] == {
+        "frame": 249, "second": 124, "minute": 2, "hour": 0,
+    }
+    assert result["counts"]["second"] == {"car": 2.0}
+    assert result["counts"]["minute"] == {"car": 250 / 3}
+    assert result["counts"]["full"] == {"car": 250}
+
+
+def test_empty_summary():
+    summary = DetectionSummary(20)
+    assert summary.averages("second") == {}
+    assert summary.to_dict()["last_buckets"]["frame"] == 0
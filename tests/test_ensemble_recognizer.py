@@ -0,0 +1,92 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("torch")
+pytest.importorskip("imageai")
+
+from ensemble_recognizer import EnsembleRecognizer
+from image_recognizer import ImageRecognizer
+from result_cache import ResultCache
+
+
+
+def make_recognizer(algorithm, labels):
+    # Recognizer classifying every image with fixed labels, without a model
+    recognizer = object.__new__(ImageRecognizer)
+    recognizer.algorithm = algorithm
+    recognizer.max_pixels = None
+    recognizer.backend_options = {}
+    recognizer.decode_size = 256
+    recognizer.classify_batch = lambda images, n=5, batch_size=1: [
+        (labels[:n], [0.5] * len(labels[:n])) for _ in images
+    ]
+    return recognizer
+
+
+def make_ensemble(labels_per_algorithm):
+    ensemble = object.__new__(EnsembleRecognizer)
+    ensemble.algorithms = list(labels_per_algorithm)
+    ensemble.max_pixels = None
+    ensemble.recognizers = [
+        make_recognizer(algorithm, labels)
+        for algorithm, labels in labels_per_algorithm.items()
+    ]
+    ensemble.decode_size = 256
+    return ensemble
+
+
+def encode_image(value):
+    output = io.BytesIO()
+    Image.fromarray(np.full((8, 8, 3), value, np.uint8)).save(output, "PNG")
+    return output.getvalue()
+
+
+@pytest.fixture
+def decoded(monkeypatch):
+    # Count the images decoded
+    decoded = []
+    decode_image = ImageRecognizer.decode_image
+
+    def counting_decode_image(image, size=None, max_pixels=None):
+        if isinstance(image, bytes):
+            decoded.append(image)
+        return decode_image(image, size, max_pixels)
+
+    monkeypatch.setattr(
+        ImageRecognizer, "decode_image", staticmethod(counting_decode_image)
+    )
+    return decoded
+
+
+def test_predict_streams_averages_models(decoded):
+    ensemble = make_ensemble({"A": ["cat", "dog"], "B": ["cat", "fox"]})
+    predictions = ensemble.predict_streams([encode_image(0)], ["0.png"], n=2)
+    assert [model["algorithm"] for model in predictions[0]["models"]] == [
+        "A", "B",
+    ]
+    assert predictions[0]["ensemble"][0]["label"] == "cat"
+    assert len(decoded) == 1
+
+
+def test_predict_streams_decodes_cache_misses_only(tmp_path, decoded):
+    cache = ResultCache(str(tmp_path))
+    ensemble = make_ensemble({"A": ["cat"], "B": ["dog"]})
+    images = [encode_image(0), encode_image(100)]
+    first = ensemble.predict_streams(images[:1], cache=cache)
+    assert len(decoded) == 1
+
+    # Only the new image is decoded
+    del decoded[:]
+    second = ensemble.predict_streams(images, cache=cache)
+    assert decoded == images[1:]
+    assert second[0]["models"] == first[0]["models"]
+
+    # An image missing for one model only is decoded once for it
+    del decoded[:]
+    ensemble.recognizers.append(make_recognizer("C", ["fox"]))
+    ensemble.algorithms.append("C")
+    ensemble.predict_streams(images, cache=cache)
+    assert decoded == images
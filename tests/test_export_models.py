@@ -0,0 +1,41 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("imageai")
+pytest.importorskip("onnxruntime")
+
+from imageai.yolov3.tiny_yolov3 import YoloV3Tiny
+
+from export_models import export_model, traceable_detection_layers
+from inference_backends import OnnxRuntimeModel, get_export_path
+
+# Anchors of ImageAI's TinyYOLOv3 model
+TINY_YOLOV3_ANCHORS = [10, 14, 23, 27, 37, 58, 81, 82, 135, 169, 344, 319]
+
+
+
+def test_detection_models_export_with_a_dynamic_batch(tmp_path):
+    torch.manual_seed(0)
+    model = YoloV3Tiny(anchors=TINY_YOLOV3_ANCHORS, num_classes=80).eval()
+    weights_path = str(tmp_path / "tiny-yolov3.pt")
+    with traceable_detection_layers():
+        export_model(
+            model, [torch.rand(1, 3, 416, 416)], weights_path,
+            ["torchscript", "onnx"], dynamic_batch=True,
+        )
+
+    onnx_model = OnnxRuntimeModel(get_export_path(weights_path, "onnxruntime"))
+    torchscript_model = torch.jit.load(
+        get_export_path(weights_path, "torchscript")
+    )
+    for batch_size in [1, 3]:
+        inputs = torch.rand(batch_size, 3, 416, 416)
+        with torch.no_grad():
+            expected = model(inputs)
+            # The exported models depend on their input
+            assert torch.allclose(
+                torchscript_model(inputs), expected, atol=1e-4
+            )
+        outputs = onnx_model(inputs)
+        assert outputs.shape == (batch_size, 2535, 85)
+        assert torch.allclose(outputs, expected, atol=0.1)
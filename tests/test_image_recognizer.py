@@ -0,0 +1,127 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("imageai")
+
+from imageai.Classification import ImageClassification
+from image_recognizer import ImageRecognizer
+
+
+
+def encode_image(width, height, image_format="JPEG"):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 100, 50)).save(
+        output, image_format
+    )
+    return output.getvalue()
+
+
+def test_large_images_are_decoded_to_the_decode_size():
+    image = ImageRecognizer.decode_image(encode_image(2000, 1000), 256)
+    assert image.mode == "RGB"
+    assert image.size == (512, 256)
+
+
+def test_small_images_are_not_upscaled():
+    image = ImageRecognizer.decode_image(encode_image(100, 80, "PNG"), 256)
+    assert image.size == (100, 80)
+
+
+def test_decompression_bombs_are_rejected():
+    with pytest.raises(ValueError):
+        ImageRecognizer.decode_image(
+            encode_image(4000, 3000, "PNG"), 256, max_pixels=1000000
+        )
+
+
+def test_decoded_images_are_passed_through():
+    image = Image.new("RGB", (10, 10))
+    assert ImageRecognizer.decode_image(image) is image
+    array = np.zeros((10, 20, 3), np.uint8)
+    assert ImageRecognizer.decode_image(array).size == (20, 10)
+
+
+
+@pytest.fixture
+def forward_batches(monkeypatch):
+    # ImageAI classifier with a small random model instead of the weights, ...
+    # ...recording the number of images of each forward pass
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(
+        torch.nn.AdaptiveAvgPool2d(4),
+        torch.nn.Flatten(),
+        torch.nn.Linear(48, 10),
+    ).eval()
+    batches = []
+    model.register_forward_pre_hook(
+        lambda module, inputs: batches.append(len(inputs[0]))
+    )
+    prediction = ImageClassification()
+    prediction._ImageClassification__model = model
+    prediction._ImageClassification__classes = [
+        "class " + str(index) for index in range(10)
+    ]
+    prediction._ImageClassification__device = "cpu"
+    prediction._ImageClassification__model_loaded = True
+    monkeypatch.setattr(
+        ImageRecognizer, "load_model",
+        classmethod(lambda cls, *args, **kwargs: prediction),
+    )
+    return batches
+
+
+def test_classify_batch_matches_classify_image(forward_batches):
+    recognizer = ImageRecognizer("models", "ResNet50")
+    rng = np.random.default_rng(0)
+    images = [
+        Image.fromarray(
+            rng.integers(0, 256, (height, 300, 3), dtype=np.uint8)
+        )
+        for height in range(250, 260)
+    ]
+
+    results = recognizer.classify_batch(images, n=3, batch_size=4)
+
+    # One forward pass per chunk of `batch_size` images
+    assert forward_batches == [4, 4, 2]
+    del forward_batches[:]
+    for image, (predictions, probabilities) in zip(images, results):
+        expected_predictions, expected_probabilities = (
+            recognizer.prediction.classifyImage(image, result_count=3)
+        )
+        assert predictions == expected_predictions
+        assert probabilities == pytest.approx(
+            expected_probabilities, abs=1e-3
+        )
+    assert forward_batches == [1] * len(images)
+
+
+def test_predict_streams_names_batched_predictions(forward_batches):
+    recognizer = ImageRecognizer("models", "ResNet50")
+    images = [encode_image(300, height) for height in range(250, 255)]
+
+    predictions = recognizer.predict_streams(
+        [io.BytesIO(image) for image in images],
+        image_names=["a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg"],
+        n=2,
+        batch_size=2,
+    )
+
+    assert forward_batches == [2, 2, 1]
+    assert [prediction["image"] for prediction in predictions] == [
+        "a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg",
+    ]
+    for image, prediction in zip(images, predictions):
+        labels, probabilities = recognizer.prediction.classifyImage(
+            Image.open(io.BytesIO(image)), result_count=2
+        )
+        assert [
+            item["label"] for item in prediction["predictions"]
+        ] == labels
+        assert [
+            item["probability"] for item in prediction["predictions"]
+        ] == pytest.approx(probabilities, abs=0.01)
@@ -0,0 +1,123 @@
+import time
+import pytest
+from job_queue import (
+    JobQueue, connect, update_job, QUEUED, RUNNING, DONE, FAILED,
+)
+
+
+
+def wait_for(job_queue, job_id, statuses=(DONE, FAILED), timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = job_queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.1)
+    raise AssertionError("Job {} didn't finish".format(job_id))
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    job_queue = JobQueue(str(tmp_path / "jobs.db"), max_restarts=1)
+    yield job_queue
+    job_queue.shutdown()
+
+
+def test_job_result_and_progress(job_queue):
+    job_id = job_queue.submit("job_functions:add", {"a": 1, "b": 2})
+    job = wait_for(job_queue, job_id)
+
+    assert job["status"] == DONE
+    assert job["progress"] == 100.0
+    assert job["result"] == {"sum": 3}
+
+
+def test_failed_job_records_the_error(job_queue):
+    job = wait_for(job_queue, job_queue.submit("job_functions:fail", {}))
+
+    assert job["status"] == FAILED
+    assert "Job failed" in job["error"]
+
+
+@pytest.mark.parametrize("function, error", [
+    ("job_functions:missing", "AttributeError"),
+    ("missing_module:run", "ModuleNotFoundError"),
+    ("job_functions", "ValueError"),
+])
+def test_job_with_unknown_function_fails(job_queue, function, error):
+    job = wait_for(job_queue, job_queue.submit(function, {}), timeout=10)
+
+    assert job["status"] == FAILED
+    assert error in job["error"]
+
+
+def test_job_killing_its_worker_fails_after_max_restarts(job_queue):
+    job_id = job_queue.submit("job_functions:kill_worker", {})
+    job = wait_for(job_queue, job_id)
+
+    assert job["status"] == FAILED
+    assert "died 2 times" in job["error"]
+    # The pool was replaced and still runs jobs
+    job = wait_for(
+        job_queue, job_queue.submit("job_functions:add", {"a": 2, "b": 2})
+    )
+    assert job["result"] == {"sum": 4}
+
+
+def test_get_unknown_job(job_queue):
+    assert job_queue.get("missing") is None
+
+
+def test_stale_running_job_is_queued_again(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    job_queue = JobQueue(db_path, stale_after=60)
+    job_queue.shutdown()
+    # A job left running by a worker which died with the app
+    with connect(db_path) as connection:
+        connection.execute(
+            "INSERT INTO jobs (id, status, function, kwargs, created_at, "
+            "updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            ("stale", RUNNING, "job_functions:add", '{"a": 1, "b": 1}',
+             0, 0),
+        )
+    connection.close()
+
+    job_queue = JobQueue(db_path, stale_after=60)
+    try:
+        job = wait_for(job_queue, "stale")
+        assert job["result"] == {"sum": 2}
+    finally:
+        job_queue.shutdown()
+
+
+def test_running_job_with_heartbeat_is_not_queued_again(job_queue):
+    job_id = job_queue.submit("job_functions:add", {"a": 1, "b": 1})
+    wait_for(job_queue, job_id)
+    update_job(job_queue.db_path, job_id, status=RUNNING)
+
+    assert job_queue.requeue_stale_jobs() == []
+    assert job_queue.get(job_id)["status"] == RUNNING
+
+
+def test_broken_pool_after_shutdown_does_not_requeue(tmp_path):
+    job_queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_queue.shutdown()
+    with connect(job_queue.db_path) as connection:
+        connection.execute(
+            "INSERT INTO jobs (id, status, function, kwargs, created_at, "
+            "updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            ("queued", QUEUED, "job_functions:add", "{}", 0, 0),
+        )
+    connection.close()
+
+    class BrokenFuture:
+        def cancelled(self):
+            return False
+
+        def exception(self):
+            from concurrent.futures.process import BrokenProcessPool
+            return BrokenProcessPool()
+
+    # No new future is scheduled on the closed pool
+    job_queue.on_job_exit("queued", BrokenFuture())
+    assert job_queue.get("queued")["status"] == QUEUED
@@ -0,0 +1,70 @@
+from metrics import MetricsRegistry
+
+
+
+def test_counters_and_gauges():
+    registry = MetricsRegistry()
+    registry.describe("requests_total", "Number of requests.")
+    registry.inc("requests_total", endpoint="classify")
+    registry.inc("requests_total", 2, endpoint="classify")
+    registry.add("in_progress", 1)
+    registry.add("in_progress", -1)
+    registry.set("model", 1, kind='Tiny"YOLO"')
+
+    text = registry.render()
+    assert "# HELP requests_total Number of requests.\n" in text
+    assert "# TYPE requests_total counter\n" in text
+    assert 'requests_total{endpoint="classify"} 3\n' in text
+    assert "in_progress 0\n" in text
+    # Label values are escaped
+    assert 'model{kind="Tiny\\"YOLO\\""} 1\n' in text
+
+    registry.reset("model")
+    assert "model{" not in registry.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    for value in [0.05, 0.5, 0.7, 5.0]:
+        registry.observe("seconds", value, stage="decode")
+
+    text = registry.render()
+    assert 'seconds_bucket{stage="decode",le="0.1"} 1\n' in text
+    assert 'seconds_bucket{stage="decode",le="1.0"} 3\n' in text
+    assert 'seconds_bucket{stage="decode",le="+Inf"} 4\n' in text
+    assert 'seconds_count{stage="decode"} 4\n' in text
+    assert 'seconds_sum{stage="decode"} 6.25\n' in text
+
+
+def test_timers():
+    registry = MetricsRegistry()
+
+    @registry.timer("decorated")
+    def function():
+        return 1
+
+    assert function() == 1
+    with registry.timer("block", model="ResNet50") as timer:
+        pass
+    assert timer.seconds >= 0
+    assert set(registry.histograms["imageai_stage_seconds"]) == {
+        (("stage", "decorated"),),
+        (("model", "ResNet50"), ("stage", "block")),
+    }
+
+
+def test_snapshots_of_other_processes_are_merged(tmp_path):
+    worker_registry = MetricsRegistry(buckets=(1.0,))
+    worker_registry.inc("jobs_total")
+    worker_registry.observe("seconds", 0.5)
+    worker_registry.save(str(tmp_path / "worker.json"))
+    # Unreadable snapshots are skipped
+    (tmp_path / "broken.json").write_text("{")
+
+    registry = MetricsRegistry(buckets=(1.0,))
+    registry.inc("jobs_total")
+    registry.observe("seconds", 2.0)
+    text = registry.render_directory(str(tmp_path))
+    assert "jobs_total 2\n" in text
+    assert 'seconds_bucket{le="1.0"} 1\n' in text
+    assert "seconds_count 2\n" in text
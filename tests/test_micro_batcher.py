@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+from micro_batcher import MicroBatcher, get_micro_batcher
+
+
+
+def start_batcher(function, **options):
+    batcher = MicroBatcher("test", function, **options)
+    batcher.start()
+    return batcher
+
+
+def test_concurrent_requests_are_coalesced():
+    batches = []
+    # Hold the first batch until every request is queued behind it
+    release = threading.Event()
+
+    def double(items):
+        batches.append(list(items))
+        release.wait(5)
+        return [item * 2 for item in items]
+
+    batcher = start_batcher(double, max_batch_size=4, max_wait=0)
+    results = {}
+    threads = [
+        threading.Thread(target=lambda i=i: results.update(
+            {i: batcher.submit([i, i + 100])}
+        ))
+        for i in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    while not batches or batcher.requests.qsize() < 10 - len(batches[0]):
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == {i: [i * 2, (i + 100) * 2] for i in range(5)}
+    # The items queued meanwhile are classified in full batches
+    assert sum(len(batch) for batch in batches) == 10
+    assert [len(batch) for batch in batches[1:3]] == [4, 4]
+
+
+def test_batches_wait_for_more_items():
+    batches = []
+
+    def identity(items):
+        batches.append(list(items))
+        return items
+
+    batcher = start_batcher(identity, max_batch_size=8, max_wait=0.2)
+    threads = [
+        threading.Thread(target=batcher.submit, args=([i],))
+        for i in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The items submitted within max_wait share a batch
+    assert sorted(sum(batches, [])) == [0, 1, 2]
+    assert len(batches) == 1
+
+
+def test_errors_are_raised_in_every_request_of_the_batch():
+    def fail(items):
+        raise ValueError("Batch failed")
+
+    batcher = start_batcher(fail, max_wait=0)
+    with pytest.raises(ValueError):
+        batcher.submit([1, 2])
+    # The batcher keeps running
+    assert batcher.is_alive()
+
+
+def test_missing_results_are_raised_in_every_request_of_the_batch():
+    batcher = start_batcher(lambda items: items[1:], max_wait=0)
+    with pytest.raises(RuntimeError):
+        batcher.submit([1, 2])
+    assert batcher.is_alive()
+
+
+def test_micro_batchers_are_shared_by_name():
+    batcher = get_micro_batcher("test-shared", lambda items: items)
+    assert get_micro_batcher("test-shared", None) is batcher
+    assert batcher.submit(["a"]) == ["a"]
+
+
+def test_micro_batchers_keep_their_first_settings():
+    get_micro_batcher("test-settings", lambda items: items, max_wait=0.01)
+    with pytest.raises(ValueError):
+        get_micro_batcher(
+            "test-settings", lambda items: items, max_batch_size=8,
+            max_wait=0.01,
+        )
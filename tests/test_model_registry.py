@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from model_registry import ModelRegistry
+
+
+
+def write_weights(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b"0" * size)
+    return str(path)
+
+
+def test_models_are_loaded_once_and_shared(tmp_path):
+    registry = ModelRegistry()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        # Let the other threads wait for the load
+        time.sleep(0.05)
+        return object()
+
+    models = []
+    threads = [
+        threading.Thread(target=lambda: models.append(registry.get(
+            ("Test", "A"), loader, str(tmp_path / "missing")
+        )))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert all(model is models[0] for model in models)
+    assert registry.memory_usage() == 0
+
+
+def test_failed_loads_are_not_kept(tmp_path):
+    registry = ModelRegistry()
+
+    def loader():
+        raise OSError("Missing weights")
+
+    with pytest.raises(OSError):
+        registry.get(("Test", "A"), loader, str(tmp_path / "missing"))
+    assert registry._load_locks == {}
+    # The model is loaded on the next request
+    model = registry.get(("Test", "A"), object, str(tmp_path / "missing"))
+    assert registry.get(("Test", "A"), None, "") is model
+
+
+def test_least_recently_used_models_are_evicted(tmp_path):
+    registry = ModelRegistry(max_models=2)
+    path = write_weights(tmp_path, "weights.pt", 10)
+    for name in ["A", "B"]:
+        registry.get(("Test", name), object, path)
+    # Use A again, so that B is the least recently used model
+    registry.get(("Test", "A"), object, path)
+    registry.get(("Test", "C"), object, path)
+    assert registry.loaded() == [("Test", "A"), ("Test", "C")]
+
+
+def test_memory_budget(tmp_path):
+    registry = ModelRegistry()
+    registry.get(("Test", "A"), object, write_weights(tmp_path, "a.pt", 60))
+    registry.get(("Test", "B"), object, write_weights(tmp_path, "b.pt", 50))
+    assert registry.memory_usage() == 110
+
+    registry.configure(memory_budget=100)
+    assert registry.loaded() == [("Test", "B")]
+    # A model larger than the budget is still kept once loaded
+    registry.get(("Test", "C"), object, write_weights(tmp_path, "c.pt", 200))
+    assert registry.loaded() == [("Test", "C")]
+
+
+def test_evict_and_clear(tmp_path):
+    registry = ModelRegistry()
+    path = str(tmp_path / "missing")
+    first = registry.get(("Test", "A"), object, path)
+    registry.get(("Test", "B"), object, path)
+    registry.evict(("Test", "A"))
+    assert registry.loaded() == [("Test", "B")]
+    assert registry.get(("Test", "A"), object, path) is not first
+    registry.clear()
+    assert registry.loaded() == []
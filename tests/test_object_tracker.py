@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+import pytest
+
+from object_tracker import ObjectTracker, box_iou
+
+
+
+def car(x, name="car"):
+    return {
+        "name": name,
+        "percentage_probability": 90.0,
+        "box_points": [x, 0, x + 20, 20],
+    }
+
+
+def test_box_iou():
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 0, 0]], dtype=np.float64)
+    other_boxes = np.array([[5, 0, 15, 10], [20, 20, 30, 30]], np.float64)
+    assert box_iou(boxes, other_boxes) == pytest.approx(
+        np.array([[1 / 3, 0], [0, 0]])
+    )
+
+
+def test_moving_objects_keep_their_track():
+    tracker = ObjectTracker(min_hits=2)
+    for frame_index in range(5):
+        output_array = tracker.track(
+            frame_index, [car(2 * frame_index), car(100 + 2 * frame_index)]
+        )
+        assert [object["track_id"] for object in output_array] == [1, 2]
+
+    assert tracker.unique_counts() == {"car": 2}
+    assert tracker.average_dwell_seconds(5) == {"car": 1.0}
+
+
+def test_objects_of_other_names_are_not_matched():
+    tracker = ObjectTracker()
+    tracker.track(0, [car(0)])
+    assert tracker.track(1, [car(0, "bus")])[0]["track_id"] == 2
+
+
+def test_skipped_frames_are_propagated_with_the_velocity():
+    tracker = ObjectTracker(smoothing=1.0)
+    tracker.track(0, [car(0)])
+    tracker.track(4, [car(8)])
+    # The detections of frame 4 carried forward to frame 6
+    output_array = tracker.track(6, [car(8)], inferred=False)
+    assert output_array[0]["box_points"] == [12, 0, 32, 20]
+    assert output_array[0]["track_id"] == 1
+    assert tracker.get_tracks(2)[0]["last_frame"] == 6
+
+
+def test_tracks_end_after_max_misses():
+    tracker = ObjectTracker(max_misses=1)
+    tracker.track(0, [car(0)])
+    tracker.track(1, [])
+    assert tracker.track(2, [car(0)])[0]["track_id"] == 1
+    tracker.track(3, [])
+    tracker.track(4, [])
+    assert tracker.track(5, [car(0)])[0]["track_id"] == 2
+    # Tracks with a single detection are not counted
+    assert tracker.unique_counts() == {"car": 1}
+
+
+def test_state_is_restored_from_a_checkpoint():
+    tracker = ObjectTracker()
+    for frame_index in range(3):
+        tracker.track(frame_index, [car(frame_index)])
+    restored = ObjectTracker()
+    restored.load_state(json.loads(json.dumps(tracker.to_dict())))
+
+    # Restored frames are not tracked again
+    assert restored.track(2, [car(50)]) == [car(50)]
+    assert (
+        restored.track(3, [car(3)]) == tracker.track(3, [car(3)])
+    )
+    assert restored.get_tracks(20) == tracker.get_tracks(20)
@@ -0,0 +1,91 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from PIL import Image
+from preview_writer import PreviewWriter
+
+
+
+def add_frames(preview, frames=10):
+    for frame_index in range(frames):
+        preview.add_frame(
+            frame_index, np.full((40, 60, 3), 20 * frame_index, dtype=np.uint8)
+        )
+
+
+def test_gif_preview_keeps_one_frame_out_of_frame_skip(tmp_path):
+    output_path = str(tmp_path / "preview.gif")
+    preview = PreviewWriter(output_path, 20, frame_skip=2, scale=0.5)
+    add_frames(preview)
+    preview.close()
+
+    with Image.open(output_path) as image:
+        assert image.n_frames == 5
+        assert image.size == (30, 20)
+
+
+def test_max_duration_limits_the_frames(tmp_path):
+    output_path = str(tmp_path / "preview.webp")
+    preview = PreviewWriter(
+        output_path, 10, frame_skip=1, scale=1, max_duration=0.3
+    )
+    add_frames(preview)
+    preview.close()
+
+    with Image.open(output_path) as image:
+        assert image.n_frames == 3
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        PreviewWriter(str(tmp_path / "preview.avi"), 20)
+
+
+def test_close_raises_the_error_of_the_final_save(tmp_path):
+    output_path = os.path.join(str(tmp_path), "missing", "preview.gif")
+    preview = PreviewWriter(output_path, 20, queue_size=2)
+    add_frames(preview)
+    preview.join(timeout=0)
+
+    with pytest.raises(OSError):
+        preview.close()
+    assert not preview.is_alive()
+
+
+@pytest.mark.parametrize("max_duration, output_video_gif", [
+    (None, "traffic_detected.gif"),
+    # No frames to write, so no preview
+    (0, None),
+])
+def test_process_video_names_only_written_previews(
+    tmp_path, monkeypatch, max_duration, output_video_gif
+):
+    pytest.importorskip("torch")
+    pytest.importorskip("imageai")
+    from video_object_detector import VideoObjectDetector, process_video
+    from video_functions import StubVideoDetector
+
+    monkeypatch.setattr(
+        VideoObjectDetector, "load_model",
+        staticmethod(lambda *args: StubVideoDetector()),
+    )
+    shutil.copy(
+        os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            "files_for_testing", "traffic.mp4",
+        ),
+        str(tmp_path),
+    )
+    results = process_video(
+        "models", "yolov3", 20, str(tmp_path), "traffic.mp4",
+        preview_options={"max_duration": max_duration},
+        # The stub detector has no detectObjectsFromVideo()
+        sampling_mode="stride",
+        sampling_options={"stride": 1},
+    )
+
+    assert results["output_video_gif"] == output_video_gif
+    assert os.path.exists(str(tmp_path / "traffic_detected.gif")) == (
+        output_video_gif is not None
+    )
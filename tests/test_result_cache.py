@@ -0,0 +1,55 @@
+import io
+import os
+
+from result_cache import ResultCache, content_hash
+
+
+
+def test_content_hash_of_bytes_and_files():
+    data = b"0" * (3 * 1024 * 1024 + 1)
+    assert content_hash(data) == content_hash(io.BytesIO(data))
+    assert content_hash(data) != content_hash(data[:-1])
+
+
+def test_keys_depend_on_all_parts():
+    key = ResultCache.make_key("sha", "ResNet50", 5)
+    assert key == ResultCache.make_key("sha", "ResNet50", 5)
+    assert key != ResultCache.make_key("sha", "ResNet50", 10)
+    assert key != ResultCache.make_key("sha", "MobileNetV2", 5)
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    cache = ResultCache(str(tmp_path), max_memory_entries=1)
+    assert cache.get("a") is None
+    cache.put("a", {"value": 1})
+    cache.put("b", {"value": 2})
+    assert cache.get("b") == {"value": 2}
+    # "a" was evicted from memory but is still on disk
+    assert cache.get("a") == {"value": 1}
+    assert cache.stats() == {
+        "memory_hits": 1, "disk_hits": 1, "misses": 1, "memory_entries": 1,
+    }
+
+    # Another process sees the results on disk
+    assert ResultCache(str(tmp_path)).get("b") == {"value": 2}
+
+
+def test_output_files(tmp_path):
+    files_path = tmp_path / "files"
+    files_path.mkdir()
+    (files_path / "video.mp4").write_bytes(b"video")
+    cache = ResultCache(str(tmp_path / "cache"))
+    cache.put("a", {}, str(files_path), ["video.mp4"])
+
+    destination_path = tmp_path / "destination"
+    destination_path.mkdir()
+    assert cache.copy_files("a", ["video.mp4"], str(destination_path))
+    assert (destination_path / "video.mp4").read_bytes() == b"video"
+    assert not cache.copy_files("a", ["chart.png"], str(destination_path))
+
+
+def test_storing_a_result_twice_keeps_the_first_entry(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put("a", {"value": 1})
+    cache.put("a", {"value": 1})
+    assert os.listdir(str(tmp_path)) == ["a"]
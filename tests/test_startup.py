@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import subprocess
+
+
+# Root folder of the app
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules which must only be imported by the requests needing them
+HEAVY_MODULES = ["torch", "torchvision", "imageai", "cv2", "pandas",
+                 "matplotlib"]
+
+# Budget of the import of the app in seconds
+STARTUP_BUDGET = float(os.environ.get("IMAGEAI_STARTUP_BUDGET", 2.0))
+
+
+def import_app():
+    """Import the app in a fresh interpreter.
+    Returns:
+    - seconds: The import time of the app.
+    - modules: The names of the top-level modules imported.
+    """
+    code = (
+        "import importlib, json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "importlib.import_module('ImageAI-web-apps')\n"
+        "seconds = time.perf_counter() - start\n"
+        "print(json.dumps({'seconds': seconds, 'modules': sorted(set(\n"
+        "    name.split('.')[0] for name in sys.modules))}))\n"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT_PATH, env=dict(os.environ, IMAGEAI_PRELOAD="0"),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True,
+    )
+    result = json.loads(completed.stdout.splitlines()[-1])
+    return result["seconds"], set(result["modules"])
+
+
+def test_app_startup_is_fast_and_lazy():
+    seconds, modules = import_app()
+
+    assert not modules & set(HEAVY_MODULES)
+    assert seconds < STARTUP_BUDGET
@@ -0,0 +1,285 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+import video_engine
+import video_pipeline
+from video_engine import FrameSampler, get_segments
+from video_functions import StubVideoDetector, init_stub_worker
+
+VIDEO_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "files_for_testing", "traffic.mp4",
+)
+
+
+
+def test_stride_sampler_infers_every_nth_frame():
+    sampler = FrameSampler(mode="stride", stride=3)
+    inferred = [sampler.should_infer(index) for index in range(7)]
+    assert inferred == [True, False, False, True, False, False, True]
+    assert (sampler.frames_total, sampler.frames_inferred) == (7, 3)
+
+
+def test_fps_sampler_infers_at_analysis_rate():
+    sampler = FrameSampler(mode="fps", source_fps=30, analysis_fps=10)
+    inferred = [sampler.should_infer(index) for index in range(30)]
+    assert sum(inferred) == 10
+
+
+def test_sampler_max_skip_and_force():
+    sampler = FrameSampler(mode="stride", stride=10, max_skip=2)
+    inferred = [sampler.should_infer(index) for index in range(7)]
+    assert inferred == [True, False, False, True, False, False, True]
+    assert FrameSampler(mode="stride", stride=10).should_infer(5, force=True)
+
+
+def test_adaptive_sampler_infers_changed_frames():
+    sampler = FrameSampler(mode="adaptive", difference_threshold=8.0)
+    frames = [
+        np.full((48, 64, 3), value, np.uint8)
+        for value in [0, 4, 6, 40, 42, 100]
+    ]
+    inferred = [
+        sampler.should_infer(index, frame)
+        for index, frame in enumerate(frames)
+    ]
+    # Frames are compared with the last inferred frame, not the previous one
+    assert inferred == [True, False, False, True, False, True]
+
+
+def test_detect_objects_sampled_carries_detections_forward(tmp_path):
+    arrays = []
+    sampler = FrameSampler(mode="stride", stride=5)
+    output_video_path = video_engine.detect_objects_sampled(
+        StubVideoDetector(),
+        VIDEO_PATH,
+        str(tmp_path / "output"),
+        20,
+        sampler,
+        per_frame_function=lambda number, array, count: arrays.append(array),
+    )
+
+    assert (sampler.frames_total, sampler.frames_inferred) == (163, 33)
+    # The skipped frames get the detections of the last inferred frame
+    assert all(arrays[i] is arrays[i - i % 5] for i in range(163))
+    video = cv2.VideoCapture(output_video_path)
+    assert int(video.get(cv2.CAP_PROP_FRAME_COUNT)) == 163
+    video.release()
+
+
+def test_unknown_sampling_mode():
+    with pytest.raises(ValueError):
+        FrameSampler(mode="random")
+
+
+def test_segments_without_keyframes():
+    assert get_segments(10, 4) == [(0, 4), (4, 4), (8, None)]
+    assert get_segments(0, 4) == [(0, None)]
+
+
+def test_segments_start_on_nearest_keyframes():
+    assert get_segments(300, 100, [0, 90, 150, 240]) == [
+        (0, 90), (90, 150), (240, None),
+    ]
+    # Keyframes close to the start are merged into the first segment
+    assert get_segments(100, 50, [0, 2]) == [(0, 2), (2, None)]
+    assert get_segments(100, 50, [0]) == [(0, None)]
+
+
+@pytest.fixture
+def stub_segment_pool():
+    # Pool of workers with a stub detector, used instead of loading a model
+    key = ("models", "stub", 2, ())
+    video_engine._segment_pools[key] = ProcessPoolExecutor(
+        max_workers=2,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_stub_worker,
+    )
+    yield
+    video_engine.shutdown_segment_pools()
+
+
+@pytest.mark.usefixtures("stub_segment_pool")
+def test_detect_objects_chunked_concatenates_annotated_segments(tmp_path):
+    frames = []
+    results = []
+    sampler = FrameSampler(mode="stride", stride=5)
+    output_video_path = video_engine.detect_objects_chunked(
+        "models",
+        "stub",
+        input_file_path=VIDEO_PATH,
+        output_file_path=str(tmp_path / "output"),
+        frames_per_second=20,
+        sampler=sampler,
+        workers=2,
+        segment_frames=50,
+        per_frame_function=lambda number, array, count, frame: (
+            frames.append((number, count, frame))
+        ),
+        video_complete_function=lambda *args: results.append(args),
+        return_detected_frame=True,
+        detected_frames=3,
+    )
+
+    video = cv2.VideoCapture(output_video_path)
+    total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    assert total_frames == 163
+    assert [number for number, _, _ in frames] == list(range(1, 164))
+    assert all(count == {"car": 1} for _, count, _ in frames)
+    # Only the annotated frames asked for are decoded
+    assert all(frame is not None for _, _, frame in frames[:3])
+    assert all(frame is None for _, _, frame in frames[3:])
+    assert results[0][2] == {"car": 1.0}
+    assert sampler.frames_total == 163
+    # The segments and their list are removed
+    assert os.listdir(str(tmp_path)) == ["output.mp4"]
+
+
+def test_shutdown_segment_pools():
+    executor = video_engine._segment_pools.setdefault(
+        ("models", "stub", 1, ()), ProcessPoolExecutor(max_workers=1)
+    )
+    video_engine.shutdown_segment_pools()
+    assert video_engine._segment_pools == {}
+    with pytest.raises(RuntimeError):
+        executor.submit(print)
+
+
+@pytest.fixture
+def batch_sizes(monkeypatch):
+    # Stand-ins for the model: the frame is its own input tensor, and ...
+    # ...each batch is detected by the stub one frame at a time
+    sizes = []
+
+    def infer_batch(image_detector, tensors, frame_sizes,
+                    minimum_percentage_probability=30):
+        sizes.append(len(tensors))
+        # Slow enough for the frames to queue up behind the inference
+        time.sleep(0.005)
+        return [
+            image_detector.detectObjectsFromImage(tensor)[1]
+            for tensor in tensors
+        ]
+
+    monkeypatch.setattr(
+        video_pipeline, "prepare_frame", lambda image_detector, frame: frame
+    )
+    monkeypatch.setattr(video_pipeline, "infer_batch", infer_batch)
+    return sizes
+
+
+def run_pipelined(tmp_path, sampler, **kwargs):
+    # Run the pipeline on another thread, so that a deadlock fails the ...
+    # ...test instead of hanging it
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = video_pipeline.detect_objects_pipelined(
+                StubVideoDetector(), VIDEO_PATH, str(tmp_path / "output"),
+                20, sampler, **kwargs
+            )
+        except Exception as error:
+            outcome["error"] = error
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout=60)
+    assert not thread.is_alive(), "The pipeline is deadlocked"
+    return outcome
+
+
+@pytest.mark.parametrize("stride", [1, 3])
+def test_pipelined_matches_sequential(tmp_path, batch_sizes, stride):
+    sequential = []
+    video_engine.detect_objects_sampled(
+        StubVideoDetector(), VIDEO_PATH, str(tmp_path / "sequential"), 20,
+        FrameSampler(mode="stride", stride=stride),
+        per_frame_function=lambda number, array, count: (
+            sequential.append((number, array, count))
+        ),
+    )
+
+    pipelined = []
+    sampler = FrameSampler(mode="stride", stride=stride)
+    outcome = run_pipelined(
+        tmp_path, sampler,
+        per_frame_function=lambda number, array, count: (
+            pipelined.append((number, array, count))
+        ),
+        batch_size=4,
+    )
+
+    output_video_path, metrics = outcome["result"]
+    assert pipelined == sequential
+    assert [number for number, _, _ in pipelined] == list(range(1, 164))
+    # Frames are batched, up to the batch size, and each sampled frame is ...
+    # ...inferred once
+    assert max(batch_sizes) > 1
+    assert max(batch_sizes) <= 4
+    assert sum(batch_sizes) == sampler.frames_inferred
+    assert all(
+        stage["frames"] == 163
+        for stage in metrics.to_dict()["stages"].values()
+    )
+    video = cv2.VideoCapture(output_video_path)
+    assert int(video.get(cv2.CAP_PROP_FRAME_COUNT)) == 163
+    video.release()
+
+
+
+class FailingCapture:
+    """Video capture failing after the first frames of the test video."""
+
+    VideoCapture = cv2.VideoCapture
+
+    def __init__(self, input_file_path):
+        self.video = self.VideoCapture(input_file_path)
+        self.frames = 0
+
+    def read(self):
+        self.frames += 1
+        if self.frames > 10:
+            raise RuntimeError("decode failed")
+        return self.video.read()
+
+    def release(self):
+        self.video.release()
+
+
+@pytest.mark.parametrize(
+    "stage", ["decode", "preprocess", "infer", "encode"]
+)
+def test_pipelined_stage_failure_stops_all_stages(
+    tmp_path, monkeypatch, batch_sizes, stage
+):
+    def fail(*args, **kwargs):
+        raise RuntimeError(stage + " failed")
+
+    if stage == "decode":
+        monkeypatch.setattr(video_pipeline.cv2, "VideoCapture", FailingCapture)
+    elif stage == "preprocess":
+        monkeypatch.setattr(video_pipeline, "prepare_frame", fail)
+    elif stage == "infer":
+        monkeypatch.setattr(video_pipeline, "infer_batch", fail)
+    threads = threading.active_count()
+
+    # Queues of one frame are full as soon as a stage stops consuming
+    outcome = run_pipelined(
+        tmp_path, FrameSampler(mode="stride", stride=1),
+        per_frame_function=fail if stage == "encode" else None,
+        batch_size=2,
+        queue_size=1,
+    )
+
+    assert str(outcome["error"]) == stage + " failed"
+    # The decode, preprocess and encode threads have ended too
+    assert threading.active_count() == threads
@@ -0,0 +1,184 @@
+import io
+import os
+import json
+import base64
+import importlib
+
+import pytest
+
+
+
+@pytest.fixture(scope="module")
+def web_app(tmp_path_factory):
+    # The app keeps its cache, jobs and results in the working directory
+    working_path = os.getcwd()
+    os.chdir(str(tmp_path_factory.mktemp("app")))
+    try:
+        web_app = importlib.import_module("ImageAI-web-apps")
+    finally:
+        os.chdir(working_path)
+    web_app.app.config["TESTING"] = True
+    return web_app
+
+
+@pytest.fixture
+def client(web_app):
+    return web_app.app.test_client()
+
+
+def cv2_encode_image():
+    import cv2
+    import numpy as np
+
+    return cv2.imencode(".png", np.zeros((32, 32, 3), np.uint8))[1].tobytes()
+
+
+def test_predict_images_without_algorithm(client):
+    response = client.post(
+        "/image-prediction.html",
+        data={"images": (io.BytesIO(b"image"), "image.png")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 400
+    assert b"No algorithm selected" in response.data
+
+
+def test_predict_images_keeps_uploads_with_the_same_name(
+    client, web_app, monkeypatch
+):
+    pytest.importorskip("torch")
+    pytest.importorskip("imageai")
+    from image_recognizer import ImageRecognizer
+
+    monkeypatch.setattr(
+        ImageRecognizer, "load_model",
+        classmethod(lambda cls, *args, **kwargs: None),
+    )
+    monkeypatch.setattr(
+        ImageRecognizer, "predict_streams",
+        lambda self, images, image_names=None, **kwargs: [
+            self.format_predictions(image_name, ["cat"], [50.0])
+            for image_name in image_names
+        ],
+    )
+    names = ["cat.png", "cat.png", "\u732b.png", "\u72ac.png"]
+    response = client.post(
+        "/image-prediction.html",
+        data={
+            "images": [
+                (io.BytesIO(str(i).encode()), name)
+                for i, name in enumerate(names)
+            ],
+            "algorithm": "ResNet50",
+        },
+        content_type="multipart/form-data",
+    )
+
+    assert response.status_code == 200
+    work_path = [
+        os.path.join(web_app.FILES_PATH, name)
+        for name in os.listdir(web_app.FILES_PATH)
+        if name.encode() in response.data
+    ][0]
+    # Each upload is saved under its own name
+    saved = {
+        name: open(os.path.join(work_path, name), "rb").read()
+        for name in os.listdir(work_path)
+    }
+    assert saved == {
+        "cat.png": b"0", "1_cat.png": b"1", "png": b"2", "3_png": b"3",
+    }
+
+
+@pytest.mark.parametrize("n", ["five", None, [5]])
+def test_classify_api_rejects_invalid_n(client, n):
+    response = client.post("/api/v1/classify", json={"images": [], "n": n})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_api_rejects_invalid_base64(client):
+    response = client.post(
+        "/api/v1/classify", json={"images": ["not base64!"]}
+    )
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "File 0 is not valid base64"}
+
+
+@pytest.fixture
+def stub_detector(monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("imageai")
+    from video_object_detector import VideoObjectDetector
+    from video_functions import StubVideoDetector
+
+    monkeypatch.setattr(
+        VideoObjectDetector, "load_model",
+        staticmethod(lambda *args: StubVideoDetector()),
+    )
+
+
+@pytest.mark.usefixtures("stub_detector")
+def test_detect_api_streams_images_as_ndjson(client):
+    image = cv2_encode_image()
+    response = client.post(
+        "/api/v1/detect",
+        json={"images": [
+            {"name": "a.png", "data": base64.b64encode(image).decode()},
+            "data:image/png;base64," + base64.b64encode(image).decode(),
+        ]},
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.mimetype == "application/x-ndjson"
+    lines = [
+        json.loads(line)
+        for line in response.get_data(as_text=True).splitlines()
+    ]
+    assert [line["image"] for line in lines] == ["a.png", "1"]
+    assert lines[0]["objects"][0]["label"] == "car"
+
+
+@pytest.mark.usefixtures("stub_detector")
+def test_detect_api_rejects_invalid_requests(client):
+    response = client.post("/api/v1/detect", json={"model": "YOLOv9"})
+    assert response.status_code == 400
+    response = client.post("/api/v1/detect", json={})
+    assert response.get_json() == {"error": "Send either one video or images"}
+
+
+@pytest.mark.usefixtures("stub_detector")
+@pytest.mark.parametrize("stream", ["0", "1"])
+def test_detect_api_removes_temporary_video(
+    client, monkeypatch, tmp_path, stream
+):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    video_path = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "files_for_testing", "traffic.mp4",
+    )
+    with open(video_path, "rb") as f:
+        data = f.read()
+
+    response = client.post(
+        "/api/v1/detect?stream=" + stream,
+        data={"video": (io.BytesIO(data), "traffic.mp4")},
+        content_type="multipart/form-data",
+        buffered=False,
+    )
+    assert response.status_code == 200
+    if stream == "0":
+        assert len(response.get_json()["frames"]) == 163
+    # A streaming client may disconnect before the first frame is sent
+    response.close()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_metrics_endpoint(client):
+    client.get("/cache/stats")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert "# TYPE imageai_requests_total counter" in text
+    assert 'endpoint="get_cache_stats"' in text
+    assert "# TYPE imageai_models_loaded gauge" in text
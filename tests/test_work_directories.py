@@ -0,0 +1,72 @@
+import os
+import time
+
+from work_directories import (
+    TEMP_SUFFIX,
+    Janitor,
+    create_work_dir,
+    get_dir_size,
+    publish_work_dir,
+)
+
+
+
+def make_dir(files_path, name, size=0, age=0):
+    path = os.path.join(files_path, name)
+    os.makedirs(path)
+    with open(os.path.join(path, "file"), "wb") as f:
+        f.write(b"0" * size)
+    modified_time = time.time() - age
+    os.utime(os.path.join(path, "file"), (modified_time, modified_time))
+    os.utime(path, (modified_time, modified_time))
+    return path
+
+
+def test_work_dirs_are_published_atomically(tmp_path):
+    files_path = str(tmp_path / "files")
+    work_id, work_path = create_work_dir(files_path)
+    other_id, _ = create_work_dir(files_path)
+    assert work_id != other_id
+    assert work_path == os.path.join(files_path, work_id + TEMP_SUFFIX)
+
+    with open(os.path.join(work_path, "result.csv"), "w") as f:
+        f.write("data")
+    published_path = publish_work_dir(work_path)
+    assert published_path == os.path.join(files_path, work_id)
+    assert os.listdir(published_path) == ["result.csv"]
+    assert get_dir_size(published_path) == 4
+
+
+def test_janitor_deletes_old_dirs(tmp_path):
+    files_path = str(tmp_path)
+    make_dir(files_path, "old", age=100)
+    make_dir(files_path, "old-unpublished" + TEMP_SUFFIX, age=100)
+    make_dir(files_path, "new")
+    make_dir(files_path, "new-unpublished" + TEMP_SUFFIX)
+
+    Janitor(files_path, max_age=50).clean_up()
+    assert sorted(os.listdir(files_path)) == [
+        "new", "new-unpublished" + TEMP_SUFFIX,
+    ]
+
+
+def test_janitor_caps_the_size_of_published_dirs(tmp_path):
+    files_path = str(tmp_path)
+    make_dir(files_path, "oldest", size=40, age=30)
+    make_dir(files_path, "older", size=40, age=20)
+    make_dir(files_path, "newest", size=40, age=10)
+    # Unpublished directories are still in use and never deleted by size
+    make_dir(files_path, "unpublished" + TEMP_SUFFIX, size=40)
+
+    Janitor(files_path, max_age=3600, max_size=80).clean_up()
+    assert sorted(os.listdir(files_path)) == [
+        "newest", "older", "unpublished" + TEMP_SUFFIX,
+    ]
+
+
+def test_janitor_thread_stops(tmp_path):
+    janitor = Janitor(str(tmp_path / "missing"), interval=0.01)
+    janitor.start()
+    janitor.stop()
+    janitor.join(timeout=5)
+    assert not janitor.is_alive()
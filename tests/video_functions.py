@@ -0,0 +1,32 @@
+import video_engine
+
+
+
+class StubImageDetector:
+    """Stub of ImageAI's ObjectDetection detecting one car per frame, with
+    the brightness of the frame as probability so that the detections
+    differ between frames.
+    """
+
+    def detectObjectsFromImage(self, input_image, output_type="array",
+                               minimum_percentage_probability=30):
+        return input_image, [{
+            "name": "car",
+            "percentage_probability": round(
+                float(input_image.mean()) / 2.55, 2
+            ),
+            "box_points": [10, 10, 50, 50],
+        }]
+
+
+
+class StubVideoDetector:
+    """Stub of ImageAI's VideoObjectDetection wrapping StubImageDetector."""
+
+    def __init__(self):
+        self._VideoObjectDetection__detector = StubImageDetector()
+
+
+def init_stub_worker():
+    # Stands in for init_segment_worker() without loading a model
+    video_engine._worker_detector = StubVideoDetector()
@@ -0,0 +1,920 @@
+import os
+import re
+import cv2
+import copy
+import math
+import shutil
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+import multiprocessing.util
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+
+# Modes deciding on which frames the detector is run
+SAMPLING_MODES = ["all", "stride", "fps", "adaptive"]
+
+# Color (BGR) and thickness of the boxes drawn around the detected objects
+BOX_COLOR = (218, 137, 114)
+BOX_THICKNESS = 2
+
+
+def get_image_detector(video_detector):
+    """Function to get the ObjectDetection model wrapped by a loaded
+    VideoObjectDetection object, so that single frames can be passed to it.
+    Args:
+    - video_detector: The loaded VideoObjectDetection object.
+    Returns:
+    - image_detector: The ObjectDetection object sharing the loaded model.
+    """
+    return video_detector._VideoObjectDetection__detector
+
+
+def count_objects(output_array):
+    """Function to count the detected objects of a frame by name.
+    Args:
+    - output_array: List of the objects detected in the frame.
+    Returns:
+    - output_count: Dictionary of the count of each object in the frame.
+    """
+    output_count = {}
+    for object in output_array:
+        output_count[object["name"]] = output_count.get(object["name"], 0) + 1
+    return output_count
+
+
+def draw_detections(frame, output_array):
+    """Function to draw the boxes and labels of the detected objects on a
+    frame, in place.
+    Args:
+    - frame: The BGR frame as a NumPy array.
+    - output_array: List of the objects detected in the frame.
+    """
+    for object in output_array:
+        x1, y1, x2, y2 = [int(value) for value in object["box_points"]]
+        cv2.rectangle(frame, (x1, y1), (x2, y2), BOX_COLOR, BOX_THICKNESS)
+        label = "{} : {:.2f}".format(
+            object["name"], object["percentage_probability"]
+        )
+        cv2.putText(
+            frame, label, (x1, max(y1 - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX,
+            0.5, BOX_COLOR, 1, cv2.LINE_AA,
+        )
+
+
+
+class FrameSampler:
+    """Sampler deciding which frames of a video the detector is run on.
+    - "all": Every frame is inferred.
+    - "stride": One frame out of `stride` is inferred.
+    - "fps": Frames are inferred at `analysis_fps`, whatever the frame rate
+    of the source video.
+    - "adaptive": A frame is inferred when it differs enough from the last
+    inferred frame, measured by the mean absolute difference of small
+    grayscale thumbnails.
+    The detections of the last inferred frame are carried forward to the
+    skipped frames.
+    """
+
+    def __init__(
+        self,
+        mode="all",
+        stride=1,
+        source_fps=None,
+        analysis_fps=None,
+        difference_threshold=8.0,
+        thumbnail_width=64,
+        max_skip=None,
+    ):
+        """Initialize the FrameSampler object.
+        Args:
+        - mode: The sampling mode ("all", "stride", "fps" or "adaptive").
+        - stride: The number of frames between two inferred frames in
+        "stride" mode.
+        - source_fps: The frame rate of the source video, used in "fps"
+        mode.
+        - analysis_fps: The number of frames inferred per second of video in
+        "fps" mode.
+        - difference_threshold: The mean absolute difference, from 0 to 255,
+        between the thumbnails of a frame and of the last inferred frame
+        above which the frame is inferred in "adaptive" mode.
+        - thumbnail_width: The width of the grayscale thumbnails compared in
+        "adaptive" mode.
+        - max_skip: The maximum number of consecutive skipped frames (None
+        for no limit).
+        """
+        if mode not in SAMPLING_MODES:
+            raise ValueError("Unknown sampling mode: {}".format(mode))
+        if mode == "fps" and not (source_fps and analysis_fps):
+            raise ValueError(
+                "The fps sampling mode requires source_fps and analysis_fps"
+            )
+        self.mode = mode
+        self.stride = max(1, int(stride))
+        self.source_fps = source_fps
+        self.analysis_fps = analysis_fps
+        self.difference_threshold = difference_threshold
+        self.thumbnail_width = thumbnail_width
+        self.max_skip = max_skip
+
+        # Thumbnail of the last inferred frame in adaptive mode
+        self._reference = None
+        # Number of frames skipped since the last inferred frame
+        self._skipped = 0
+
+        # Number of frames seen and inferred
+        self.frames_total = 0
+        self.frames_inferred = 0
+
+
+    def get_thumbnail(self, frame):
+        """Get the small grayscale thumbnail of a frame compared in adaptive
+        mode.
+        Args:
+        - frame: The BGR frame as a NumPy array.
+        Returns:
+        - thumbnail: The grayscale thumbnail as an int16 NumPy array.
+        """
+        height, width = frame.shape[:2]
+        thumbnail = cv2.resize(
+            frame,
+            (
+                self.thumbnail_width,
+                max(1, round(height * self.thumbnail_width / width)),
+            ),
+            interpolation=cv2.INTER_AREA,
+        )
+        return cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+
+    def should_infer(self, frame_index, frame=None, force=False):
+        """Decide whether the detector is run on a frame. Must be called on
+        every frame, in order.
+        Args:
+        - frame_index: The index of the frame, starting at 0.
+        - frame: The BGR frame as a NumPy array, required in adaptive mode.
+        - force: If True, the frame is inferred whatever the mode, e.g. on
+        the first frame of a segment.
+        Returns:
+        - infer: True if the frame must be inferred, False if the detections
+        of the last inferred frame are carried forward.
+        """
+        self.frames_total += 1
+        thumbnail = None
+
+        if force or frame_index == 0 or self.mode == "all":
+            infer = True
+        elif self.mode == "stride":
+            infer = frame_index % self.stride == 0
+        elif self.mode == "fps":
+            # Infer the first frame of each analysis period
+            infer = (
+                frame_index * self.analysis_fps // self.source_fps
+                != (frame_index - 1) * self.analysis_fps // self.source_fps
+            )
+        else:
+            thumbnail = self.get_thumbnail(frame)
+            infer = (
+                np.abs(thumbnail - self._reference).mean()
+                > self.difference_threshold
+            )
+
+        if not infer and self.max_skip is not None:
+            infer = self._skipped >= self.max_skip
+
+        if infer:
+            self.frames_inferred += 1
+            self._skipped = 0
+            if self.mode == "adaptive":
+                self._reference = (
+                    thumbnail if thumbnail is not None
+                    else self.get_thumbnail(frame)
+                )
+        else:
+            self._skipped += 1
+        return infer
+
+
+
+def iterate_detections(
+    image_detector, video, sampler, minimum_percentage_probability=30,
+    frame_count=None, start_index=0, restored_arrays=None,
+):
+    """Generator reading the frames of a video and detecting their objects
+    on the frames chosen by a FrameSampler, carrying the detections of the
+    last inferred frame forward to the skipped frames. The detections of the
+    first frames can be restored from a checkpoint, in which case these
+    frames are still read and sampled, but not inferred again.
+    Args:
+    - image_detector: The loaded ObjectDetection object.
+    - video: The opened cv2.VideoCapture, positioned on the first frame to
+    read.
+    - sampler: The FrameSampler choosing the inferred frames.
+    - minimum_percentage_probability: The minimum probability, in percent,
+    of the detected objects.
+    - frame_count: The number of frames to read (None to read the video to
+    the end).
+    - start_index: The index of the first frame read in the video.
+    - restored_arrays: The lists of the objects detected in the first
+    frames read, restored from a checkpoint (None if there are none).
+    Yields:
+    - frame: The BGR frame as a NumPy array.
+    - output_array: List of the objects detected in the frame.
+    - output_count: Dictionary of the count of each object in the frame.
+    """
+    restored_arrays = restored_arrays or []
+    # Detections of the last inferred frame
+    output_array = []
+    frame_index = start_index
+    while frame_count is None or frame_index < start_index + frame_count:
+        ret, frame = video.read()
+        if not ret:
+            break
+
+        # The first frame read has no detections to carry forward. ...
+        # ...Restored frames are sampled too, so that the sampler is in ...
+        # ...the same state as if they had been inferred.
+        infer = sampler.should_infer(
+            frame_index, frame, force=frame_index == start_index
+        )
+        if frame_index - start_index < len(restored_arrays):
+            output_array = restored_arrays[frame_index - start_index]
+        elif infer:
+            _, output_array = image_detector.detectObjectsFromImage(
+                input_image=frame,
+                output_type="array",
+                minimum_percentage_probability=minimum_percentage_probability,
+            )
+        yield frame, output_array, count_objects(output_array)
+        frame_index += 1
+
+
+def format_objects(output_array):
+    """Function to convert the objects detected in a frame or image to
+    JSON-serializable dictionaries.
+    Args:
+    - output_array: List of the objects detected by ImageAI.
+    Returns:
+    - objects: A list of dictionaries of the label, probability (in
+    percent) and box points (x1, y1, x2, y2) of each object.
+    """
+    return [
+        {
+            "label": object["name"],
+            "probability": round(float(object["percentage_probability"]), 2),
+            "box_points": [int(value) for value in object["box_points"]],
+        }
+        for object in output_array
+    ]
+
+
+def iterate_image_detections(image_detector, images,
+                             minimum_percentage_probability=30):
+    """Generator detecting the objects of encoded images, one after the
+    other, without writing them to disk.
+    Args:
+    - image_detector: The loaded ObjectDetection object.
+    - images: A list of the bytes of encoded images (JPEG, PNG...).
+    - minimum_percentage_probability: The minimum probability, in percent,
+    of the detected objects.
+    Yields:
+    - output_array: List of the objects detected in the image.
+    """
+    for data in images:
+        image = cv2.imdecode(
+            np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR
+        )
+        if image is None:
+            raise ValueError("The image could not be decoded")
+        _, output_array = image_detector.detectObjectsFromImage(
+            input_image=image,
+            output_type="array",
+            minimum_percentage_probability=minimum_percentage_probability,
+        )
+        yield output_array
+
+
+def iterate_frame_detections(image_detector, input_file_path, sampler,
+                             minimum_percentage_probability=30):
+    """Generator detecting the objects of the frames of a video chosen by a
+    FrameSampler, without drawing or writing an output video.
+    Args:
+    - image_detector: The loaded ObjectDetection object.
+    - input_file_path: The path to the input video.
+    - sampler: The FrameSampler choosing the inferred frames.
+    - minimum_percentage_probability: The minimum probability, in percent,
+    of the detected objects.
+    Yields:
+    - frame_index: The index of the frame, starting at 0.
+    - output_array: List of the objects detected in the frame.
+    - output_count: Dictionary of the count of each object in the frame.
+    """
+    video = cv2.VideoCapture(input_file_path)
+    if not video.isOpened():
+        raise ValueError("The video could not be decoded")
+    try:
+        for frame_index, (_, output_array, output_count) in enumerate(
+            iterate_detections(
+                image_detector, video, sampler,
+                minimum_percentage_probability,
+            )
+        ):
+            yield frame_index, output_array, output_count
+    finally:
+        video.release()
+
+
+def detect_objects_sampled(
+    detector,
+    input_file_path,
+    output_file_path,
+    frames_per_second,
+    sampler,
+    per_frame_function=None,
+    video_complete_function=None,
+    minimum_percentage_probability=30,
+    return_detected_frame=False,
+    restored_arrays=None,
+    tracker=None,
+):
+    """Function to detect the objects of a video on the frames chosen by a
+    FrameSampler, as a replacement of VideoObjectDetection's
+    detectObjectsFromVideo() with the same callbacks. Every frame is still
+    reported and written to the output video, with the detections of the
+    last inferred frame carried forward to the skipped frames, and with the
+    detections restored from a checkpoint on the first frames.
+    Args:
+    - detector: The loaded VideoObjectDetection object.
+    - input_file_path: The path to the input video.
+    - output_file_path: The path to the output video, without extension.
+    - frames_per_second: Number of frames per second of the output video.
+    - sampler: The FrameSampler choosing the inferred frames.
+    - per_frame_function: A function called after each frame with the
+    frame number, the detected objects and their counts, and the annotated
+    frame if `return_detected_frame` is True.
+    - video_complete_function: A function called at the end with the
+    detected objects and counts of all frames and the average counts.
+    - minimum_percentage_probability: The minimum probability, in percent,
+    of the detected objects.
+    - return_detected_frame: If True, the annotated frame is passed to
+    `per_frame_function`.
+    - restored_arrays: The lists of the objects detected in the first
+    frames of the video, restored from a checkpoint (None if there are
+    none).
+    - tracker: An optional ObjectTracker following the detected objects.
+    Returns:
+    - output_video_path: The path to the output video.
+    """
+    video = cv2.VideoCapture(input_file_path)
+    try:
+        return write_detections(
+            iterate_detections(
+                get_image_detector(detector), video, sampler,
+                minimum_percentage_probability,
+                restored_arrays=restored_arrays,
+            ),
+            output_file_path,
+            frames_per_second,
+            per_frame_function,
+            video_complete_function,
+            return_detected_frame,
+            tracker,
+        )
+    finally:
+        video.release()
+
+
+def write_detections(
+    detections,
+    output_file_path,
+    frames_per_second,
+    per_frame_function=None,
+    video_complete_function=None,
+    return_detected_frame=False,
+    tracker=None,
+    write_video=True,
+):
+    """Function to draw the detected objects on the frames, write them to
+    the output video and call the callbacks of detectObjectsFromVideo().
+    Args:
+    - detections: An iterable of (frame, output_array, output_count) in
+    frame order.
+    - output_file_path: The path to the output video, without extension.
+    - frames_per_second: Number of frames per second of the output video.
+    - per_frame_function: A function called after each frame with the
+    frame number, the detected objects and their counts, and the annotated
+    frame if `return_detected_frame` is True.
+    - video_complete_function: A function called at the end with the
+    detected objects and counts of all frames and the average counts.
+    - return_detected_frame: If True, the annotated frame is passed to
+    `per_frame_function`.
+    - tracker: An optional ObjectTracker assigning a `track_id` to the
+    detected objects and propagating their boxes to the skipped frames.
+    - write_video: If False, only the callbacks are called, e.g. with the
+    frames of an output video which is already annotated (or None).
+    Returns:
+    - output_video_path: The path to the output video.
+    """
+    output_video_path = output_file_path + ".mp4"
+    output_video = None
+    output_arrays = []
+    count_arrays = []
+    frame_number = 0
+    previous_array = None
+    try:
+        for frame, output_array, output_count in detections:
+            if tracker is not None:
+                # The engines carry the detections of the last inferred ...
+                # ...frame forward as the same list, so a frame with the ...
+                # ...list of the previous frame was not inferred
+                inferred = output_array is not previous_array
+                previous_array = output_array
+                output_array = tracker.track(
+                    frame_number, output_array, inferred
+                )
+                output_count = count_objects(output_array)
+            output_arrays.append(output_array)
+            count_arrays.append(output_count)
+
+            if write_video:
+                # Draw the detections on every frame, inferred or not, ...
+                # ...so that the boxes look the same throughout the video
+                draw_detections(frame, output_array)
+                if output_video is None:
+                    output_video = cv2.VideoWriter(
+                        output_video_path,
+                        cv2.VideoWriter_fourcc(*"mp4v"),
+                        frames_per_second,
+                        (frame.shape[1], frame.shape[0]),
+                    )
+                output_video.write(frame)
+
+            frame_number += 1
+            if per_frame_function is not None:
+                if return_detected_frame:
+                    per_frame_function(
+                        frame_number, output_array, output_count, frame
+                    )
+                else:
+                    per_frame_function(
+                        frame_number, output_array, output_count
+                    )
+    finally:
+        if output_video is not None:
+            output_video.release()
+
+    if video_complete_function is not None:
+        # Average count of each object across all frames
+        total_count = {}
+        for output_count in count_arrays:
+            for name, count in output_count.items():
+                total_count[name] = total_count.get(name, 0) + count
+        average_output_count = {
+            name: count / max(1, len(count_arrays))
+            for name, count in total_count.items()
+        }
+        video_complete_function(
+            output_arrays, count_arrays, average_output_count
+        )
+
+    return output_video_path
+
+
+
+# Minimum number of frames of the segments detected in parallel, so that ...
+# ...the forced inference of their first frame stays negligible
+MIN_SEGMENT_FRAMES = 250
+
+# Loaded detector of a worker process of the chunked engine
+_worker_detector = None
+
+# Worker pools of the chunked engine, one per model and number of workers, ...
+# ...kept alive so that each worker loads its model only once
+_segment_pools = {}
+_segment_pools_lock = threading.Lock()
+
+
+def init_segment_worker(execution_path, model, backend_options=None):
+    """Function run once in each worker process of the chunked engine to
+    load its own instance of the model.
+    Args:
+    - execution_path: The path where the models are saved.
+    - model: The selected model for object detection.
+    - backend_options: A dictionary of keyword arguments of
+    inference_backends.use_backend() (None to run the model with PyTorch).
+    """
+    global _worker_detector
+    from video_object_detector import VideoObjectDetector
+
+    _worker_detector = VideoObjectDetector.load_model(
+        execution_path, model, backend_options
+    )
+
+
+def get_segment_pool(execution_path, model, workers, backend_options=None):
+    """Function to get the pool of worker processes detecting the objects of
+    video segments with a model, creating it on first use.
+    Args:
+    - execution_path: The path where the models are saved.
+    - model: The selected model for object detection.
+    - workers: The number of worker processes.
+    - backend_options: A dictionary of keyword arguments of
+    inference_backends.use_backend() (None to run the model with PyTorch).
+    Returns:
+    - executor: The ProcessPoolExecutor of the workers.
+    """
+    key = (
+        execution_path, model, workers,
+        tuple(sorted((backend_options or {}).items())),
+    )
+    with _segment_pools_lock:
+        if key not in _segment_pools:
+            _segment_pools[key] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_segment_worker,
+                initargs=(execution_path, model, backend_options),
+            )
+        return _segment_pools[key]
+
+
+def shutdown_segment_pools():
+    """Function to stop the worker processes of the chunked engine, called
+    when the process using them exits.
+    """
+    with _segment_pools_lock:
+        executors = list(_segment_pools.values())
+        _segment_pools.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+
+
+# Stop the pools when the process exits, including the worker processes ...
+# ...of the job queue, which join their children before running the ...
+# ...atexit functions. The priority runs it before the finalizers of the ...
+# ...queues of the pools, which would otherwise drop the stop signals.
+multiprocessing.util.Finalize(None, shutdown_segment_pools, exitpriority=100)
+
+
+def get_ffmpeg_path():
+    """Function to get the path to the ffmpeg executable bundled with
+    imageio-ffmpeg.
+    Returns:
+    - ffmpeg_path: The path to ffmpeg, or None if imageio-ffmpeg is not
+    installed.
+    """
+    try:
+        import imageio_ffmpeg
+    except ImportError:
+        return None
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def get_keyframes(input_file_path):
+    """Function to get the indices of the keyframes of a video, by decoding
+    its keyframes only with ffmpeg.
+    Args:
+    - input_file_path: The path to the video.
+    Returns:
+    - keyframes: The sorted list of the indices of the keyframes, or None
+    if they can't be read.
+    """
+    ffmpeg_path = get_ffmpeg_path()
+    video = cv2.VideoCapture(input_file_path)
+    source_fps = video.get(cv2.CAP_PROP_FPS)
+    video.release()
+    if ffmpeg_path is None or not source_fps:
+        return None
+
+    completed = subprocess.run(
+        [
+            ffmpeg_path, "-hide_banner", "-nostdin", "-skip_frame", "nokey",
+            "-i", input_file_path, "-map", "0:v:0", "-vf", "showinfo",
+            "-f", "null", "-",
+        ],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    times = [
+        float(value)
+        for value in re.findall(r"pts_time:\s*(-?[0-9.]+)", completed.stderr)
+    ]
+    if completed.returncode != 0 or not times:
+        return None
+    # Index of each keyframe from its time since the first frame
+    return sorted(set(
+        int(round((time - times[0]) * source_fps)) for time in times
+    ))
+
+
+def get_segments(total_frames, segment_frames, keyframes=None):
+    """Function to split a video into consecutive segments of frames.
+    Args:
+    - total_frames: The number of frames of the video, 0 if unknown.
+    - segment_frames: The number of frames of each segment.
+    - keyframes: The indices of the keyframes of the video (None if
+    unknown). Each segment then starts on the keyframe closest to its
+    start, so that seeking to it decodes no frame of the previous segment.
+    Returns:
+    - segments: A list of (start_index, frame_count) tuples. The frame count
+    of the last segment is None so that it is read to the end of the video.
+    """
+    if total_frames <= 0:
+        return [(0, None)]
+    starts = list(range(0, total_frames, max(1, segment_frames)))
+    if keyframes:
+        starts = sorted(set([0] + [
+            min(keyframes, key=lambda keyframe: abs(keyframe - start))
+            for start in starts[1:]
+        ]))
+        starts = [start for start in starts if start < total_frames]
+    return [
+        (start, next_start - start)
+        for start, next_start in zip(starts, starts[1:])
+    ] + [(starts[-1], None)]
+
+
+def detect_segment(
+    input_file_path, start_index, frame_count, sampler,
+    minimum_percentage_probability=30, segment_file_path=None,
+    frames_per_second=None,
+):
+    """Function run in a worker process to detect the objects of a segment
+    of a video, and optionally write its annotated frames to a video file.
+    Args:
+    - input_file_path: The path to the input video.
+    - start_index: The index of the first frame of the segment.
+    - frame_count: The number of frames of the segment (None to read the
+    video to the end).
+    - sampler: A fresh FrameSampler choosing the inferred frames.
+    - minimum_percentage_probability: The minimum probability, in percent,
+    of the detected objects.
+    - segment_file_path: The path to the annotated video of the segment,
+    without extension (None to only detect the objects).
+    - frames_per_second: Number of frames per second of the annotated
+    video.
+    Returns:
+    - output_arrays: The lists of the objects detected in each frame.
+    - frames_inferred: The number of frames of the segment inferred.
+    - segment_video_path: The path to the annotated video of the segment,
+    or None.
+    """
+    video = cv2.VideoCapture(input_file_path)
+    video.set(cv2.CAP_PROP_POS_FRAMES, start_index)
+    try:
+        detections = iterate_detections(
+            get_image_detector(_worker_detector), video, sampler,
+            minimum_percentage_probability, frame_count, start_index,
+        )
+        if segment_file_path is None:
+            output_arrays = [
+                output_array for _, output_array, _ in detections
+            ]
+            segment_video_path = None
+        else:
+            # Draw and encode the frames of the segment in this worker
+            output_arrays = []
+            segment_video_path = write_detections(
+                detections,
+                segment_file_path,
+                frames_per_second,
+                lambda frame_number, output_array, output_count: (
+                    output_arrays.append(output_array)
+                ),
+            )
+    finally:
+        video.release()
+    return output_arrays, sampler.frames_inferred, segment_video_path
+
+
+def concatenate_videos(video_paths, output_video_path, frames_per_second):
+    """Function to concatenate videos of the same size and codec, without
+    re-encoding them if ffmpeg is available.
+    Args:
+    - video_paths: The paths to the videos, in order.
+    - output_video_path: The path to the concatenated video.
+    - frames_per_second: Number of frames per second of the videos.
+    """
+    ffmpeg_path = get_ffmpeg_path()
+    if ffmpeg_path is not None:
+        list_path = output_video_path + ".txt"
+        with open(list_path, "w") as f:
+            for video_path in video_paths:
+                f.write("file '{}'\n".format(
+                    os.path.abspath(video_path).replace("'", "'\\''")
+                ))
+        try:
+            subprocess.run(
+                [
+                    ffmpeg_path, "-hide_banner", "-nostdin", "-loglevel",
+                    "error", "-y", "-f", "concat", "-safe", "0", "-i",
+                    list_path, "-c", "copy", output_video_path,
+                ],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                check=True,
+            )
+        finally:
+            os.remove(list_path)
+        return
+
+    # Without ffmpeg, decode the annotated frames and encode them again
+    output_video = None
+    try:
+        for video_path in video_paths:
+            video = cv2.VideoCapture(video_path)
+            while True:
+                ret, frame = video.read()
+                if not ret:
+                    break
+                if output_video is None:
+                    output_video = cv2.VideoWriter(
+                        output_video_path,
+                        cv2.VideoWriter_fourcc(*"mp4v"),
+                        frames_per_second,
+                        (frame.shape[1], frame.shape[0]),
+                    )
+                output_video.write(frame)
+            video.release()
+    finally:
+        if output_video is not None:
+            output_video.release()
+
+
+def detect_objects_chunked(
+    execution_path,
+    model,
+    input_file_path,
+    output_file_path,
+    frames_per_second,
+    sampler,
+    workers,
+    segment_frames=None,
+    per_frame_function=None,
+    video_complete_function=None,
+    minimum_percentage_probability=30,
+    return_detected_frame=False,
+    backend_options=None,
+    tracker=None,
+    detected_frames=None,
+):
+    """Function to detect the objects of a video by splitting it into
+    segments, starting on keyframes, processed in parallel by a pool of
+    worker processes, each with its own instance of the model. Each worker
+    also draws the detections on the frames of its segment and encodes
+    them, and the annotated segments are concatenated into the output
+    video. The detections of the segments are merged back in frame order
+    with the same callbacks as detectObjectsFromVideo(). With a tracker,
+    which must see the frames in order, the frames are drawn and encoded
+    by the calling process instead.
+    Args:
+    - execution_path: The path where the models are saved.
+    - model: The selected model for object detection.
+    - input_file_path: The path to the input video.
+    - output_file_path: The path to the output video, without extension.
+    - frames_per_second: Number of frames per second of the output video.
+    - sampler: A fresh FrameSampler choosing the inferred frames, copied to
+    each segment, whose first frame is always inferred. Its counters are
+    updated with the totals of the segments.
+    - workers: The number of worker processes.
+    - segment_frames: The number of frames of each segment (None to split
+    the video into four segments per worker, of at least
+    MIN_SEGMENT_FRAMES frames).
+    - per_frame_function: A function called after each frame with the
+    frame number, the detected objects and their counts, and the annotated
+    frame if `return_detected_frame` is True.
+    - video_complete_function: A function called at the end with the
+    detected objects and counts of all frames and the average counts.
+    - minimum_percentage_probability: The minimum probability, in percent,
+    of the detected objects.
+    - return_detected_frame: If True, the annotated frame is passed to
+    `per_frame_function`.
+    - backend_options: A dictionary of keyword arguments of
+    inference_backends.use_backend() with which the workers run the model
+    (None to run it with PyTorch).
+    - tracker: An optional ObjectTracker following the detected objects
+    across the merged segments.
+    - detected_frames: The number of first frames whose annotated frame is
+    passed to `per_frame_function`, None being passed for the others
+    (None for all frames), so that the annotated segments are only
+    decoded as far as needed, e.g. for the preview.
+    Returns:
+    - output_video_path: The path to the output video.
+    """
+    video = cv2.VideoCapture(input_file_path)
+    total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    if segment_frames is None:
+        segment_frames = max(
+            MIN_SEGMENT_FRAMES, math.ceil(total_frames / (workers * 4))
+        )
+    segments = get_segments(
+        total_frames, segment_frames, get_keyframes(input_file_path)
+    )
+
+    # Annotated videos of the segments, written by the workers
+    segments_path = None
+    if tracker is None:
+        segments_path = tempfile.mkdtemp(
+            prefix="segments_",
+            dir=os.path.dirname(os.path.abspath(output_file_path)),
+        )
+
+    executor = get_segment_pool(
+        execution_path, model, workers, backend_options
+    )
+    futures = [
+        executor.submit(
+            detect_segment, input_file_path, start_index, frame_count,
+            copy.deepcopy(sampler), minimum_percentage_probability,
+            (
+                os.path.join(segments_path, "segment_{:05d}".format(i))
+                if segments_path is not None else None
+            ),
+            frames_per_second,
+        )
+        for i, (start_index, frame_count) in enumerate(segments)
+    ]
+    segment_video_paths = []
+
+    def merge_segments():
+        # Read the input video once more to draw the merged detections ...
+        # ...on its frames, segment by segment in order
+        video = cv2.VideoCapture(input_file_path)
+        try:
+            for future in futures:
+                output_arrays, frames_inferred, _ = future.result()
+                sampler.frames_total += len(output_arrays)
+                sampler.frames_inferred += frames_inferred
+                for output_array in output_arrays:
+                    ret, frame = video.read()
+                    if not ret:
+                        return
+                    yield frame, output_array, count_objects(output_array)
+        finally:
+            video.release()
+            # Drop the remaining segments if the merge failed
+            for future in futures:
+                future.cancel()
+
+    def merge_annotated_segments():
+        # Only decode the annotated frames passed to the callback
+        frame_number = 0
+        try:
+            for future in futures:
+                output_arrays, frames_inferred, segment_video_path = (
+                    future.result()
+                )
+                sampler.frames_total += len(output_arrays)
+                sampler.frames_inferred += frames_inferred
+                if segment_video_path is not None:
+                    segment_video_paths.append(segment_video_path)
+                segment_video = None
+                for output_array in output_arrays:
+                    frame = None
+                    if return_detected_frame and (
+                        detected_frames is None
+                        or frame_number < detected_frames
+                    ):
+                        if segment_video is None:
+                            segment_video = cv2.VideoCapture(
+                                segment_video_path
+                            )
+                        _, frame = segment_video.read()
+                    frame_number += 1
+                    yield frame, output_array, count_objects(output_array)
+                if segment_video is not None:
+                    segment_video.release()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    if tracker is not None:
+        return write_detections(
+            merge_segments(),
+            output_file_path,
+            frames_per_second,
+            per_frame_function,
+            video_complete_function,
+            return_detected_frame,
+            tracker,
+        )
+
+    try:
+        output_video_path = write_detections(
+            merge_annotated_segments(),
+            output_file_path,
+            frames_per_second,
+            per_frame_function,
+            video_complete_function,
+            return_detected_frame,
+            write_video=False,
+        )
+        concatenate_videos(
+            segment_video_paths, output_video_path, frames_per_second
+        )
+    finally:
+        shutil.rmtree(segments_path, ignore_errors=True)
+    return output_video_path
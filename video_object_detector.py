@@ -1,9 +1,31 @@
 from imageai.Detection import VideoObjectDetection
 import os
+import cv2
+import json
 import pandas as pd
-from datetime import timedelta, datetime, date
-import matplotlib.pyplot as plt
 import numpy as np
+from model_registry import MODEL_REGISTRY
+from result_cache import ResultCache
+from detection_stream import (
+    DetectionWriter,
+    format_frame_time,
+    format_frame_times,
+)
+from detection_summary import DetectionSummary
+from detection_checkpoint import DetectionCheckpoint
+from object_tracker import ObjectTracker
+from chart_renderer import add_value_labels, get_chart_renderer
+from preview_writer import PreviewWriter
+from video_engine import (
+    FrameSampler,
+    detect_objects_chunked,
+    detect_objects_sampled,
+    get_image_detector,
+)
+from video_pipeline import detect_objects_pipelined
+from metrics import METRICS
+from video_results import get_output_file_names
+from inference_backends import get_export_path, use_backend
 
 
 
@@ -14,6 +36,10 @@ class VideoObjectDetector:
         "TinyYOLOv3": "tiny-yolov3.pt",
     }
 
+    # Models which can be exported to TorchScript and ONNX. RetinaNet takes
+    # ...lists of images of any size and always runs with PyTorch.
+    EXPORTABLE_MODELS = ["YOLOv3", "TinyYOLOv3"]
+
     def __init__(
         self,
         execution_path,
@@ -21,6 +47,25 @@ class VideoObjectDetector:
         frames_per_second,
         videos_path,
         input_video_name,
+        progress_callback=None,
+        minimum_percentage_probability=30,
+        streaming=False,
+        stream_format="csv",
+        chart_format="png",
+        chart_cache_path=None,
+        preview_path=None,
+        preview_options=None,
+        sampling_mode="all",
+        sampling_options=None,
+        workers=1,
+        segment_frames=None,
+        engine="imageai",
+        pipeline_options=None,
+        backend_options=None,
+        checkpoint_interval=None,
+        resume=False,
+        tracking=False,
+        tracking_options=None,
     ):
         """Initialize the VideoObjectDetector object.
         Args:
@@ -29,31 +74,157 @@ class VideoObjectDetector:
         - frames_per_second: Number of frames per second in the video.
         - videos_path: The path to the folder containing the uploaded videos.
         - input_video_name: The name of the uploaded video file.
+        - progress_callback: A function called after each frame with the
+        number of processed frames and the total number of frames.
+        - minimum_percentage_probability: The minimum probability, in
+        percent, of the detected objects.
+        - streaming: If True, the detected objects are written to the data
+        file and summarized frame by frame as the video is processed, instead
+        of being collected into a DataFrame at the end.
+        - stream_format: The format of the data file in streaming mode
+        ("csv" or "parquet").
+        - chart_format: The image format of the summary bar charts ("png" or
+        "svg").
+        - chart_cache_path: The folder in which rendered charts are cached
+        (None to disable the cache).
+        - preview_path: The path to the animated preview of the output video
+        (".gif", ".webp" or ".mp4"), written from the annotated frames while
+        the video is processed (None to disable the preview).
+        - preview_options: A dictionary of keyword arguments of
+        PreviewWriter, e.g. {"frame_skip": 2, "scale": 0.5,
+        "max_duration": 30}.
+        - sampling_mode: The frames on which the detector is run ("all",
+        "stride", "fps" or "adaptive"). The detections of the last inferred
+        frame are carried forward to the skipped frames.
+        - sampling_options: A dictionary of keyword arguments of
+        FrameSampler, e.g. {"stride": 5}, {"analysis_fps": 2} or
+        {"difference_threshold": 8.0}.
+        - workers: The number of worker processes. With more than one, the
+        video is split into segments detected in parallel, each worker
+        process loading its own instance of the model.
+        - segment_frames: The number of frames of each segment in parallel
+        mode (None to split the video into four segments per worker, of at
+        least 250 frames).
+        - engine: The detection loop used with a single worker: "imageai"
+        for ImageAI's detectObjectsFromVideo(), or "pipelined" for separate
+        decode, preprocess, infer and encode stages joined by bounded
+        queues.
+        - pipeline_options: A dictionary of keyword arguments of the
+        pipelined engine, e.g. {"batch_size": 4, "queue_size": 16}.
+        - backend_options: A dictionary of keyword arguments of
+        inference_backends.use_backend(), e.g. {"backend": "onnxruntime",
+        "quantization": "dynamic", "intra_op_threads": 4} (None to run the
+        model with PyTorch).
+        - checkpoint_interval: The number of frames between two checkpoints
+        of the detected objects, saved in `videos_path` (None to disable
+        checkpoints).
+        - resume: If True, the detection resumes from the checkpoint of an
+        interrupted detection of the video with the same settings, if any.
+        The frames before the checkpoint are still read, to draw the output
+        video and preview, but not inferred again. A resumed detection
+        always runs in a single process.
+        - tracking: If True, the detected objects are followed across frames
+        by an ObjectTracker, which assigns them a `track_id`, propagates
+        their boxes to the frames skipped by the sampling mode, and counts
+        unique objects and their dwell times.
+        - tracking_options: A dictionary of keyword arguments of
+        ObjectTracker, e.g. {"iou_threshold": 0.3, "min_hits": 2}.
         """
         self.frames_per_second = frames_per_second
         self.videos_path = videos_path
         self.input_video_name = input_video_name
+        self.progress_callback = progress_callback
+        self.streaming = streaming
+        self.chart_format = chart_format
+        # Renderer of the summary bar charts shared by all requests
+        self.chart_renderer = get_chart_renderer(chart_cache_path)
+
+        # Summary of the detected objects per frame / second / minute / ...
+        # ...hour and over the full video
+        self.summary = DetectionSummary(self.frames_per_second)
+
+        # Follow the detected objects across frames
+        self.tracker = (
+            ObjectTracker(**(tracking_options or {})) if tracking else None
+        )
 
-        detector = VideoObjectDetection()
+        if self.streaming:
+            # Write the detected objects and update the summary as the ...
+            # ...frames arrive
+            self.writer = DetectionWriter(
+                self.get_data_path(stream_format),
+                output_format=stream_format,
+                track_ids=self.tracker is not None,
+            )
 
-        # Set the model type based on the selected model
-        if model == "RetinaNet":
-            detector.setModelTypeAsRetinaNet()
-        if model == "YOLOv3":
-            detector.setModelTypeAsYOLOv3()
-        if model == "TinyYOLOv3":
-            detector.setModelTypeAsTinyYOLOv3()
+        # Get the total number of frames in the video to report progress
+        video = cv2.VideoCapture(
+            os.path.join(self.videos_path, self.input_video_name)
+        )
+        self.total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        source_fps = video.get(cv2.CAP_PROP_FPS) or self.frames_per_second
+        video.release()
 
-        # Set the model path based on the execution path and selected model
-        detector.setModelPath(
-            os.path.join(execution_path, self.MODELS[model])
+        # Choose the frames on which the detector is run
+        self.sampler = FrameSampler(
+            sampling_mode, source_fps=source_fps, **(sampling_options or {})
         )
+        # Number of frames processed, inferred or not
+        self.frames_processed = 0
+        # Metrics of the stages of the pipelined engine
+        self.pipeline_metrics = None
+
+        # Save the detected objects periodically and restore those of an ...
+        # ...interrupted detection
+        self.checkpoint = None
+        restored_arrays = []
+        if checkpoint_interval:
+            self.checkpoint = DetectionCheckpoint(
+                self.videos_path,
+                {
+                    "model": model,
+                    "frames_per_second": self.frames_per_second,
+                    "minimum_percentage_probability": (
+                        minimum_percentage_probability
+                    ),
+                    "sampling_mode": sampling_mode,
+                    "sampling_options": sampling_options,
+                    "backend_options": backend_options,
+                    "tracking": tracking_options if tracking else None,
+                },
+                interval=checkpoint_interval,
+                # Save the tracks along with the frames
+                get_state=(
+                    self.tracker.to_dict if self.tracker is not None
+                    else None
+                ),
+            )
+            if resume:
+                restored_arrays = self.checkpoint.load()
+            else:
+                self.checkpoint.remove()
+            if restored_arrays and self.tracker is not None:
+                self.tracker.load_state(self.checkpoint.state)
+
+        # Get the loaded model shared by all requests, unless each worker ...
+        # ...process of the parallel mode loads its own
+        if workers <= 1 or restored_arrays:
+            detector = self.load_model(
+                execution_path, model, backend_options
+            )
 
-        # Load the model
-        detector.loadModel()
+        # Write the preview on a background thread, fed with the ...
+        # ...annotated frames of the detector
+        self.preview = None
+        if preview_path is not None:
+            self.preview = PreviewWriter(
+                preview_path, self.frames_per_second,
+                **(preview_options or {})
+            )
 
-        # Perform object detection and call forFull() function
-        detector.detectObjectsFromVideo(
+        # Perform object detection, calling forFrame() after each frame ...
+        # ...and forFull() at the end unless streaming
+        detection_kwargs = dict(
             input_file_path=os.path.join(self.videos_path,
                                          self.input_video_name),
             output_file_path=os.path.join(
@@ -61,11 +232,167 @@ class VideoObjectDetector:
                 self.input_video_name.split(".")[0] + "_detected",
             ),
             frames_per_second=self.frames_per_second,
-            video_complete_function=self.forFull,
-            minimum_percentage_probability=30,
+            per_frame_function=self.forFrame,
+            video_complete_function=None if self.streaming else self.forFull,
+            minimum_percentage_probability=minimum_percentage_probability,
+            return_detected_frame=self.preview is not None,
+        )
+        if self.tracker is not None:
+            detection_kwargs["tracker"] = self.tracker
+        detection_error = None
+        try:
+            # Time the detection loop, including the callbacks
+            with METRICS.timer("detection"):
+                if restored_arrays:
+                    # Redraw the restored frames and detect the others
+                    detect_objects_sampled(
+                        detector,
+                        sampler=self.sampler,
+                        restored_arrays=restored_arrays,
+                        **detection_kwargs
+                    )
+                elif workers > 1:
+                    # Detect the segments of the video in parallel
+                    detect_objects_chunked(
+                        execution_path,
+                        model,
+                        sampler=self.sampler,
+                        workers=workers,
+                        segment_frames=segment_frames,
+                        backend_options=backend_options,
+                        # Only decode the annotated frames of the preview
+                        detected_frames=(
+                            self.preview.max_frames
+                            if self.preview is not None else None
+                        ),
+                        **detection_kwargs
+                    )
+                elif engine == "pipelined":
+                    # Overlap decoding and encoding with the inference
+                    _, self.pipeline_metrics = detect_objects_pipelined(
+                        detector,
+                        sampler=self.sampler,
+                        **dict(detection_kwargs, **(pipeline_options or {}))
+                    )
+                elif sampling_mode == "all" and self.tracker is None:
+                    detector.detectObjectsFromVideo(**detection_kwargs)
+                else:
+                    # Run the detector on the sampled frames only, or on ...
+                    # ...all frames with the tracker
+                    detect_objects_sampled(
+                        detector, sampler=self.sampler, **detection_kwargs
+                    )
+            if self.checkpoint is not None:
+                # Save the last frames in case the outputs fail to be saved
+                self.checkpoint.save()
+        except BaseException as error:
+            detection_error = error
+            raise
+        finally:
+            if self.streaming:
+                self.writer.close()
+            if self.preview is not None:
+                # Time the wait for the last frames of the preview
+                with METRICS.timer("preview"):
+                    try:
+                        self.preview.close()
+                    except Exception:
+                        # Don't hide the error of the detection
+                        if detection_error is None:
+                            raise
+
+
+    @classmethod
+    def load_model(cls, execution_path, model, backend_options=None):
+        """Return the loaded detector for the selected model from the model
+        registry, loading it the first time it is requested.
+        Args:
+        - execution_path: The path where the models are saved.
+        - model: The selected model for object detection.
+        - backend_options: A dictionary of keyword arguments of
+        inference_backends.use_backend() (None to run the model with
+        PyTorch). Models which are not exportable run with PyTorch, with
+        the given numbers of threads.
+        Returns:
+        - detector: The loaded VideoObjectDetection object.
+        """
+        backend_options = dict(backend_options or {})
+        if model not in cls.EXPORTABLE_MODELS:
+            backend_options.update(backend="torch", quantization=None)
+        weights_path = os.path.join(execution_path, cls.MODELS[model])
+        # Each exported model is stored and sized under its own path
+        model_path = get_export_path(
+            weights_path,
+            backend_options.get("backend", "torch"),
+            backend_options.get("quantization"),
         )
 
+        def loader():
+            detector = VideoObjectDetection()
+
+            # Set the model type based on the selected model
+            if model == "RetinaNet":
+                detector.setModelTypeAsRetinaNet()
+            if model == "YOLOv3":
+                detector.setModelTypeAsYOLOv3()
+            if model == "TinyYOLOv3":
+                detector.setModelTypeAsTinyYOLOv3()
+
+            # Set the model path based on the execution path and selected model
+            detector.setModelPath(weights_path)
+
+            # Load the model
+            detector.loadModel()
+
+            # Run the model with the selected inference engine
+            use_backend(
+                get_image_detector(detector), "_ObjectDetection__model",
+                weights_path, **backend_options
+            )
+            return detector
+
+        return MODEL_REGISTRY.get(
+            (cls.__name__, model, model_path), loader, model_path
+        )
 
+
+    def forFrame(
+        self, frame_number, output_array, output_count, detected_frame=None
+    ):
+        """Process the objects detected in a frame and report the progress of
+        the detection.
+        The detected objects are added to the checkpoint, if enabled. In
+        streaming mode, they are also written to the data file and added to
+        the summary. The annotated frame is passed on to the
+        preview writer.
+        Args:
+        - frame_number: The number of the processed frame, starting at 1.
+        - output_array: List of the objects detected in the frame.
+        - output_count: Dictionary of the count of each object in the frame.
+        - detected_frame: The annotated frame, only given by ImageAI when the
+        preview is enabled.
+        """
+        self.frames_processed = frame_number
+
+        if self.checkpoint is not None:
+            self.checkpoint.add_frame(frame_number - 1, output_array)
+
+        if self.streaming:
+            frame_index = frame_number - 1
+            self.writer.write_frame(
+                format_frame_time(frame_index, self.frames_per_second),
+                output_array,
+            )
+            self.summary.add_frame(frame_index, output_array)
+
+        if self.preview is not None:
+            self.preview.add_frame(frame_number - 1, detected_frame)
+
+        if self.progress_callback is not None:
+            self.progress_callback(frame_number, self.total_frames)
+
+
+    @METRICS.timer("for_full")
     def forFull(self, output_arrays, count_arrays, average_output_count):
         """Process the output arrays and create a DataFrame with the detected
         objects.
@@ -77,185 +404,278 @@ class VideoObjectDetector:
         - average_output_count: Average count of unique objects across all
         frames.
         """
-        today = date.today()
-        current_frame = datetime(today.year, today.month, today.day, 0, 0, 0)
-        rows = []
+        objects = []
+        probabilities = []
+        track_ids = []
+        # Number of rows of each frame
+        rows_per_frame = []
 
-        for i in range(len(output_arrays)):
-            # Objects in each frame
-            objects_per_frame = output_arrays[i]
-            # Number of unique objects in each frame
-            objects_count = count_arrays[i]
+        for frame_index, objects_per_frame in enumerate(output_arrays):
+            # Add the objects of each frame to the summary
+            self.summary.add_frame(frame_index, objects_per_frame)
 
             # If any objects are detected in a frame
             if objects_per_frame:
-                for j in range(len(objects_per_frame)):
+                for object in objects_per_frame:
                     # For each unique object in each frame
-                    object = objects_per_frame[j]
-                    # Construct a row and append it to rows list
-                    rows.append(
-                        [
-                            current_frame.strftime("%H:%M:%S.%f"),
-                            object["name"],
-                            object["percentage_probability"] / 100,
-                        ]
+                    objects.append(object["name"])
+                    probabilities.append(
+                        object["percentage_probability"] / 100
                     )
+                    track_ids.append(object.get("track_id"))
+                rows_per_frame.append(len(objects_per_frame))
             # If no object is detected in a frame
             else:
-                # Construct a row and append it to rows list
-                rows.append(
-                    [current_frame.strftime("%H:%M:%S.%f"), None, None]
-                )
-
-            # Move on to the next frame
-            current_frame = current_frame + timedelta(
-                seconds=(1 / self.frames_per_second)
-            )
+                objects.append(None)
+                probabilities.append(np.nan)
+                track_ids.append(None)
+                rows_per_frame.append(1)
 
-        # Construct a dataframe with headers of 'frames', 'objects' and ...
-        # ...'probability'
+        # Construct a dataframe with headers of 'frames' (the index of ...
+        # ...the frame of each row), 'objects' and 'probability'
         self.df = pd.DataFrame(
-            rows,
-            columns=["frames", "objects", "probability"],
+            {
+                "frames": np.repeat(
+                    np.arange(len(output_arrays), dtype=np.int64),
+                    rows_per_frame,
+                ),
+                "objects": objects,
+                "probability": probabilities,
+            }
         )
+        if self.tracker is not None:
+            # Nullable integers, empty for the frames without objects
+            self.df["track_id"] = pd.array(track_ids, dtype="Int64")
+
+
+    def get_data_path(self, data_format="csv"):
+        """Get the path to the data file of the detected objects.
+        Args:
+        - data_format: The extension of the data file.
+        Returns:
+        - data_path: The path to the data file.
+        """
+        return os.path.join(
+            self.videos_path,
+            "objects_detected_" + self.input_video_name.split(".")[0]
+            + "." + data_format,
+        )
+
+
+    def get_sampling_report(self):
+        """Get the number of frames processed and actually inferred.
+        Returns:
+        - report: A dictionary of the sampling mode and the numbers of
+        frames.
+        """
+        return {
+            "mode": self.sampler.mode,
+            "frames_total": self.frames_processed,
+            "frames_inferred": (
+                self.frames_processed if self.sampler.mode == "all"
+                else self.sampler.frames_inferred
+            ),
+        }
 
 
+    @METRICS.timer("save_summary")
+    def save_summary(self):
+        """Save the summary of the detected objects, along with the sampling
+        report, the metrics of the pipelined engine and the unique counts
+        and dwell times of the tracked objects, as a JSON file.
+        Returns:
+        - summary_path: The path to the saved JSON file.
+        """
+        summary_path = os.path.join(self.videos_path, "summary.json")
+        with open(summary_path, "w") as f:
+            json.dump(
+                dict(
+                    self.summary.to_dict(),
+                    sampling=self.get_sampling_report(),
+                    pipeline=(
+                        self.pipeline_metrics.to_dict()
+                        if self.pipeline_metrics is not None else None
+                    ),
+                    tracking=(
+                        {
+                            "unique_counts": self.tracker.unique_counts(),
+                            "average_dwell_seconds": (
+                                self.tracker.average_dwell_seconds(
+                                    self.frames_per_second
+                                )
+                            ),
+                        }
+                        if self.tracker is not None else None
+                    ),
+                ),
+                f,
+            )
+
+        return summary_path
+
+
+    @METRICS.timer("save_csv")
     def save_csv(self):
-        """Save the DataFrame as a CSV file.
+        """Save the DataFrame as a CSV file. In streaming mode, the data file
+        was already written while the video was processed.
         Returns:
         - csv_path: The path to the saved CSV file.
         """
+        # In streaming mode, the data file is already complete
+        if self.streaming:
+            return self.writer.path
+
         # Path to CSV data file
-        csv_path = os.path.join(
-            self.videos_path,
-            "objects_detected_" + self.input_video_name.split(".")[0] + ".csv",
+        csv_path = self.get_data_path()
+        # Save the dataframe as CSV file, with the frames formatted as times
+        columns = ["frames", "objects", "probability"]
+        if self.tracker is not None:
+            columns.append("track_id")
+        df_csv = self.df[columns].copy()
+        df_csv["frames"] = format_frame_times(
+            df_csv["frames"].to_numpy(), self.frames_per_second
         )
-        # Save the dataframe as CSV file
-        self.df.to_csv(csv_path, index=False)
+        df_csv.to_csv(csv_path, index=False)
 
         # Return the CSV file path
         return csv_path
 
 
-    def plot_summary_graph(self, by_interval):
-        """Plot and format a summary graph of the detected objects
-        by frame / second / minute / hour / full video.
+    @METRICS.timer("save_tracks")
+    def save_tracks_csv(self):
+        """Save the tracked objects, with their first and last times in the
+        video and their dwell times, as a CSV file.
+        Returns:
+        - tracks_path: The path to the saved CSV file, or None without
+        tracking.
+        """
+        if self.tracker is None:
+            return None
+
+        tracks_path = os.path.join(
+            self.videos_path,
+            "tracks_" + self.input_video_name.split(".")[0] + ".csv",
+        )
+        df_tracks = pd.DataFrame(
+            self.tracker.get_tracks(self.frames_per_second),
+            columns=[
+                "track_id", "objects", "first_frame", "last_frame",
+                "dwell_seconds", "detections",
+            ],
+        )
+        # Format the first and last frames as times, like the data file
+        for column in ["first_frame", "last_frame"]:
+            df_tracks[column] = format_frame_times(
+                df_tracks[column].to_numpy(), self.frames_per_second
+            )
+        df_tracks.rename(
+            columns={"first_frame": "first_seen", "last_frame": "last_seen"},
+            inplace=True,
+        )
+        df_tracks.to_csv(tracks_path, index=False)
+
+        return tracks_path
+
+
+    def get_summary_counts(self, by_interval):
+        """Get the average number of unique objects per frame / second /
+        minute / hour, or the total number of unique objects in the full
+        video, from the summary.
         Args:
-        - by_interval: The time interval to group the data for plotting
-        (frame, second, minute, hour, full).
+        - by_interval: The time interval (frame, second, minute, hour, full),
+        or "tracks" for the number of tracked objects and "dwell" for their
+        average dwell time.
+        Returns:
+        - count_col: The name of the count column.
+        - df_count: A DataFrame of the objects and their counts, sorted in
+        descending order.
+        - chart_title: The title of the summary graph.
         """
-        # Calculate the number of unique objects in each ...
-        # ...frame/second/minute/hour
-        if by_interval != "full":
-            df_count = self.df.groupby(
-                [by_interval.lower() + "s", "objects"]
-            ).count()
-            df_count.reset_index(drop=False, inplace=True)
-            df_count.rename(
-                columns={"probability": "uniqueCounts"}, inplace=True
+        if by_interval == "tracks":
+            count_col = "uniqueTracks"
+            chart_title = "Number of Unique Tracked Objects In This Video"
+            counts = self.tracker.unique_counts()
+        elif by_interval == "dwell":
+            count_col = "averageDwellSeconds"
+            chart_title = "Average Dwell Time (Seconds) Per Tracked Object"
+            counts = self.tracker.average_dwell_seconds(
+                self.frames_per_second
             )
-            # Calculate the average number of unique objects per ...
-            # ...frame/second/minute/hour
+        elif by_interval != "full":
             count_col = "uniqueCountsPer" + by_interval.title()
-            df_count = (
-                df_count[["objects", "uniqueCounts"]]
-                .groupby("objects")
-                .mean()
-                .rename(columns={"uniqueCounts": count_col})
-            )
             chart_title = (
                 "Average Number of Unique Objects Per "
                 + by_interval.title()
             )
-        # Calculate the total number of unique objects across all frames
+        # Total number of unique objects across all frames
         else:
             count_col = "counts"
-            df_count = (
-                self.df[["objects", "probability"]]
-                .groupby("objects")
-                .count()
-                .rename(columns={"probability": count_col})
-            )
             chart_title = "Total Number of Unique Objects In This Video"
 
+        if by_interval not in ["tracks", "dwell"]:
+            counts = self.summary.averages(by_interval.lower())
+        df_count = pd.DataFrame(
+            {"objects": list(counts), count_col: list(counts.values())}
+        )
+
         # Sort df_count in descending order by count_col
         df_count.sort_values(count_col, ascending=False, inplace=True)
-        df_count.reset_index(drop=False, inplace=True)
+        df_count.reset_index(drop=True, inplace=True)
+
+        return count_col, df_count, chart_title
 
-        # Turn df_count into a bar chart
-        fig, ax = plt.subplots()
-        df_count.plot.bar(
-            x="objects", y=count_col, color="#7289DA", rot=0, ax=ax
+
+    def plot_summary_graph(self, by_interval):
+        """Plot and format a summary graph of the detected objects
+        by frame / second / minute / hour / full video.
+        Args:
+        - by_interval: The time interval to group the data for plotting
+        (frame, second, minute, hour, full).
+        """
+        # Get the counts of the objects from the summary
+        count_col, df_count, chart_title = self.get_summary_counts(
+            by_interval
         )
 
-        # Hide x axis title
-        ax.set(xlabel=None)
-        # Reset the range of y axis
-        ax.set_ylim(0, max(list(df_count[count_col])) * 1.3)
-        # Hide y axis
-        ax.axes.get_yaxis().set_visible(False)
-        # Format x ticks
-        plt.xticks(fontname="arial", color="white")
-        # Hide legend box
-        ax.legend().set_visible(False)
-        # Set the colors of the border lines
-        ax.spines["bottom"].set_color("white")
-        ax.spines["left"].set_color("#1e2b3a")
-        ax.spines["right"].set_color("#1e2b3a")
-        ax.spines["top"].set_color("#1e2b3a")
-        # Add graph title
-        plt.title(chart_title, fontname="arial", fontsize=14, color="white")
-        # Add value labels to the bars
-        self.add_value_labels(ax)
-
-        # Save the bar graph as a PNG image with a transparent background
-        fig.savefig(
+        # Render df_count as a bar chart with a transparent background
+        self.chart_renderer.render_bar_chart(
+            list(df_count["objects"]),
+            list(df_count[count_col]),
+            chart_title,
             os.path.join(
                 self.videos_path,
-                "summary_plot_{}.png".format(by_interval.lower()),
+                "summary_plot_{}.{}".format(
+                    by_interval.lower(), self.chart_format
+                ),
             ),
-            transparent=True,
         )
 
 
     def plot_summary_by_second(self):
         """Plot a summary graph by second.
         """
-        # Add a 'seconds' column to df
-        self.df["seconds"] = (
-            self.df["frames"].str.split(":").str[-1].str.split(".").str[0]
-        )
-        # Convert 'seconds' column to integer type
-        self.df["seconds"] = self.df["seconds"].astype("int32")
         # Plot summary graphy by second if the length of video exceeds 1 second
-        if max(list(self.df["seconds"])) > 0:
+        if self.summary.last_bucket("second") > 0:
             self.plot_summary_graph("second")
 
 
     def plot_summary_by_minute(self):
         """Plot a summary graph by minute.
         """
-        # Add a 'minutes' column to df
-        self.df["minutes"] = self.df["frames"].str.split(":").str[1]
-        # Convert 'minutes' column to integer type
-        self.df["minutes"] = self.df["minutes"].astype("int32")
         # Plot summary graphy by minutes if the length of video exceeds 1 minute
-        if max(list(self.df["minutes"])) > 0:
+        if self.summary.last_bucket("minute") > 0:
             self.plot_summary_graph("minute")
 
 
     def plot_summary_by_hour(self):
         """Plot a summary graph by hour.
         """
-        # Add an 'hours' column to df
-        self.df["hours"] = self.df["frames"].str.split(":").str[0]
-        # Convert 'hours' column to integer type
-        self.df["hours"] = self.df["hours"].astype("int32")
         # Plot summary graphy by hours if the length of video exceeds 1 hour
-        if max(list(self.df["hours"])) > 0:
+        if self.summary.last_bucket("hour") > 0:
             self.plot_summary_graph("hour")
 
 
+    @METRICS.timer("plot_summaries")
     def plot_summaries(self):
         """Plot summary graphs for different intervals.
         """
@@ -264,6 +684,9 @@ class VideoObjectDetector:
         self.plot_summary_by_minute()
         self.plot_summary_by_hour()
         self.plot_summary_graph("full")
+        if self.tracker is not None:
+            self.plot_summary_graph("tracks")
+            self.plot_summary_graph("dwell")
 
 
     def add_value_labels(self, ax, spacing=5):
@@ -273,36 +696,172 @@ class VideoObjectDetector:
         of the plot to annotate.
         - spacing (int): The distance between the labels and the bars.
         """
-        # For each bar: Place a label
-        for rect in ax.patches:
-            # Get X and Y placement of label from rect.
-            y_value = rect.get_height()
-            x_value = rect.get_x() + rect.get_width() / 2
-
-            # Number of points between bar and label. Change to your liking.
-            space = spacing
-            # Vertical alignment for positive values
-            va = "bottom"
-
-            # If value of bar is negative: Place label below bar
-            if y_value < 0:
-                # Invert space to place label below
-                space *= -1
-                # Vertically align label at top
-                va = "top"
-
-            # Use Y value as label and format number with one decimal place
-            label = "{:.1f}".format(y_value)
-
-            # Create annotation
-            ax.annotate(
-                label,
-                (x_value, y_value),    # Place labels at end of the bars
-                xytext=(0, space),    # Vertically shift label by `space`
-                textcoords="offset points",    # Interpret `xytext` as offset in points
-                ha="center",    # Horizontally center label
-                va=va,    # Vertically align label differently for positive and negative values.
-                color="white",    # Format the annotation text fonts
-                fontsize=14,
-                weight="bold",
-            )
+        add_value_labels(ax, spacing=spacing)
+
+
+
+@METRICS.timer("process_video")
+def process_video(
+    execution_path,
+    model,
+    frames_per_second,
+    videos_path,
+    input_video_name,
+    progress_callback=None,
+    minimum_percentage_probability=30,
+    streaming=True,
+    chart_format="png",
+    cache_path=None,
+    cache_key=None,
+    preview_format="gif",
+    preview_options=None,
+    sampling_mode="all",
+    sampling_options=None,
+    workers=1,
+    engine="imageai",
+    pipeline_options=None,
+    backend_options=None,
+    checkpoint_interval=None,
+    resume=True,
+    tracking=False,
+    tracking_options=None,
+):
+    """Function to run the full video object detection pipeline: detection,
+    CSV data, summary bar charts and animated preview of the output video.
+    Args:
+    - execution_path: The path where the models are saved.
+    - model: The selected model for object detection.
+    - frames_per_second: Number of frames per second in the video.
+    - videos_path: The path to the folder containing the uploaded video.
+    - input_video_name: The name of the uploaded video file.
+    - progress_callback: A function called after each frame with the number
+    of processed frames and the total number of frames.
+    - minimum_percentage_probability: The minimum probability, in percent,
+    of the detected objects.
+    - streaming: If True, the CSV data and summaries are produced frame by
+    frame as the video is processed, with bounded memory use.
+    - chart_format: The image format of the summary bar charts ("png" or
+    "svg").
+    - cache_path: The path to the on-disk tier of a ResultCache in which to
+    store the results and output files. Rendered summary bar charts are
+    also cached there.
+    - cache_key: The key under which to store the results in the cache.
+    - preview_format: The format of the animated preview of the output
+    video ("gif", "webp" or "mp4").
+    - preview_options: A dictionary of keyword arguments of PreviewWriter
+    (frame_skip, scale, max_duration).
+    - sampling_mode: The frames on which the detector is run ("all",
+    "stride", "fps" or "adaptive").
+    - sampling_options: A dictionary of keyword arguments of FrameSampler.
+    - workers: The number of worker processes detecting segments of the
+    video in parallel.
+    - engine: The detection loop used with a single worker ("imageai" or
+    "pipelined").
+    - pipeline_options: A dictionary of keyword arguments of the pipelined
+    engine (batch_size, queue_size).
+    - backend_options: A dictionary of keyword arguments of
+    inference_backends.use_backend() (backend, quantization,
+    intra_op_threads, inter_op_threads).
+    - checkpoint_interval: The number of frames between two checkpoints of
+    the detected objects (None to disable checkpoints).
+    - resume: If True, a job run again after its worker died resumes the
+    detection from its last checkpoint.
+    - tracking: If True, the detected objects are tracked across frames,
+    adding their track IDs to the CSV data, and a CSV file and summary bar
+    charts of the unique tracked objects and their dwell times.
+    - tracking_options: A dictionary of keyword arguments of ObjectTracker
+    (iou_threshold, max_misses, min_hits, smoothing).
+    Returns:
+    - results: A dictionary of the names of the output files inside
+    videos_path and of the numbers of frames processed and inferred, as
+    expected by the video-object-detection.html template.
+    """
+    output_video_name = (
+        input_video_name.split(".")[0]
+        + "_detected."
+        + input_video_name.split(".")[-1]
+    )
+    output_video_gif = (
+        input_video_name.split(".")[0] + "_detected." + preview_format
+    )
+
+    # Create an instance of VideoObjectDetector
+    object_detector = VideoObjectDetector(
+        execution_path,
+        model,
+        frames_per_second,
+        videos_path,
+        input_video_name,
+        progress_callback=progress_callback,
+        minimum_percentage_probability=minimum_percentage_probability,
+        streaming=streaming,
+        chart_format=chart_format,
+        chart_cache_path=cache_path,
+        preview_path=os.path.join(videos_path, output_video_gif),
+        preview_options=preview_options,
+        sampling_mode=sampling_mode,
+        sampling_options=sampling_options,
+        workers=workers,
+        engine=engine,
+        pipeline_options=pipeline_options,
+        backend_options=backend_options,
+        checkpoint_interval=checkpoint_interval,
+        resume=resume,
+        tracking=tracking,
+        tracking_options=tracking_options,
+    )
+    # Save the detected object data by frames as a CSV file
+    csv_path = object_detector.save_csv()
+    # Save the tracked objects as a CSV file
+    tracks_path = object_detector.save_tracks_csv()
+    # Plot summary bar charts
+    object_detector.plot_summaries()
+    # Save the summary data as a JSON file
+    summary_path = object_detector.save_summary()
+
+    results = {
+        "video_name": input_video_name,
+        "output_video_name": output_video_name,
+        # The preview is missing if it could not be written
+        "output_video_gif": (
+            output_video_gif
+            if os.path.exists(os.path.join(videos_path, output_video_gif))
+            else None
+        ),
+        "csv_file_name": os.path.basename(csv_path),
+        "summary_file_name": os.path.basename(summary_path),
+        "tracks_file_name": (
+            os.path.basename(tracks_path) if tracks_path else None
+        ),
+    }
+    # Report how many frames were actually inferred
+    sampling_report = object_detector.get_sampling_report()
+    results["frames_total"] = sampling_report["frames_total"]
+    results["frames_inferred"] = sampling_report["frames_inferred"]
+
+    # Check if the summary bar charts exist and assign their names, ...
+    # ...otherwise assign None
+    for interval in [
+        "frame", "second", "minute", "hour", "full", "tracks", "dwell",
+    ]:
+        plot_name = "summary_plot_{}.{}".format(interval, chart_format)
+        if os.path.exists(os.path.join(videos_path, plot_name)):
+            results[interval + "_plot"] = plot_name
+        else:
+            results[interval + "_plot"] = None
+
+    # Store the results and output files in the result cache
+    if cache_path is not None and cache_key is not None:
+        ResultCache(cache_path).put(
+            cache_key,
+            results,
+            files_path=videos_path,
+            file_names=get_output_file_names(results),
+        )
+
+    # The outputs are complete, so the detection won't be resumed
+    if object_detector.checkpoint is not None:
+        object_detector.checkpoint.remove()
+
+    return results
+
@@ -0,0 +1,473 @@
+import cv2
+import time
+import queue
+import threading
+from collections import OrderedDict
+from video_engine import count_objects, get_image_detector, write_detections
+
+
+
+# Stages of the video pipeline, in order
+STAGES = ["decode", "preprocess", "infer", "encode"]
+
+# Marker of the end of the frames in the queues of the pipeline
+END = None
+
+# Size of the input images of the YOLOv3 models, fixed by ImageAI
+YOLO_INPUT_SIZE = 416
+
+
+class PipelineMetrics:
+    """Throughput and queue depth metrics of the stages of a video
+    pipeline. The time of each stage is split between busy time and time
+    spent waiting on its input or output queue, so the bottleneck is the
+    stage with the highest utilization, with a full queue before it and an
+    empty queue after it.
+    """
+
+    def __init__(self):
+        """Initialize the PipelineMetrics object.
+        """
+        self._lock = threading.Lock()
+        self.started_at = time.perf_counter()
+        self.wall_seconds = None
+        self.stages = OrderedDict(
+            (stage, {"frames": 0, "seconds": 0.0, "wait_seconds": 0.0})
+            for stage in STAGES
+        )
+        self.queues = OrderedDict()
+
+
+    def add_frames(self, stage, frames=1):
+        """Count the frames processed by a stage.
+        Args:
+        - stage: The name of the stage.
+        - frames: The number of frames.
+        """
+        with self._lock:
+            self.stages[stage]["frames"] += frames
+
+
+    def add_time(self, stage, seconds, waiting=False):
+        """Add to the time spent by a stage.
+        Args:
+        - stage: The name of the stage.
+        - seconds: The time in seconds.
+        - waiting: True if the stage was waiting on a queue.
+        """
+        with self._lock:
+            self.stages[stage]["wait_seconds" if waiting else "seconds"] += (
+                seconds
+            )
+
+
+    def sample_queue(self, name, frames):
+        """Record the depth of a queue.
+        Args:
+        - name: The name of the queue.
+        - frames: The queue.
+        """
+        depth = frames.qsize()
+        with self._lock:
+            if name not in self.queues:
+                self.queues[name] = {
+                    "max_depth": 0, "total_depth": 0, "samples": 0,
+                    "capacity": frames.maxsize,
+                }
+            metrics = self.queues[name]
+            metrics["max_depth"] = max(metrics["max_depth"], depth)
+            metrics["total_depth"] += depth
+            metrics["samples"] += 1
+
+
+    def finish(self):
+        """Record the end of the pipeline.
+        """
+        self.wall_seconds = time.perf_counter() - self.started_at
+
+
+    def to_dict(self):
+        """Get the metrics of the pipeline.
+        Returns:
+        - metrics: A dictionary of the wall-clock time, the frames, busy
+        time, throughput and utilization of each stage, and the average and
+        maximum depth of each queue.
+        """
+        with self._lock:
+            wall_seconds = (
+                self.wall_seconds if self.wall_seconds is not None
+                else time.perf_counter() - self.started_at
+            )
+            stages = OrderedDict()
+            for stage, metrics in self.stages.items():
+                # Busy time excludes the time spent waiting on the queues
+                busy_seconds = max(
+                    0.0, metrics["seconds"] - metrics["wait_seconds"]
+                )
+                stages[stage] = {
+                    "frames": metrics["frames"],
+                    "busy_seconds": round(busy_seconds, 3),
+                    "wait_seconds": round(metrics["wait_seconds"], 3),
+                    "frames_per_second": round(
+                        metrics["frames"] / busy_seconds, 2
+                    ) if busy_seconds else None,
+                    "utilization": round(
+                        busy_seconds / wall_seconds, 3
+                    ) if wall_seconds else None,
+                }
+            queues = OrderedDict(
+                (
+                    name,
+                    {
+                        "capacity": metrics["capacity"],
+                        "max_depth": metrics["max_depth"],
+                        "average_depth": round(
+                            metrics["total_depth"] / metrics["samples"], 2
+                        ),
+                    },
+                )
+                for name, metrics in self.queues.items()
+            )
+            return {
+                "wall_seconds": round(wall_seconds, 3),
+                "stages": stages,
+                "queues": queues,
+            }
+
+
+
+def prepare_frame(image_detector, frame):
+    """Function to convert a frame into the input tensor of the detection
+    model, as ImageAI's ObjectDetection does for a single image.
+    Args:
+    - image_detector: The loaded ObjectDetection object.
+    - frame: The BGR frame as a NumPy array.
+    Returns:
+    - tensor: The input tensor of shape (3, H, W): the letterboxed frame of
+    416 x 416 pixels for the YOLOv3 models, and the full frame for
+    RetinaNet.
+    """
+    import torch
+
+    if image_detector._ObjectDetection__model_type == "retinanet":
+        # ImageAI reads the frame back from a temporary JPEG file, which ...
+        # ...is skipped here
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return torch.from_numpy(frame).permute(2, 0, 1).float().div(255.0)
+
+    from imageai.yolov3.utils import prepare_image
+
+    return prepare_image(frame, (YOLO_INPUT_SIZE, YOLO_INPUT_SIZE))[0]
+
+
+def infer_batch(image_detector, tensors, frame_sizes,
+                minimum_percentage_probability=30):
+    """Function to detect the objects of a micro-batch of frames with one
+    forward pass of the model, followed by the non-maximum suppression and
+    decoding of the boxes of each frame, as ImageAI's ObjectDetection does
+    for a single image.
+    Args:
+    - image_detector: The loaded ObjectDetection object.
+    - tensors: The list of the input tensors of the frames, as returned by
+    prepare_frame().
+    - frame_sizes: The list of the (width, height) of the frames.
+    - minimum_percentage_probability: The minimum probability, in percent,
+    of the detected objects.
+    Returns:
+    - output_arrays: The lists of the objects detected in each frame, in
+    the format of ImageAI's output arrays.
+    """
+    import torch
+
+    output_arrays = [[] for _ in tensors]
+    if not tensors:
+        return output_arrays
+
+    # ImageAI does not expose its model and settings publicly
+    model = image_detector._ObjectDetection__model
+    classes = image_detector._ObjectDetection__classes
+    device = image_detector._ObjectDetection__device
+    objectness_score = image_detector._ObjectDetection__objectness_score
+    minimum_probability = minimum_percentage_probability / 100
+
+    if image_detector._ObjectDetection__model_type == "retinanet":
+        # RetinaNet batches the frames of the list itself
+        with torch.no_grad():
+            output = model([tensor.to(device) for tensor in tensors])
+        for output_array, prediction in zip(output_arrays, output):
+            for label, score, box in zip(
+                prediction["labels"].tolist(),
+                prediction["scores"].tolist(),
+                prediction["boxes"].tolist(),
+            ):
+                if score >= objectness_score and score >= minimum_probability:
+                    output_array.append({
+                        "name": classes[label],
+                        "percentage_probability": round(score * 100, 2),
+                        "box_points": [int(value) for value in box],
+                    })
+        return output_arrays
+
+    from imageai.yolov3.utils import get_predictions
+
+    # Stack the letterboxed frames into one tensor
+    with torch.no_grad():
+        output = model(torch.stack(tensors).to(device))
+    # Rows of (frame index, x1, y1, x2, y2, objectness, probability, ...
+    # ...class index) of the boxes kept by the non-maximum suppression
+    output = get_predictions(
+        pred=output.to(device),
+        num_classes=len(classes),
+        nms_confidence_level=image_detector._ObjectDetection__nms_score,
+        objectness_confidence=objectness_score,
+        device=device,
+    )
+    if output is None:
+        return output_arrays
+
+    # Scale the boxes from the letterboxed input to the frame and clip ...
+    # ...them to the frame
+    sizes = torch.tensor(frame_sizes, dtype=torch.float32, device=device)[
+        output[:, 0].long()
+    ]
+    scaling_factor = torch.min(YOLO_INPUT_SIZE / sizes, 1)[0].view(-1, 1)
+    output[:, [1, 3]] -= (
+        YOLO_INPUT_SIZE - scaling_factor * sizes[:, 0].view(-1, 1)
+    ) / 2
+    output[:, [2, 4]] -= (
+        YOLO_INPUT_SIZE - scaling_factor * sizes[:, 1].view(-1, 1)
+    ) / 2
+    output[:, 1:5] /= scaling_factor
+    output[:, [1, 3]] = torch.min(
+        output[:, [1, 3]].clamp(min=0.0), sizes[:, 0].view(-1, 1)
+    )
+    output[:, [2, 4]] = torch.min(
+        output[:, [2, 4]].clamp(min=0.0), sizes[:, 1].view(-1, 1)
+    )
+
+    for prediction in output.tolist():
+        if prediction[-2] >= minimum_probability:
+            output_arrays[int(prediction[0])].append({
+                "name": classes[int(prediction[-1])],
+                "percentage_probability": round(prediction[-2] * 100, 2),
+                "box_points": [int(value) for value in prediction[1:5]],
+            })
+    return output_arrays
+
+
+def detect_objects_pipelined(
+    detector,
+    input_file_path,
+    output_file_path,
+    frames_per_second,
+    sampler,
+    per_frame_function=None,
+    video_complete_function=None,
+    minimum_percentage_probability=30,
+    return_detected_frame=False,
+    batch_size=4,
+    queue_size=16,
+    metrics=None,
+    tracker=None,
+):
+    """Function to detect the objects of a video with a pipeline of decode,
+    preprocess, infer and encode stages joined by bounded queues, with the
+    same callbacks as detectObjectsFromVideo(). Decoding, preprocessing
+    (frame sampling, resizing and conversion of the sampled frames into
+    input tensors) and encoding (drawing, writing the output video and
+    callbacks) run on their own threads, so that the inference stage,
+    running on the calling thread, never waits for I/O. The tensors are
+    stacked into micro-batches of up to `batch_size` frames, each inferred
+    in one forward pass.
+    Args:
+    - detector: The loaded VideoObjectDetection object.
+    - input_file_path: The path to the input video.
+    - output_file_path: The path to the output video, without extension.
+    - frames_per_second: Number of frames per second of the output video.
+    - sampler: The FrameSampler choosing the inferred frames.
+    - per_frame_function: A function called after each frame with the
+    frame number, the detected objects and their counts, and the annotated
+    frame if `return_detected_frame` is True.
+    - video_complete_function: A function called at the end with the
+    detected objects and counts of all frames and the average counts.
+    - minimum_percentage_probability: The minimum probability, in percent,
+    of the detected objects.
+    - return_detected_frame: If True, the annotated frame is passed to
+    `per_frame_function`.
+    - batch_size: The maximum number of frames inferred together.
+    - queue_size: The capacity of each queue between two stages.
+    - metrics: The PipelineMetrics recording the metrics of the stages
+    (None to create one).
+    - tracker: An optional ObjectTracker following the detected objects,
+    run by the encode stage.
+    Returns:
+    - output_video_path: The path to the output video.
+    - metrics: The PipelineMetrics of the run.
+    """
+    image_detector = get_image_detector(detector)
+    if metrics is None:
+        metrics = PipelineMetrics()
+
+    decoded = queue.Queue(maxsize=queue_size)
+    preprocessed = queue.Queue(maxsize=queue_size)
+    inferred = queue.Queue(maxsize=queue_size)
+    # Set when a stage fails, so that the others stop
+    stop = threading.Event()
+    errors = []
+    output_video_path = []
+
+    def put(stage, name, frames, item):
+        # Wait for room in the queue unless the pipeline is stopped
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        metrics.add_time(stage, time.perf_counter() - start, waiting=True)
+        metrics.sample_queue(name, frames)
+
+    def get(stage, frames):
+        # Wait for an item of the queue unless the pipeline is stopped
+        start = time.perf_counter()
+        try:
+            while not stop.is_set():
+                try:
+                    return frames.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return END
+        finally:
+            metrics.add_time(
+                stage, time.perf_counter() - start, waiting=True
+            )
+
+    def run_stage(stage, function):
+        # Run a stage, recording its time and stopping the pipeline if ...
+        # ...it fails
+        start = time.perf_counter()
+        try:
+            function()
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            metrics.add_time(stage, time.perf_counter() - start)
+
+    def decode():
+        video = cv2.VideoCapture(input_file_path)
+        try:
+            while not stop.is_set():
+                ret, frame = video.read()
+                if not ret:
+                    break
+                metrics.add_frames("decode")
+                put("decode", "decoded", decoded, frame)
+        finally:
+            video.release()
+            put("decode", "decoded", decoded, END)
+
+    def preprocess():
+        frame_index = 0
+        try:
+            while True:
+                frame = get("preprocess", decoded)
+                if frame is END:
+                    break
+                # Input tensor of the sampled frames, None for the others
+                tensor = (
+                    prepare_frame(image_detector, frame)
+                    if sampler.should_infer(frame_index, frame) else None
+                )
+                frame_index += 1
+                metrics.add_frames("preprocess")
+                put("preprocess", "preprocessed", preprocessed,
+                    (frame, tensor))
+        finally:
+            put("preprocess", "preprocessed", preprocessed, END)
+
+    def infer():
+        # Detections of the last inferred frame
+        output_array = []
+        done = False
+        try:
+            while not done:
+                # Wait for a frame, then take the frames already queued ...
+                # ...until the batch has `batch_size` frames to infer
+                batch = [get("infer", preprocessed)]
+                if batch[0] is END:
+                    break
+                while sum(
+                    1 for _, tensor in batch if tensor is not None
+                ) < batch_size:
+                    try:
+                        item = preprocessed.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is END:
+                        done = True
+                        break
+                    batch.append(item)
+
+                inferred_batch = [
+                    (frame, tensor) for frame, tensor in batch
+                    if tensor is not None
+                ]
+                output_arrays = iter(infer_batch(
+                    image_detector,
+                    [tensor for _, tensor in inferred_batch],
+                    [
+                        (frame.shape[1], frame.shape[0])
+                        for frame, _ in inferred_batch
+                    ],
+                    minimum_percentage_probability,
+                ))
+                for frame, tensor in batch:
+                    if tensor is not None:
+                        output_array = next(output_arrays)
+                    metrics.add_frames("infer")
+                    put("infer", "inferred", inferred,
+                        (frame, output_array, count_objects(output_array)))
+        finally:
+            put("infer", "inferred", inferred, END)
+
+    def iterate_inferred():
+        while True:
+            item = get("encode", inferred)
+            if item is END:
+                break
+            metrics.add_frames("encode")
+            yield item
+
+    def encode():
+        output_video_path.append(write_detections(
+            iterate_inferred(),
+            output_file_path,
+            frames_per_second,
+            per_frame_function,
+            video_complete_function,
+            return_detected_frame,
+            tracker,
+        ))
+
+    threads = [
+        threading.Thread(
+            target=run_stage, args=(stage, function), daemon=True
+        )
+        for stage, function in [
+            ("decode", decode), ("preprocess", preprocess),
+            ("encode", encode),
+        ]
+    ]
+    for thread in threads:
+        thread.start()
+    # Run the inference stage on the calling thread
+    run_stage("infer", infer)
+    for thread in threads:
+        thread.join()
+    metrics.finish()
+
+    if errors:
+        raise errors[0]
+    return output_video_path[0], metrics
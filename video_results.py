@@ -0,0 +1,27 @@
+# Keys of the results of process_video naming output files
+OUTPUT_FILE_KEYS = [
+    "output_video_name",
+    "output_video_gif",
+    "csv_file_name",
+    "summary_file_name",
+    "frame_plot",
+    "second_plot",
+    "minute_plot",
+    "hour_plot",
+    "full_plot",
+    "tracks_file_name",
+    "tracks_plot",
+    "dwell_plot",
+]
+
+
+def get_output_file_names(results):
+    """Function to get the names of the output files of process_video.
+    Args:
+    - results: The dictionary returned by process_video.
+    Returns:
+    - file_names: The list of the output file names.
+    """
+    return [
+        results[key] for key in OUTPUT_FILE_KEYS if results.get(key)
+    ]
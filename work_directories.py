@@ -0,0 +1,174 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+
+# Suffix of work directories that are still being written to
+TEMP_SUFFIX = ".tmp"
+
+
+def create_work_dir(files_path):
+    """Function to create a private work directory for one request inside the
+    files folder. The directory is hidden from other requests until it is
+    published.
+    Args:
+    - files_path: The path to the folder containing all work directories.
+    Returns:
+    - work_id: The unique ID of the work directory.
+    - work_path: The path to the new work directory.
+    """
+    os.makedirs(files_path, exist_ok=True)
+
+    work_id = uuid.uuid4().hex
+    work_path = os.path.join(files_path, work_id + TEMP_SUFFIX)
+    os.mkdir(work_path)
+
+    return work_id, work_path
+
+
+def publish_work_dir(work_path):
+    """Function to atomically publish a finished work directory under its
+    final name, so that it is never served half-written.
+    Args:
+    - work_path: The path to the work directory returned by create_work_dir.
+    Returns:
+    - published_path: The path to the published directory.
+    """
+    published_path = work_path[:-len(TEMP_SUFFIX)]
+    # Renaming a directory is atomic on the same file system
+    os.rename(work_path, published_path)
+
+    return published_path
+
+
+def remove_work_dir(work_path):
+    """Function to delete a work directory and everything inside it.
+    Args:
+    - work_path: The path to the work directory.
+    """
+    shutil.rmtree(work_path, ignore_errors=True)
+
+
+def get_last_modified_time(path):
+    """Function to get the last time a directory or any file inside it was
+    modified.
+    Args:
+    - path: The path to the directory.
+    Returns:
+    - modified_time: The last modification time as a Unix timestamp.
+    """
+    modified_time = os.path.getmtime(path)
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                modified_time = max(
+                    modified_time, os.path.getmtime(os.path.join(root, file))
+                )
+            except OSError:
+                # The file was deleted in the meantime
+                pass
+    return modified_time
+
+
+def get_dir_size(path):
+    """Function to get the total size of the files inside a directory.
+    Args:
+    - path: The path to the directory.
+    Returns:
+    - size: The total size in bytes.
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                size += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                # The file was deleted in the meantime
+                pass
+    return size
+
+
+
+class Janitor(threading.Thread):
+    """Background thread that periodically deletes old work directories
+    from the files folder, by age and by total size.
+    """
+
+    def __init__(self, files_path, max_age=3600, max_size=None, interval=60):
+        """Initialize the Janitor object.
+        Args:
+        - files_path: The path to the folder containing all work directories.
+        - max_age: The age in seconds after which a work directory is
+        deleted.
+        - max_size: The maximum total size in bytes of the published work
+        directories (None for no limit). The oldest directories are deleted
+        first.
+        - interval: The number of seconds between two clean-ups.
+        """
+        super().__init__(daemon=True)
+        self.files_path = files_path
+        self.max_age = max_age
+        self.max_size = max_size
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+
+    def run(self):
+        """Clean up the files folder every `interval` seconds until stopped.
+        """
+        while not self._stop_event.wait(self.interval):
+            self.clean_up()
+
+
+    def stop(self):
+        """Stop the janitor thread.
+        """
+        self._stop_event.set()
+
+
+    def clean_up(self):
+        """Delete the work directories that are too old, then the oldest
+        published directories until the total size is within the limit.
+        """
+        if not os.path.exists(self.files_path):
+            return
+
+        now = time.time()
+        published_dirs = []
+        for name in os.listdir(self.files_path):
+            path = os.path.join(self.files_path, name)
+            if not os.path.isdir(path):
+                continue
+            try:
+                # Unpublished directories may still be written to by a ...
+                # ...long-running request or job
+                if name.endswith(TEMP_SUFFIX):
+                    modified_time = get_last_modified_time(path)
+                else:
+                    modified_time = os.path.getmtime(path)
+            except OSError:
+                continue
+
+            # Delete directories older than max_age, including abandoned ...
+            # ...unpublished ones
+            if now - modified_time > self.max_age:
+                remove_work_dir(path)
+            # Unpublished directories are still in use by a request
+            elif not name.endswith(TEMP_SUFFIX):
+                published_dirs.append((modified_time, path))
+
+        if self.max_size is None:
+            return
+
+        # Delete the oldest published directories until the total size is ...
+        # ...within max_size
+        sizes = {path: get_dir_size(path) for _, path in published_dirs}
+        total_size = sum(sizes.values())
+        for _, path in sorted(published_dirs):
+            if total_size <= self.max_size:
+                break
+            remove_work_dir(path)
+            total_size -= sizes[path]